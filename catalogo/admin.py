@@ -1,22 +1,65 @@
 #catalogo/admin.py
 from django.contrib import admin
 from django.shortcuts import render # <-- NUEVA IMPORTACIÓN
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, HttpResponseBadRequest, HttpResponseRedirect, StreamingHttpResponse
+from django.urls import path, reverse
 from django import forms
-from .models import Categoria, Producto, Empleado
+from . import exportacion
+from .models import Categoria, Producto, Empleado, TrabajoImagen, marcar_modificados
+from .imagenes import borrar_variantes
+from .storage import recorrer_archivos
+from .tree import obtener_arbol
+from .trigrams import get_backend, reconstruir_indice
+from .versioning import incrementar_version_al_confirmar
 from import_export import resources
 from import_export.fields import Field
 from import_export.widgets import ForeignKeyWidget, Widget, ManyToManyWidget
 from import_export.admin import ImportExportModelAdmin
 from django.conf import settings
+import difflib
 import os
+from collections import defaultdict
+from django.db.models.fields.files import FieldFile
 from django.utils.text import slugify
+from django.utils import timezone
 
 # --- WIDGET PERSONALIZADO PARA MANEJAR IMÁGENES ---
 class ImageWidget(Widget):
     """
     Widget personalizado para importar imágenes.
     Espera recibir solo el nombre del archivo (ej: 'taladro.jpg') en la celda.
+
+    Durante una importación (`preparar_indice`) las rutas se validan contra un índice
+    en memoria de MEDIA_ROOT/productos_imagenes, sin distinguir mayúsculas, en lugar
+    de consultar el disco en cada fila.
     """
+    CARPETA = 'productos_imagenes'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.indice = None  # carpeta en minúsculas -> {nombre en minúsculas: ruta real}
+
+    def preparar_indice(self):
+        """Recorre una sola vez la carpeta de imágenes."""
+        self.indice = defaultdict(dict)
+        raiz = os.path.join(settings.MEDIA_ROOT, self.CARPETA)
+        if not os.path.isdir(raiz):
+            return
+        for entrada in recorrer_archivos(raiz):
+            ruta = os.path.relpath(entrada.path, settings.MEDIA_ROOT).replace('\\', '/')
+            carpeta, nombre = ruta.lower().rsplit('/', 1)
+            self.indice[carpeta][nombre] = ruta
+
+    def buscar_en_indice(self, relative_path):
+        """Devuelve la ruta real (o None) y, si no existe, la más parecida que sí existe."""
+        carpeta, _, nombre = relative_path.lower().rpartition('/')
+        archivos = self.indice.get(carpeta, {})
+        if nombre in archivos:
+            return archivos[nombre], None
+        parecidos = difflib.get_close_matches(nombre, archivos, n=1)
+        return None, archivos[parecidos[0]] if parecidos else None
+
     def clean(self, value, row=None, *args, **kwargs):
         if not value:
             return None  # Si la celda está vacía, no hacemos nada
@@ -30,6 +73,15 @@ class ImageWidget(Widget):
         slug_parts = [slugify(part) if '.' not in part else part for part in parts]
         relative_path = "/".join(slug_parts)
 
+        if self.indice is not None and relative_path.lower().startswith(self.CARPETA + '/'):
+            encontrada, sugerencia = self.buscar_en_indice(relative_path)
+            if encontrada:
+                return encontrada
+            mensaje = f"La imagen '{value}' no se encontró."
+            if sugerencia:
+                mensaje += f" ¿Quisiste decir '{sugerencia}'?"
+            raise ValueError(mensaje + " Súbela a la carpeta 'media/productos_imagenes/' antes de importar.")
+
         # Construimos la ruta completa para verificar que el archivo físico existe
         full_path = os.path.join(settings.MEDIA_ROOT, relative_path)
         
@@ -55,11 +107,59 @@ admin.site.register(Empleado, EmpleadoAdmin)
 
 
 
+class CategoriaPorNombreWidget(ForeignKeyWidget):
+    """
+    Busca la categoría por nombre. Durante una importación usa el diccionario que
+    precarga `ProductoResource.before_import` en lugar de hacer una consulta por fila.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.precargadas = None  # nombre -> [Categoria, ...]
+
+    def clean(self, value, row=None, **kwargs):
+        if self.precargadas is None:
+            return super().clean(value, row, **kwargs)
+        if not value:
+            return None
+        candidatas = self.precargadas.get(str(value), [])
+        if not candidatas:
+            raise ValueError(f"La categoría '{value}' no existe.")
+        if len(candidatas) > 1:
+            raise ValueError(f"Hay varias categorías llamadas '{value}'.")
+        return candidatas[0]
+
+
+class DiffProducto(resources.Diff):
+    """
+    Diff de la vista previa que toma las refacciones de lo precargado por
+    `ProductoResource` en vez de consultarlas para cada fila.
+    """
+    def __init__(self, resource, instance, new):
+        self.left = resource.valores_diff(instance)
+        self.right = []
+        self.new = new
+
+    def compare_with(self, resource, instance):
+        self.right = resource.valores_diff(instance)
+
+
 class ProductoResource(resources.ModelResource): 
+    """
+    Importación en bloque de productos. En vez de guardar fila a fila:
+
+    - `before_import` precarga con una consulta cada cosa: los productos del archivo
+      (y los que se mencionan como refacciones) por nombre, las categorías y las
+      refacciones actuales de esos productos.
+    - Las filas se guardan con `bulk_create`/`bulk_update` en lotes de `batch_size`.
+    - `after_import` escribe la tabla intermedia de refacciones de una vez y hace lo
+      que `Producto.save` y las señales harían por fila: trigramas de los productos
+      nuevos, conversión de las imágenes nuevas o cambiadas, fechas `actualizado`
+      y versión del catálogo.
+    """
     categoria = Field(
         column_name='categoria',
         attribute='categoria',
-        widget=ForeignKeyWidget(Categoria, 'nombre')
+        widget=CategoriaPorNombreWidget(Categoria, 'nombre')
     )
     imagen = Field(
         column_name='imagen',
@@ -82,22 +182,299 @@ class ProductoResource(resources.ModelResource):
         skip_unchanged = True
         report_skipped = False
         create_missing_fk = True
+        use_bulk = True
+        batch_size = 1000
+
+    @classmethod
+    def get_diff_class(cls):
+        return DiffProducto
+
+    def valores_diff(self, instance):
+        valores = []
+        for field in self.get_import_fields():
+            if not isinstance(field.widget, ManyToManyWidget):
+                valores.append(field.export(instance))
+                continue
+            pendiente = self.refacciones_pendientes.get(instance.nombre)
+            if pendiente and pendiente[0] is instance:
+                nombres = pendiente[1]  # Lo que deja la fila (el original es una copia).
+            else:
+                nombres = self.refacciones_actuales[instance.pk] if instance.pk else ()
+            valores.append(field.widget.separator.join(sorted(nombres)))
+        return valores
+
+    def nombres_refacciones(self, valor):
+        """Nombres de la celda 'refacciones', separados igual que en ManyToManyWidget."""
+        if not valor:
+            return set()
+        separador = self.fields['refacciones'].widget.separator
+        return {nombre.strip() for nombre in str(valor).split(separador) if nombre.strip()}
+
+    def before_import(self, dataset, **kwargs):
+        super().before_import(dataset, **kwargs)
+        nombres = set()
+        if 'nombre' in dataset.headers:
+            nombres.update(str(nombre) for nombre in dataset['nombre'] if nombre)
+        if 'refacciones' in dataset.headers:
+            for valor in dataset['refacciones']:
+                nombres.update(self.nombres_refacciones(valor))
+        self.productos = {
+            p.nombre: p for p in Producto.objects.filter(nombre__in=nombres).select_related('categoria')
+        } if nombres else {}
+
+        categorias = defaultdict(list)
+        for categoria in Categoria.objects.all():
+            categorias[categoria.nombre].append(categoria)
+        self.fields['categoria'].widget.precargadas = categorias
+        self.fields['imagen'].widget.preparar_indice()
+
+        self.refacciones_actuales = defaultdict(set)
+        if self.productos:
+            enlaces = Producto.accesorios.through.objects.filter(
+                from_producto__in=[p.pk for p in self.productos.values()]
+            ).values_list('from_producto_id', 'to_producto__nombre')
+            for producto_id, nombre in enlaces:
+                self.refacciones_actuales[producto_id].add(nombre)
+
+        self.creados = []
+        self.actualizados = []
+        self.categorias_anteriores = set()  # de los productos que cambian de categoría
+        self.con_imagen_nueva = {}  # nombre -> instancia cuya imagen hay que convertir
+        self.variantes_obsoletas = []  # variantes de las imágenes reemplazadas
+        self.refacciones_pendientes = {}  # nombre del producto -> (instancia, nombres de refacciones)
+
+    def get_instance(self, instance_loader, row):
+        # Sin consulta: los productos existentes se precargaron en before_import.
+        if 'nombre' not in row:
+            return None
+        return self.productos.get(str(self.fields['nombre'].clean(row)))
+
+    def skip_row(self, instance, original, row, import_validation_errors=None):
+        # Como la versión base, pero compara las refacciones con las precargadas en lugar
+        # de consultar las de cada producto.
+        if not self._meta.skip_unchanged or self._meta.skip_diff or import_validation_errors:
+            return False
+        if original.pk is None:
+            return False
+        for field in self.get_import_fields():
+            if isinstance(field.widget, ManyToManyWidget):
+                if field.column_name in row and (
+                        self.nombres_refacciones(row[field.column_name]) != self.refacciones_actuales[original.pk]):
+                    return False
+                continue
+            valor, anterior = field.get_value(instance), field.get_value(original)
+            if isinstance(valor, FieldFile):
+                # Una celda de imagen vacía (None) equivale a un producto sin imagen ('').
+                valor, anterior = valor.name or '', anterior.name or ''
+            if valor != anterior:
+                return False
+        return True
+
+    def save_instance(self, instance, is_create, row, **kwargs):
+        if not self._meta.use_bulk:
+            return super().save_instance(instance, is_create, row, **kwargs)
+        if instance.pk is None and not is_create:
+            # Fila repetida de un producto que se crea en esta misma importación: ya está en
+            # `create_instances` y los cambios se han aplicado sobre esa misma instancia.
+            return
+        if is_create:
+            self.productos[instance.nombre] = instance
+            self.creados.append(instance)
+            if instance.imagen:
+                self.con_imagen_nueva[instance.nombre] = instance
+        else:
+            self.actualizados.append(instance)
+            if instance.ha_cambiado('categoria_id'):
+                self.categorias_anteriores.add(instance.valor_cargado('categoria_id'))
+            if instance.ha_cambiado('imagen'):
+                # Igual que en Producto.save: las variantes de la imagen anterior ya no sirven.
+                # Sus archivos se borran en after_import, si no es una prueba (dry run).
+                if instance.imagen_variantes:
+                    self.variantes_obsoletas.append(instance.imagen_variantes)
+                instance.imagen_variantes = []
+                if instance.imagen:
+                    self.con_imagen_nueva[instance.nombre] = instance
+        super().save_instance(instance, is_create, row, **kwargs)
+
+    def get_bulk_update_fields(self):
+        # Atributos del modelo (no nombres de columna) y sin la M2M, que se escribe en after_import.
+        campos = [
+            field.attribute for nombre, field in self.fields.items()
+            if nombre not in self._meta.import_id_fields and not isinstance(field.widget, ManyToManyWidget)
+        ]
+        return campos + ['imagen_variantes']
+
+    def save_m2m(self, instance, row, **kwargs):
+        if not self._meta.use_bulk:
+            return super().save_m2m(instance, row, **kwargs)
+        columna = self.fields['refacciones'].column_name
+        if columna not in row:
+            return
+        nombres = self.nombres_refacciones(row[columna])
+        if instance.pk is None or nombres != self.refacciones_actuales[instance.pk]:
+            self.refacciones_pendientes[instance.nombre] = (instance, nombres)
+
+    def after_import(self, dataset, result, **kwargs):
+        super().after_import(dataset, result, **kwargs)
+        if not self._meta.use_bulk:
+            return
+        dry_run = self._is_dry_run(kwargs)
+        if dry_run and not self._is_using_transactions(kwargs):
+            return  # No se escribió nada.
+
+        pendientes = list(self.refacciones_pendientes.values())
+        con_imagen_nueva = list(self.con_imagen_nueva.values())
+        self.asignar_pks([instancia for instancia, _ in pendientes] + con_imagen_nueva + self.creados)
+
+        # Las refacciones que se quitan o se añaden muestran el cambio en su "Compatible con".
+        puntas = set()
+        if pendientes:
+            buscados = set().union(*(nombres for _, nombres in pendientes))
+            ids = {p.nombre: p.pk for p in self.productos.values() if p.pk and p.nombre in buscados}
+            if buscados - ids.keys():
+                ids.update(Producto.objects.filter(nombre__in=buscados - ids.keys()).values_list('nombre', 'id'))
+            # Como ManyToManyWidget, las refacciones que no existen se ignoran.
+            Enlace = Producto.accesorios.through
+            enlaces_anteriores = Enlace.objects.filter(from_producto__in=[instancia.pk for instancia, _ in pendientes])
+            puntas.update(enlaces_anteriores.values_list('to_producto_id', flat=True))
+            puntas.update(ids[nombre] for _, nombres in pendientes for nombre in nombres if nombre in ids)
+            enlaces_anteriores.delete()
+            Enlace.objects.bulk_create(
+                [Enlace(from_producto_id=instancia.pk, to_producto_id=ids[nombre])
+                 for instancia, nombres in pendientes for nombre in sorted(nombres) if nombre in ids],
+                batch_size=self._meta.batch_size,
+            )
+
+        # bulk_create no dispara la señal que indexa los trigramas (el nombre de un
+        # producto existente no cambia: es la clave de importación).
+        if self.creados and get_backend().usa_tabla:
+            reconstruir_indice(Producto.objects.filter(pk__in=[p.pk for p in self.creados]))
+
+        if con_imagen_nueva:
+            ids = [p.pk for p in con_imagen_nueva]
+            TrabajoImagen.objects.filter(producto__in=ids, estado=TrabajoImagen.PENDIENTE).delete()
+            TrabajoImagen.objects.bulk_create(
+                [TrabajoImagen(producto_id=p.pk, imagen=p.imagen.name) for p in con_imagen_nueva],
+                batch_size=self._meta.batch_size,
+            )
+
+        if not dry_run:
+            for variantes in self.variantes_obsoletas:
+                borrar_variantes(variantes)
+
+        if not dry_run and (self.creados or self.actualizados or pendientes):
+            # bulk_create/bulk_update no pasan por `Producto.save` ni por las señales.
+            marcar_modificados(
+                productos=[p.pk for p in self.creados + self.actualizados] + list(puntas),
+                categorias=self.categorias_anteriores,
+            )
+            incrementar_version_al_confirmar('productos')
+
+    def asignar_pks(self, instancias):
+        """Completa el pk de las instancias creadas si la base de datos no lo devolvió en bulk_create."""
+        sin_pk = {instancia.nombre: instancia for instancia in instancias if instancia.pk is None}
+        if sin_pk:
+            for nombre, pk in Producto.objects.filter(nombre__in=sin_pk).values_list('nombre', 'id'):
+                sin_pk[nombre].pk = pk
 
 # --- NUEVO: Formulario para la acción de cambiar categoría ---
+class CategoriaChoiceField(forms.ModelChoiceField):
+    """
+    Muestra la ruta completa de cada categoría ("Herramientas > Eléctricas") usando
+    el árbol en memoria, sin una consulta por opción.
+    """
+    def label_from_instance(self, obj):
+        return obtener_arbol().nombre_completo(obj.pk) or str(obj)
+
 class CambiarCategoriaForm(forms.Form):
     # Campo para seleccionar la nueva categoría. Usamos ModelChoiceField para que se muestre como un <select>.
-    categoria = forms.ModelChoiceField(queryset=Categoria.objects.all(), label="Seleccionar nueva categoría")
+    categoria = CategoriaChoiceField(queryset=Categoria.objects.all(), label="Seleccionar nueva categoría")
 
 class ProductoAdmin(ImportExportModelAdmin):
     filter_horizontal = ('accesorios',)
     resource_class = ProductoResource
+    # Sustituye el botón "Exportar" por los de la exportación en streaming.
+    import_export_change_list_template = 'admin/catalogo/producto_change_list.html'
     list_display = ('nombre', 'precio', 'categoria', 'stock', 'es_mas_vendido')
+    list_select_related = ('categoria',) # Evita una consulta por fila para mostrar la categoría
     list_filter = ('categoria', 'es_mas_vendido', 'imagen')
     search_fields = ('nombre', 'categoria__nombre')
     ordering = ('nombre',)
     list_editable = ('precio', 'stock', 'es_mas_vendido')
     save_on_top = True
-    actions = ['cambiar_categoria'] # <-- AÑADIMOS LA NUEVA ACCIÓN
+    actions = ['cambiar_categoria', 'exportar_seleccionados'] # <-- AÑADIMOS LA NUEVA ACCIÓN
+    readonly_fields = ('estado_imagen',)
+
+    def get_urls(self):
+        urls = super().get_urls()
+        return [
+            path('exportar-stream/', self.admin_site.admin_view(self.exportar_stream),
+                 name='catalogo_producto_exportar_stream'),
+        ] + urls
+
+    def exportar_stream(self, request):
+        """
+        Exporta en streaming los productos de la lista (respeta búsqueda y filtros):
+        /admin/catalogo/producto/exportar-stream/?formato=csv|jsonl|xlsx
+        """
+        if not (self.has_view_permission(request) and self.has_export_permission(request)):
+            raise PermissionDenied
+        # `formato` no es un filtro de la lista: lo quitamos antes de armar el ChangeList.
+        request.GET = request.GET.copy()
+        formato = request.GET.pop('formato', ['csv'])[-1]
+        if formato not in exportacion.FORMATOS:
+            return HttpResponseBadRequest('Formato no soportado.')
+        return self.respuesta_exportacion(self.get_export_queryset(request), formato)
+
+    def export_action(self, request):
+        # El "Exportar" de django-import-export arma todo el archivo en memoria: lo
+        # mandamos a la exportación en streaming con la misma búsqueda y filtros.
+        if not self.has_export_permission(request):
+            raise PermissionDenied
+        url = reverse('admin:catalogo_producto_exportar_stream')
+        return HttpResponseRedirect(f"{url}?{request.GET.urlencode()}" if request.GET else url)
+
+    def exportar_seleccionados(self, request, queryset):
+        """Acción de administrador: exporta en streaming (CSV) los productos seleccionados."""
+        if not self.has_export_permission(request):
+            raise PermissionDenied
+        return self.respuesta_exportacion(queryset, 'csv')
+    exportar_seleccionados.short_description = "Exportar productos seleccionados (CSV)"
+
+    def respuesta_exportacion(self, queryset, formato):
+        tipo, extension = exportacion.FORMATOS[formato]
+        nombre = f"productos-{timezone.localdate():%Y-%m-%d}.{extension}"
+        resource = ProductoResource()
+        if formato == 'xlsx':
+            return FileResponse(exportacion.xlsx_temporal(resource, queryset),
+                                as_attachment=True, filename=nombre, content_type=tipo)
+        generador = exportacion.exportar_csv if formato == 'csv' else exportacion.exportar_jsonl
+        response = StreamingHttpResponse(generador(resource, queryset), content_type=tipo)
+        response['Content-Disposition'] = f'attachment; filename="{nombre}"'
+        return response
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            # Solo escribimos las columnas modificadas: una edición de precio o stock desde
+            # la lista (list_editable) es un UPDATE de esas columnas y nada más.
+            obj.save(update_fields=obj.campos_cambiados())
+        else:
+            super().save_model(request, obj, form, change)
+
+    def estado_imagen(self, obj):
+        # Estado de la última conversión encolada (ver TrabajoImagenAdmin).
+        trabajo = obj.trabajos_imagen.order_by('-creado', '-id').first() if obj.pk else None
+        if trabajo is None:
+            return '-'
+        if trabajo.estado == TrabajoImagen.FALLIDO:
+            return f'{trabajo.get_estado_display()}: {trabajo.error}'
+        return trabajo.get_estado_display()
+    estado_imagen.short_description = 'Conversión de imagen'
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'categoria':
+            kwargs['form_class'] = CategoriaChoiceField
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
     # --- NUEVA ACCIÓN PARA CAMBIAR CATEGORÍA EN LOTE ---
     def cambiar_categoria(self, request, queryset):
@@ -109,7 +486,13 @@ class ProductoAdmin(ImportExportModelAdmin):
             form = CambiarCategoriaForm(request.POST)
             if form.is_valid():
                 nueva_categoria = form.cleaned_data['categoria']
+                anteriores = list(queryset.values_list('pk', 'categoria_id'))
                 updated_count = queryset.update(categoria=nueva_categoria)
+                # queryset.update() no dispara señales: invalidamos las cachés del catálogo a mano
+                # (y marcamos como modificadas las categorías de antes y la nueva).
+                marcar_modificados(productos=[pk for pk, _ in anteriores],
+                                   categorias=[categoria for _, categoria in anteriores])
+                incrementar_version_al_confirmar('productos')
                 self.message_user(request, f'{updated_count} productos han sido actualizados a la categoría "{nueva_categoria}".')
                 return
 
@@ -121,7 +504,7 @@ class ProductoAdmin(ImportExportModelAdmin):
             'admin/cambiar_categoria_intermedio.html',
             context={
                 'title': 'Cambiar categoría de productos',
-                'queryset': queryset,
+                'queryset': queryset.select_related('categoria'),
                 'opts': self.model._meta,
                 'form': form, # Pasamos el objeto form directamente
                 'action_checkbox_name': admin.helpers.ACTION_CHECKBOX_NAME,
@@ -140,12 +523,51 @@ class CategoriaAdmin(admin.ModelAdmin):
     """
     Mejora la interfaz de administración para las categorías.
     """
-    list_display = ('nombre', 'parent') # Muestra la categoría padre en la lista
+    list_display = ('nombre', 'categoria_padre') # Muestra la categoría padre en la lista
     list_filter = ('parent',) # Permite filtrar por categoría padre
     search_fields = ('nombre', 'parent__nombre') # Permite buscar por nombre o nombre del padre
     ordering = ('nombre',)
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'parent':
+            kwargs['form_class'] = CategoriaChoiceField
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def categoria_padre(self, obj):
+        # Ruta completa del padre tomada del árbol en memoria: sin consultas por fila.
+        return obtener_arbol().nombre_completo(obj.parent_id) if obj.parent_id else '-'
+    categoria_padre.short_description = 'Categoría Padre'
+    categoria_padre.admin_order_field = 'parent__nombre'
+
 
 # 3. Registros: Activamos todo en el panel de admin.
 admin.site.register(Categoria, CategoriaAdmin) # Usamos la nueva clase personalizada
 admin.site.register(Producto, ProductoAdmin)
+
+
+# --- COLA DE CONVERSIÓN DE IMÁGENES ---
+class TrabajoImagenAdmin(admin.ModelAdmin):
+    """
+    Estado de la cola de conversión de imágenes. Los trabajos los crea
+    `Producto.save` y los procesa el comando `procesar_imagenes`.
+    """
+    list_display = ('producto', 'imagen', 'estado', 'intentos', 'disponible_en', 'actualizado', 'error')
+    list_filter = ('estado',)
+    list_select_related = ('producto',)
+    search_fields = ('producto__nombre', 'imagen')
+    readonly_fields = ('producto', 'imagen', 'estado', 'intentos', 'error', 'disponible_en', 'creado', 'actualizado')
+    actions = ['reintentar']
+
+    def has_add_permission(self, request):
+        return False
+
+    def reintentar(self, request, queryset):
+        """Vuelve a poner en la cola los trabajos seleccionados, con los intentos a cero."""
+        ahora = timezone.now()
+        total = queryset.exclude(estado=TrabajoImagen.PROCESANDO).update(
+            estado=TrabajoImagen.PENDIENTE, intentos=0, error='', disponible_en=ahora, actualizado=ahora)
+        self.message_user(request, f'{total} trabajos vueltos a encolar.')
+    reintentar.short_description = 'Reintentar los trabajos seleccionados'
+
+
+admin.site.register(TrabajoImagen, TrabajoImagenAdmin)
@@ -1,6 +1,26 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def reparar_indice_busqueda(sender, using, **kwargs):
+    """
+    En SQLite, cualquier migración que reconstruya `catalogo_producto` borra los
+    triggers del índice FTS. Después de cada `migrate` los volvemos a crear.
+    """
+    from django.db import connections
+    from .search import instalar_indice
+    instalar_indice(connections[using])
 
 
 class CatalogoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'catalogo'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (registra los receptores)
+        from django.conf import settings
+        from PIL import Image
+        # Pillow avisa al pasar este límite y se niega a abrir imágenes del doble de tamaño;
+        # también protege la validación de `forms.ImageField` en el admin.
+        Image.MAX_IMAGE_PIXELS = settings.IMAGENES_MAX_PIXELES
+        post_migrate.connect(reparar_indice_busqueda, sender=self)
@@ -0,0 +1,98 @@
+# catalogo/decorators.py
+import hashlib
+import os
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.utils import get_app_template_dirs
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .versioning import version_catalogo
+
+
+def cache_pagina_catalogo(vista):
+    """
+    Guarda en caché la respuesta completa de una página pública del catálogo.
+
+    La clave incluye la versión del catálogo (ver `versioning.py`), que las señales
+    incrementan al editar productos o categorías: las páginas se sirven de la caché
+    hasta el momento de la edición y la siguiente petición ya genera la nueva.
+    También incluye `huella_plantillas()`: la caché está en archivos y sobrevive a
+    los reinicios, y un despliegue que cambia el HTML no debe servir la página anterior.
+    Solo se cachean peticiones GET de visitantes anónimos con respuesta 200.
+    """
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        if request.method != 'GET' or request.user.is_authenticated:
+            return vista(request, *args, **kwargs)
+
+        url = request.build_absolute_uri()
+        clave = 'catalogo:pagina:{}:{}:{}'.format(
+            huella_plantillas(), version_catalogo(), hashlib.md5(url.encode()).hexdigest())
+        respuesta = cache.get(clave)
+        if respuesta is not None:
+            return respuesta
+
+        respuesta = vista(request, *args, **kwargs)
+        if respuesta.status_code == 200 and not respuesta.streaming and not respuesta.cookies:
+            cache.set(clave, respuesta, settings.CACHE_PAGINAS_TIMEOUT)
+        return respuesta
+    return envoltura
+
+
+@lru_cache(maxsize=None)
+def huella_plantillas():
+    """
+    Resumen del contenido de todas las plantillas, calculado una vez por proceso.
+    Va en los ETag y en las claves de las páginas y tarjetas cacheadas para que un
+    despliegue que cambia el HTML no siga respondiendo 304 con la página anterior ni
+    sirviendo páginas o tarjetas viejas. Es igual en todos los workers y servidores.
+    """
+    resumen = hashlib.md5()
+    carpetas = [str(carpeta) for motor in settings.TEMPLATES for carpeta in motor.get('DIRS', [])]
+    carpetas += [str(carpeta) for carpeta in get_app_template_dirs('templates')]
+    for carpeta in carpetas:
+        for raiz, _subcarpetas, archivos in sorted(os.walk(carpeta)):
+            for nombre in sorted(archivos):
+                ruta = os.path.join(raiz, nombre)
+                resumen.update(os.path.relpath(ruta, carpeta).encode())
+                with open(ruta, 'rb') as archivo:
+                    resumen.update(archivo.read())
+    return resumen.hexdigest()[:12]
+
+
+def pagina_condicional(ultima_modificacion):
+    """
+    Responde 304 Not Modified a los GET condicionales (`If-None-Match`,
+    `If-Modified-Since`) sin ejecutar la vista, es decir, sin cargar refacciones
+    ni renderizar plantillas, si la página no cambió desde la copia del navegador.
+
+    `ultima_modificacion(request, *args, **kwargs)` recibe los argumentos de la
+    vista y devuelve la fecha de la última modificación de lo que muestra la página
+    (una consulta indexada) o None si no existe, y entonces la vista responde 404.
+    El ETag combina esa fecha con `huella_plantillas()`. `Cache-Control: no-cache`
+    hace que el navegador pregunte siempre antes de reutilizar su copia.
+    """
+    def momento(request, *args, **kwargs):
+        # `condition` pide por separado el ETag y la fecha: consultamos una sola vez.
+        if not hasattr(request, '_ultima_modificacion'):
+            request._ultima_modificacion = ultima_modificacion(request, *args, **kwargs)
+        return request._ultima_modificacion
+
+    def etag(request, *args, **kwargs):
+        valor = momento(request, *args, **kwargs)
+        return None if valor is None else f'{huella_plantillas()}-{valor.timestamp():.6f}'
+
+    def decorador(vista):
+        condicional = condition(etag_func=etag, last_modified_func=momento)(vista)
+
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            respuesta = condicional(request, *args, **kwargs)
+            if respuesta.status_code in (200, 304):
+                patch_cache_control(respuesta, no_cache=True)
+            return respuesta
+        return envoltura
+    return decorador
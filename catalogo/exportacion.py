@@ -0,0 +1,107 @@
+# catalogo/exportacion.py
+"""
+Exportación del catálogo en streaming, con las mismas columnas que importa
+`ProductoResource` (el archivo exportado se puede volver a importar).
+
+El export de django-import-export arma todo el `tablib.Dataset` en memoria antes
+de enviar nada. Aquí los productos se leen con `.iterator(chunk_size=...)`, las
+refacciones se precargan por bloque y cada fila se escribe en cuanto se lee:
+
+    for trozo in exportar_csv(ProductoResource()):
+        respuesta.write(trozo)
+
+- CSV y JSON Lines son generadores de texto: el primer byte sale con el primer
+  bloque y la memoria no crece con el número de productos.
+- XLSX es un zip, así que no se puede enviar hasta terminarlo; se escribe con
+  openpyxl en modo "write-only" (las filas van a disco, no a memoria) sobre un
+  archivo temporal que luego se envía.
+"""
+import csv
+import json
+import tempfile
+
+from django.db.models import Prefetch
+
+from .models import Producto
+
+TAMANO_BLOQUE = 2000
+
+FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson; charset=utf-8', 'jsonl'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+
+def productos_para_exportar(queryset=None):
+    """Productos con su categoría y sus refacciones (solo el nombre), listos para `iterator`."""
+    if queryset is None:
+        queryset = Producto.objects.all()
+    return (
+        queryset.select_related('categoria')
+        .prefetch_related(Prefetch('accesorios', queryset=Producto.objects.only('id', 'nombre')))
+        .order_by('pk')
+    )
+
+
+def filas(resource, queryset=None, nativos=False, chunk_size=TAMANO_BLOQUE):
+    """
+    Genera las filas exportadas (listas de valores) de uno en uno. Con `chunk_size`,
+    Django ejecuta el `prefetch_related` de las refacciones una vez por bloque.
+    Con `nativos` los números y booleanos no se convierten a texto (para XLSX).
+    """
+    campos = resource.get_export_fields()
+    for producto in productos_para_exportar(queryset).iterator(chunk_size=chunk_size):
+        yield [resource.export_field(campo, producto, force_native_type=nativos) for campo in campos]
+
+
+class _Eco:
+    """Objeto tipo archivo cuyo `write` devuelve lo escrito, para usar `csv.writer` en un generador."""
+    def write(self, valor):
+        return valor
+
+
+def exportar_csv(resource, queryset=None):
+    escritor = csv.writer(_Eco())
+    # BOM para que Excel abra bien los acentos.
+    yield '\ufeff' + escritor.writerow(resource.get_export_headers())
+    lote = []
+    for fila in filas(resource, queryset):
+        lote.append(escritor.writerow(fila))
+        if len(lote) >= 100:
+            yield ''.join(lote)
+            lote = []
+    if lote:
+        yield ''.join(lote)
+
+
+def exportar_jsonl(resource, queryset=None):
+    cabeceras = resource.get_export_headers()
+    lote = []
+    for fila in filas(resource, queryset):
+        lote.append(json.dumps(dict(zip(cabeceras, fila)), ensure_ascii=False) + '\n')
+        if len(lote) >= 100:
+            yield ''.join(lote)
+            lote = []
+    if lote:
+        yield ''.join(lote)
+
+
+def exportar_xlsx(resource, archivo, queryset=None):
+    """Escribe el libro en `archivo` (ruta u objeto binario) en modo write-only."""
+    from openpyxl import Workbook
+
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet('Productos')
+    hoja.append(resource.get_export_headers())
+    for fila in filas(resource, queryset, nativos=True):
+        hoja.append(fila)
+    libro.save(archivo)
+
+
+def xlsx_temporal(resource, queryset=None):
+    """Devuelve un archivo temporal (se borra al cerrarlo) con el XLSX, listo para leer."""
+    archivo = tempfile.TemporaryFile(suffix='.xlsx')
+    exportar_xlsx(resource, archivo, queryset)
+    archivo.seek(0)
+    return archivo
@@ -0,0 +1,236 @@
+# catalogo/imagenes.py
+"""
+Conversión y variantes de tamaño de las imágenes de producto.
+
+Al subir una imagen, el worker de `jobs.py` la convierte a WebP (máximo
+`ANCHO_MAXIMO` px) con `optimizar_imagen` y además genera copias de ancho fijo
+(`IMAGENES_ANCHOS_VARIANTES`) en la carpeta `productos_imagenes/variantes/`.
+Si `IMAGENES_AVIF` está activo y Pillow sabe codificar AVIF, se genera también
+una copia AVIF de cada ancho.
+
+La lista de variantes se guarda en `Producto.imagen_variantes` como
+[{"ancho": 160, "formato": "webp", "nombre": "productos_imagenes/variantes/..."}, ...]
+para que las plantillas construyan el `srcset` sin tocar el disco.
+
+Memoria acotada: una foto de 40 megapíxeles decodificada ocupa ~120 MB.
+- Las imágenes de más de `IMAGENES_MAX_PIXELES` se rechazan antes de decodificarlas.
+- Los JPEG grandes se decodifican ya reducidos (`Image.draft`, a 1/2, 1/4 o 1/8).
+- La imagen decodificada se libera en cuanto existe la versión redimensionada.
+- Cada archivo codificado va a un `SpooledTemporaryFile`, que pasa a disco al
+  superar `IMAGENES_SPOOL_MAX` bytes.
+El pico de memoria estimado de cada conversión se registra en el log.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from PIL import Image, features
+
+logger = logging.getLogger(__name__)
+
+CARPETA_VARIANTES = 'productos_imagenes/variantes'
+
+CALIDAD = {'webp': 80, 'avif': 60}
+
+# 1200px es un buen valor para imágenes de producto.
+ANCHO_MAXIMO = 1200
+
+
+def formatos_variantes():
+    formatos = ['webp']
+    if getattr(settings, 'IMAGENES_AVIF', False) and features.check('avif'):
+        formatos.append('avif')
+    return formatos
+
+
+def comprobar_pixeles(ancho, alto):
+    """Rechaza imágenes enormes (o "bombas de descompresión") antes de decodificarlas."""
+    limite = settings.IMAGENES_MAX_PIXELES
+    if ancho * alto > limite:
+        raise ValidationError(
+            f'La imagen mide {ancho}x{alto} píxeles; el máximo es {limite / 1e6:.0f} megapíxeles.')
+
+
+def validar_imagen(valor):
+    """Validador de `Producto.imagen`: solo mira la cabecera de los archivos recién subidos."""
+    if not valor or getattr(valor, '_committed', True):
+        return
+    # `forms.ImageField` ya abrió la imagen y la deja en `.image`; si no, leemos solo la cabecera.
+    imagen = getattr(valor.file, 'image', None)
+    if imagen is None:
+        with Image.open(valor.file) as imagen:
+            comprobar_pixeles(*imagen.size)
+        valor.file.seek(0)
+    else:
+        comprobar_pixeles(*imagen.size)
+
+
+class MedicionMemoria:
+    """
+    Estimación del pico de memoria de una conversión: suma los búferes de Pillow
+    vivos (ancho x alto x bandas) y lo que el archivo temporal guarda en RAM.
+    """
+    def __init__(self):
+        self.actual = 0
+        self.pico = 0
+
+    def sumar(self, bytes_):
+        self.actual += bytes_
+        self.pico = max(self.pico, self.actual)
+
+    def restar(self, bytes_):
+        self.actual -= bytes_
+
+    @staticmethod
+    def bytes_imagen(img):
+        return img.width * img.height * len(img.getbands())
+
+
+def _rss_maximo_mb():
+    if resource is None:
+        return None
+    # En Linux ru_maxrss viene en KB.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@contextmanager
+def _codificar(img, formato, medicion):
+    """Codifica `img` en un archivo temporal que pasa a disco si crece demasiado."""
+    limite = settings.IMAGENES_SPOOL_MAX
+    with tempfile.SpooledTemporaryFile(max_size=limite) as temporal:
+        img.save(temporal, format=formato.upper(), quality=CALIDAD[formato])
+        en_ram = temporal.tell() if temporal.tell() <= limite else 0
+        medicion.sumar(en_ram)
+        temporal.seek(0)
+        try:
+            yield File(temporal)
+        finally:
+            medicion.restar(en_ram)
+
+
+def nombre_variante(nombre_imagen, ancho, formato):
+    # Las importaciones repiten nombres de archivo en distintas carpetas
+    # (lijas/000001.webp, brocas/000001.webp): el resumen de la ruta completa evita
+    # que las variantes de una imagen pisen las de otra en un almacenamiento que no
+    # deduplica.
+    base = os.path.splitext(os.path.basename(nombre_imagen))[0]
+    ruta = hashlib.md5(nombre_imagen.replace('\\', '/').encode()).hexdigest()[:8]
+    return f'{CARPETA_VARIANTES}/{base}-{ruta}-{ancho}w.{formato}'
+
+
+def puede_borrar(storage=None):
+    """
+    En un almacenamiento que deduplica (ver `storage.py`) un archivo puede ser de
+    varios productos, así que no se borra al cambiar una imagen; los huérfanos
+    los elimina `manage.py limpiar_media`.
+    """
+    return not getattr(storage or default_storage, 'deduplica', False)
+
+
+def borrar_variantes(variantes, storage=None):
+    storage = storage or default_storage
+    if not puede_borrar(storage):
+        return
+    for variante in variantes or []:
+        storage.delete(variante['nombre'])
+
+
+def generar_variantes(img, nombre_imagen, storage=None, medicion=None):
+    """
+    Genera las variantes de `img` (una imagen de Pillow ya cargada) y devuelve su
+    lista. Nunca amplía: los anchos mayores que el original se omiten y, en su
+    lugar, se añade una variante con el ancho original.
+    """
+    storage = storage or default_storage
+    medicion = medicion or MedicionMemoria()
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('LA', 'PA') else 'RGB')
+    anchos = [ancho for ancho in settings.IMAGENES_ANCHOS_VARIANTES if ancho < img.width]
+    anchos.append(min(img.width, max(settings.IMAGENES_ANCHOS_VARIANTES)))
+
+    variantes = []
+    for ancho in anchos:
+        if ancho == img.width:
+            reducida = img
+        else:
+            reducida = img.resize((ancho, max(1, round(img.height * ancho / img.width))), Image.Resampling.LANCZOS)
+            medicion.sumar(MedicionMemoria.bytes_imagen(reducida))
+        for formato in formatos_variantes():
+            nombre = nombre_variante(nombre_imagen, ancho, formato)
+            # Sobrescribimos: el nombre es determinista y una variante vieja sería incorrecta.
+            if puede_borrar(storage):
+                storage.delete(nombre)
+            with _codificar(reducida, formato, medicion) as archivo:
+                nombre = storage.save(nombre, archivo)
+            variantes.append({'ancho': ancho, 'formato': formato, 'nombre': nombre})
+        if reducida is not img:
+            medicion.restar(MedicionMemoria.bytes_imagen(reducida))
+            reducida.close()
+    return variantes
+
+
+def optimizar_imagen(nombre_imagen, storage=None, medicion=None):
+    """
+    Convierte la imagen guardada en `nombre_imagen` a WebP de como máximo
+    `ANCHO_MAXIMO` px y genera sus variantes. Devuelve (nombre_final, variantes).
+    Un WebP que ya cumple el ancho se conserva tal cual, sin volver a codificarlo.
+    No borra el archivo original: de eso se encarga quien la llama.
+    Si se pasa `medicion` (una `MedicionMemoria`), queda con el pico estimado.
+    """
+    storage = storage or default_storage
+    medicion = medicion or MedicionMemoria()
+    with storage.open(nombre_imagen, 'rb') as archivo, Image.open(archivo) as original:
+        # Hasta aquí Pillow solo leyó la cabecera.
+        ancho, alto = original.size
+        comprobar_pixeles(ancho, alto)
+        ya_optimizada = original.format == 'WEBP' and ancho <= ANCHO_MAXIMO
+        img = original
+        if ancho > ANCHO_MAXIMO:
+            alto_final = max(1, int((ANCHO_MAXIMO / ancho) * alto))
+            # En JPEG decodifica directamente a la menor escala que siga siendo >= al tamaño final.
+            original.draft(None, (ANCHO_MAXIMO, alto_final))
+            original.load()
+            medicion.sumar(MedicionMemoria.bytes_imagen(original))
+            img = original.resize((ANCHO_MAXIMO, alto_final), Image.Resampling.LANCZOS)
+            medicion.sumar(MedicionMemoria.bytes_imagen(img))
+            # Liberamos la decodificada antes de codificar: ya solo necesitamos la reducida.
+            medicion.restar(MedicionMemoria.bytes_imagen(original))
+            original.close()
+        else:
+            original.load()
+            medicion.sumar(MedicionMemoria.bytes_imagen(original))
+
+        nombre = nombre_imagen
+        if not ya_optimizada:
+            with _codificar(img, 'webp', medicion) as webp:
+                nombre = storage.save(f'{os.path.splitext(nombre_imagen)[0]}.webp', webp)
+        variantes = generar_variantes(img, nombre, storage, medicion)
+        img.close()
+
+    logger.info(
+        'Imagen %s (%dx%d) convertida: pico estimado %.1f MB, RSS máximo del proceso %s MB.',
+        nombre_imagen, ancho, alto, medicion.pico / 2**20,
+        f'{_rss_maximo_mb():.0f}' if resource else '?',
+    )
+    return nombre, variantes
+
+
+def srcset(variantes, formato='webp', storage=None):
+    """Devuelve el atributo `srcset` ("url 160w, url 320w, ...") de un formato."""
+    storage = storage or default_storage
+    return ', '.join(
+        f"{storage.url(variante['nombre'])} {variante['ancho']}w"
+        for variante in variantes or []
+        if variante['formato'] == formato
+    )
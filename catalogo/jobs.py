@@ -0,0 +1,145 @@
+# catalogo/jobs.py
+"""
+Cola de conversión de imágenes en segundo plano.
+
+`Producto.save` guarda la imagen original y llama a `encolar_conversion`, que
+crea un `TrabajoImagen`. El comando `procesar_imagenes` (uno o varios procesos)
+reclama los trabajos pendientes, convierte la imagen con
+`imagenes.optimizar_imagen` y sustituye la original por la versión optimizada.
+
+- Reclamar un trabajo es un UPDATE condicional (`estado = pendiente`), así dos
+  workers nunca procesan el mismo trabajo, también en SQLite.
+- Si la conversión falla se reintenta con espera exponencial hasta
+  `IMAGENES_MAX_INTENTOS` veces; después queda como fallido en el admin.
+- Un trabajo que lleva "procesando" más de `IMAGENES_TRABAJO_TIMEOUT` segundos
+  pertenece a un worker que murió y vuelve a la cola.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.utils import timezone
+
+from .imagenes import borrar_variantes, optimizar_imagen, puede_borrar
+from .versioning import incrementar_version_al_confirmar
+
+logger = logging.getLogger(__name__)
+
+# Espera antes del primer reintento; se duplica en cada intento fallido.
+ESPERA_REINTENTO = 30
+
+
+def encolar_conversion(producto):
+    """Encola la conversión de la imagen actual del producto, descartando las pendientes anteriores."""
+    from .models import TrabajoImagen
+
+    TrabajoImagen.objects.filter(producto=producto, estado=TrabajoImagen.PENDIENTE).delete()
+    return TrabajoImagen.objects.create(producto=producto, imagen=producto.imagen.name)
+
+
+def _recuperar_abandonados(ahora):
+    from .models import TrabajoImagen
+
+    limite = ahora - timedelta(seconds=settings.IMAGENES_TRABAJO_TIMEOUT)
+    abandonados = TrabajoImagen.objects.filter(estado=TrabajoImagen.PROCESANDO, actualizado__lt=limite)
+    abandonados.filter(intentos__gte=settings.IMAGENES_MAX_INTENTOS).update(
+        estado=TrabajoImagen.FALLIDO, error='Tiempo de procesamiento agotado.', actualizado=ahora)
+    abandonados.update(estado=TrabajoImagen.PENDIENTE, actualizado=ahora)
+
+
+def reclamar_trabajo():
+    """Marca como "procesando" el siguiente trabajo disponible y lo devuelve (o None)."""
+    from .models import TrabajoImagen
+
+    ahora = timezone.now()
+    _recuperar_abandonados(ahora)
+    candidatos = (
+        TrabajoImagen.objects.filter(estado=TrabajoImagen.PENDIENTE, disponible_en__lte=ahora)
+        .order_by('disponible_en', 'id')
+        .values_list('id', flat=True)[:10]
+    )
+    for pk in candidatos:
+        reclamado = TrabajoImagen.objects.filter(pk=pk, estado=TrabajoImagen.PENDIENTE).update(
+            estado=TrabajoImagen.PROCESANDO, intentos=F('intentos') + 1, actualizado=ahora)
+        if reclamado:
+            return TrabajoImagen.objects.select_related('producto').get(pk=pk)
+    return None
+
+
+def _terminar(trabajo, estado, error=''):
+    """
+    Guarda el resultado del trabajo. Si se borró el producto mientras se procesaba,
+    el trabajo se borró con él (CASCADE): no es un error, solo no hay nada que guardar.
+    """
+    from .models import TrabajoImagen
+
+    trabajo.estado = estado
+    trabajo.error = error
+    trabajo.actualizado = timezone.now()
+    guardado = TrabajoImagen.objects.filter(pk=trabajo.pk).update(
+        estado=estado, error=error, actualizado=trabajo.actualizado, disponible_en=trabajo.disponible_en)
+    if not guardado:
+        logger.info('El producto %s se borró mientras se procesaba su imagen.', trabajo.producto_id)
+
+
+def procesar_trabajo(trabajo):
+    """Convierte la imagen de un trabajo ya reclamado. Devuelve True si terminó bien."""
+    from .models import Producto, TrabajoImagen, marcar_modificados
+
+    if trabajo.producto.imagen.name != trabajo.imagen:
+        # La imagen cambió después de encolar: de la nueva se encarga otro trabajo.
+        _terminar(trabajo, TrabajoImagen.COMPLETADO, 'Obsoleto: el producto ya tiene otra imagen.')
+        return True
+
+    try:
+        nombre, variantes = optimizar_imagen(trabajo.imagen)
+    except ValidationError as e:
+        # Imagen demasiado grande: reintentar no va a cambiar nada.
+        _terminar(trabajo, TrabajoImagen.FALLIDO, ' '.join(e.messages))
+        return False
+    except Exception as e:
+        logger.warning('Error al convertir %s: %s', trabajo.imagen, e)
+        if trabajo.intentos >= settings.IMAGENES_MAX_INTENTOS:
+            _terminar(trabajo, TrabajoImagen.FALLIDO, str(e))
+        else:
+            trabajo.disponible_en = timezone.now() + timedelta(seconds=ESPERA_REINTENTO * 2 ** (trabajo.intentos - 1))
+            _terminar(trabajo, TrabajoImagen.PENDIENTE, str(e))
+        return False
+
+    # El UPDATE condicional evita pisar una imagen que alguien cambió mientras convertíamos.
+    # `update` tampoco vuelve a ejecutar `Producto.save`, que encolaría otro trabajo.
+    actualizado = Producto.objects.filter(pk=trabajo.producto_id, imagen=trabajo.imagen).update(
+        imagen=nombre, imagen_variantes=variantes)
+    if not actualizado:
+        borrar_variantes(variantes)
+        if nombre != trabajo.imagen and puede_borrar():
+            default_storage.delete(nombre)
+        _terminar(trabajo, TrabajoImagen.COMPLETADO, 'Obsoleto: el producto ya tiene otra imagen.')
+        return True
+
+    # Borramos el original salvo que otro producto lo use (las importaciones pueden compartir archivos).
+    # En el almacenamiento por contenido no: una subida en curso puede acabar de reutilizar
+    # el archivo sin haber confirmado su producto todavía. Los huérfanos los borra `limpiar_media`.
+    if (nombre != trabajo.imagen and puede_borrar()
+            and not Producto.objects.filter(imagen=trabajo.imagen).exists()):
+        default_storage.delete(trabajo.imagen)
+    # `update` no pasa por las señales: la página del producto y las de su categoría cambian de imagen.
+    marcar_modificados(productos=[trabajo.producto_id])
+    incrementar_version_al_confirmar('productos')
+    _terminar(trabajo, TrabajoImagen.COMPLETADO)
+    return True
+
+
+def procesar_pendientes(limite=None):
+    """Procesa trabajos hasta vaciar la cola (o hasta `limite`). Devuelve cuántos procesó."""
+    procesados = 0
+    while limite is None or procesados < limite:
+        trabajo = reclamar_trabajo()
+        if trabajo is None:
+            break
+        procesar_trabajo(trabajo)
+        procesados += 1
+    return procesados
@@ -0,0 +1,190 @@
+# catalogo/management/commands/benchmark_catalogo.py
+"""
+Mide las vistas públicas del catálogo sobre catálogos sintéticos de varios tamaños
+y escribe el resultado en JSON, para comparar una versión con otra:
+
+    python manage.py benchmark_catalogo                               # 1k y 10k productos
+    python manage.py benchmark_catalogo --tamanos 1000 10000 100000 --salida antes.json
+    python manage.py benchmark_catalogo --repeticiones 50 --semilla 7
+
+Se trabaja sobre una base de datos de pruebas nueva (como `manage.py test`); la
+base de datos real no se toca, y las cachés tampoco: se usan cachés en memoria
+(`CACHES_BENCHMARK`) en lugar de las de archivos compartidas con los workers, para no
+vaciarlas ni llenarlas de páginas sintéticas. Las métricas de las peticiones van a
+una carpeta temporal, para no mezclar el tráfico sintético con los histogramas de
+producción, y el perfilador se desactiva. Para cada tamaño se genera el catálogo con
+`sintetico.generar_catalogo` y cada vista se pide con el cliente de pruebas:
+
+- "fria": se vacían las cachés antes de cada petición (páginas, fragmentos y
+  versiones, así que los índices en memoria se reconstruyen), como tras un
+  despliegue.
+- "caliente": después de una petición de calentamiento, como en régimen normal.
+
+Por vista y modo se informan p50/p95/máximo de latencia (ms), consultas SQL y
+bytes de la respuesta.
+"""
+import json
+import platform
+import random
+import statistics
+import tempfile
+import time
+
+import django
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from catalogo.models import Categoria, Producto
+from catalogo.paginacion import ADELANTE, codificar_cursor
+from catalogo.sintetico import DETALLES, TIPOS, generar_catalogo
+from catalogo.tree import obtener_arbol
+
+MODOS = ('fria', 'caliente')
+
+CACHES_BENCHMARK = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'},
+    'versiones': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark-versiones'},
+}
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, round(p / 100 * (len(ordenados) - 1)))]
+
+
+def vaciar_caches():
+    for alias in CACHES_BENCHMARK:
+        caches[alias].clear()
+
+
+def resumen(valores):
+    return {
+        'p50': round(statistics.median(valores), 2),
+        'p95': round(percentil(valores, 95), 2),
+        'max': round(max(valores), 2),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Mide latencia, consultas y bytes de las vistas del catálogo con catálogos sintéticos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanos', nargs='+', type=int, default=[1000, 10000], help='Número de productos.')
+        parser.add_argument('--repeticiones', type=int, default=20, help='Peticiones por vista y modo.')
+        parser.add_argument('--semilla', type=int, default=1)
+        parser.add_argument('--salida', help='Archivo JSON de resultados (por defecto, la salida estándar).')
+
+    def handle(self, *args, **options):
+        # override_settings cierra y vuelve a crear los backends de caché (señal
+        # setting_changed) al entrar y al salir.
+        with tempfile.TemporaryDirectory() as metricas, override_settings(
+                CACHES=CACHES_BENCHMARK, INSTRUMENTACION_DIRECTORIO=metricas, PERFILADOR_ACTIVO=False):
+            self.ejecutar(options)
+
+    def ejecutar(self, options):
+        setup_test_environment(debug=False)
+        nombre_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            resultados = {}
+            for tamano in options['tamanos']:
+                call_command('flush', interactive=False, verbosity=0)
+                vaciar_caches()
+                inicio = time.monotonic()
+                generar_catalogo(tamano, semilla=options['semilla'])
+                self.stderr.write(f'{tamano} productos generados en {time.monotonic() - inicio:.1f} s; midiendo...')
+                resultados[str(tamano)] = self.medir(options['repeticiones'], random.Random(options['semilla']))
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+            teardown_test_environment()
+
+        informe = json.dumps({
+            'fecha': timezone.now().isoformat(timespec='seconds'),
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'base_de_datos': connection.vendor,
+            'semilla': options['semilla'],
+            'repeticiones': options['repeticiones'],
+            'resultados': resultados,
+        }, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                archivo.write(informe + '\n')
+        else:
+            self.stdout.write(informe)
+
+    def urls(self, aleatorio):
+        """Una función por vista que devuelve la URL de la siguiente petición."""
+        ids = list(Producto.objects.values_list('pk', flat=True))
+        arbol = obtener_arbol()
+        raices = list(Categoria.objects.filter(parent__isnull=True).values_list('pk', flat=True))
+        hojas = list(Categoria.objects.filter(subcategorias__isnull=True).values_list('pk', flat=True))
+        intermedias = [pk for pk in Categoria.objects.values_list('pk', flat=True) if arbol.hijos(pk) and pk not in raices]
+
+        # Páginas a cualquier profundidad de las hojas: el cursor apunta a un producto al azar.
+        posiciones = list(Producto.objects.filter(categoria_id__in=hojas).values_list('categoria_id', 'nombre', 'pk'))
+
+        def pagina_cursor():
+            categoria_id, nombre, pk = aleatorio.choice(posiciones)
+            cursor = codificar_cursor(ADELANTE, nombre, pk)
+            return reverse('catalogo:categoria_detalle', args=[categoria_id]) + f'?cursor={cursor}'
+
+        def termino():
+            return aleatorio.choice(TIPOS).lower()
+
+        def con_errata():
+            palabra = aleatorio.choice(TIPOS).lower()
+            i = aleatorio.randrange(1, len(palabra) - 1)
+            return palabra[:i] + palabra[i + 1:]
+
+        return {
+            'inicio': lambda: reverse('catalogo:inicio'),
+            'catalogo': lambda: reverse('catalogo:catalogo'),
+            'catalogo_busqueda': lambda: reverse('catalogo:catalogo') + f'?q={termino()}+{aleatorio.choice(DETALLES).split()[-1]}',
+            'catalogo_busqueda_pagina': lambda: reverse('catalogo:catalogo') + f'?q={termino()}&page={aleatorio.randint(2, 5)}',
+            'catalogo_busqueda_nombre': lambda: reverse('catalogo:catalogo') + f'?q={termino()}&orden=nombre',
+            'categoria_detalle_raiz': lambda: reverse('catalogo:categoria_detalle', args=[aleatorio.choice(raices)]),
+            'categoria_detalle_intermedia': lambda: reverse('catalogo:categoria_detalle', args=[aleatorio.choice(intermedias or raices)]),
+            'categoria_detalle_hoja': lambda: reverse('catalogo:categoria_detalle', args=[aleatorio.choice(hojas)]),
+            'categoria_detalle_hoja_cursor': pagina_cursor,
+            'producto_detalle': lambda: reverse('catalogo:producto_detalle', args=[aleatorio.choice(ids)]),
+            'search_suggestions': lambda: reverse('catalogo:search_suggestions') + f'?term={termino()[:4]}',
+            'search_suggestions_errata': lambda: reverse('catalogo:search_suggestions') + f'?term={con_errata()}',
+        }
+
+    def medir(self, repeticiones, aleatorio):
+        cliente = Client()
+        resultados = {}
+        for nombre, siguiente_url in self.urls(aleatorio).items():
+            resultados[nombre] = {}
+            for modo in MODOS:
+                if modo == 'caliente':
+                    cliente.get(siguiente_url())
+                tiempos, consultas, tamanos = [], [], []
+                for _ in range(repeticiones):
+                    url = siguiente_url()
+                    if modo == 'fria':
+                        vaciar_caches()
+                    with CaptureQueriesContext(connection) as contexto:
+                        inicio = time.perf_counter()
+                        respuesta = cliente.get(url)
+                        contenido = b''.join(respuesta.streaming_content) if respuesta.streaming else respuesta.content
+                        tiempos.append((time.perf_counter() - inicio) * 1000)
+                    if respuesta.status_code != 200:
+                        raise RuntimeError(f'{url} devolvió {respuesta.status_code}')
+                    consultas.append(len(contexto.captured_queries))
+                    tamanos.append(len(contenido))
+                resultados[nombre][modo] = {
+                    'ms': resumen(tiempos),
+                    'consultas': resumen(consultas),
+                    'bytes': resumen(tamanos),
+                }
+        return resultados
@@ -0,0 +1,178 @@
+# catalogo/management/commands/cargar_catalogo.py
+"""
+Carga rápida de un fixture de `dumpdata` (por defecto `datos_limpios.json`) en
+un entorno nuevo o en CI. Sustituye a `loaddata`, que guarda los objetos uno a uno:
+
+    python manage.py cargar_catalogo
+    python manage.py cargar_catalogo otro_fixture.json --excluir admin.logentry
+    python manage.py cargar_catalogo --reemplazar     # borra antes el catálogo actual
+
+- El archivo se lee por bloques y se decodifica objeto a objeto; los modelos
+  excluidos (por defecto el historial del admin y las sesiones, que son la
+  mayoría del fixture) se descartan sin guardarlos en memoria.
+- Categorías (padres primero), productos y refacciones se insertan con
+  `bulk_create` en una sola transacción. Así no pasan por `Producto.save` (no se
+  encolan conversiones de imagen) ni por la señal `crear_carpeta_categoria`.
+- Al terminar se regeneran la tabla de cierre y el índice de trigramas y se
+  invalidan las cachés del catálogo. El índice FTS5 lo mantienen sus triggers.
+
+Los demás modelos del fixture (p. ej. usuarios) se guardan como en `loaddata`.
+"""
+import json
+import time
+
+from django.apps import apps
+from django.core import serializers
+from django.core.exceptions import FieldDoesNotExist
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from catalogo.models import Categoria, Producto, reconstruir_jerarquia
+from catalogo.trigrams import get_backend, reconstruir_indice
+from catalogo.versioning import incrementar_version
+
+EXCLUIDOS = ['admin.logentry', 'sessions.session']
+TAMANO_LOTE = 1000
+TAMANO_BLOQUE = 64 * 1024
+_SEPARADORES = ' \t\r\n,'
+
+
+def iterar_fixture(archivo, tamano_bloque=TAMANO_BLOQUE):
+    """Genera uno a uno los objetos de la lista JSON de `archivo` sin leerlo entero."""
+    decoder = json.JSONDecoder()
+    buffer, pos = '', 0
+    abierta = False
+    while True:
+        while pos < len(buffer) and buffer[pos] in _SEPARADORES:
+            pos += 1
+        if pos == len(buffer):
+            buffer, pos = archivo.read(tamano_bloque), 0
+            if not buffer:
+                raise CommandError('El fixture termina antes de cerrar la lista.')
+            continue
+        if not abierta:
+            if buffer[pos] != '[':
+                raise CommandError('El fixture no es una lista JSON.')
+            abierta = True
+            pos += 1
+            continue
+        if buffer[pos] == ']':
+            return
+        try:
+            objeto, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # El objeto sigue en el siguiente bloque.
+            bloque = archivo.read(tamano_bloque)
+            if not bloque:
+                raise
+            buffer, pos = buffer[pos:] + bloque, 0
+            continue
+        yield objeto
+
+
+def instancia_de(modelo, objeto):
+    """Instancia sin guardar de un objeto del fixture, y sus valores many-to-many aparte."""
+    opciones = modelo._meta
+    valores = {opciones.pk.attname: opciones.pk.to_python(objeto['pk'])}
+    m2m = {}
+    for nombre, valor in objeto['fields'].items():
+        try:
+            campo = opciones.get_field(nombre)
+        except FieldDoesNotExist:
+            raise CommandError(f"{opciones.label}: el campo '{nombre}' no existe en el modelo.")
+        if campo.many_to_many:
+            m2m[nombre] = valor
+        elif campo.is_relation:
+            valores[campo.attname] = valor
+        else:
+            valores[campo.attname] = campo.to_python(valor)
+    return modelo(**valores), m2m
+
+
+def padres_primero(categorias):
+    """Ordena las categorías para que cada una vaya después de su padre."""
+    por_pk = {categoria.pk: categoria for categoria in categorias}
+
+    def profundidad(categoria):
+        nivel, vistos = 0, set()
+        while categoria.parent_id in por_pk and categoria.pk not in vistos:
+            vistos.add(categoria.pk)
+            categoria = por_pk[categoria.parent_id]
+            nivel += 1
+        return nivel
+
+    return sorted(categorias, key=lambda categoria: (profundidad(categoria), categoria.pk))
+
+
+class Command(BaseCommand):
+    help = 'Carga un fixture de dumpdata en bloque (mucho más rápido que loaddata).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('fixture', nargs='?', default='datos_limpios.json')
+        parser.add_argument(
+            '--excluir', nargs='*', default=EXCLUIDOS, metavar='APP.MODELO',
+            help=f"Modelos que no se cargan. Por defecto: {' '.join(EXCLUIDOS)}. Sin valores, se carga todo.")
+        parser.add_argument('--reemplazar', action='store_true',
+                            help='Borra las categorías y productos existentes antes de cargar.')
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        excluidos = {modelo.lower() for modelo in options['excluir']}
+        categorias, productos, accesorios, otros = [], [], [], []
+        descartados = 0
+
+        with open(options['fixture'], encoding='utf-8') as archivo:
+            for objeto in iterar_fixture(archivo):
+                etiqueta = objeto['model'].lower()
+                if etiqueta in excluidos:
+                    descartados += 1
+                elif etiqueta == 'catalogo.categoria':
+                    categorias.append(instancia_de(Categoria, objeto)[0])
+                elif etiqueta == 'catalogo.producto':
+                    producto, m2m = instancia_de(Producto, objeto)
+                    productos.append(producto)
+                    accesorios.extend((producto.pk, accesorio) for accesorio in m2m.get('accesorios', []))
+                else:
+                    try:
+                        apps.get_model(etiqueta)
+                    except LookupError:
+                        raise CommandError(f"Modelo desconocido en el fixture: '{objeto['model']}'.")
+                    otros.append(objeto)
+
+        Enlace = Producto.accesorios.through
+        with transaction.atomic():
+            if Categoria.objects.exists() or Producto.objects.exists():
+                if not options['reemplazar']:
+                    raise CommandError('La base de datos ya tiene catálogo. Usa --reemplazar para sobrescribirlo.')
+                Producto.objects.all().delete()
+                Categoria.objects.all().delete()
+
+            # Usuarios y demás: pocos objetos, se guardan como en loaddata.
+            for deserializado in serializers.deserialize('python', otros):
+                deserializado.save()
+            Categoria.objects.bulk_create(padres_primero(categorias), batch_size=TAMANO_LOTE)
+            Producto.objects.bulk_create(productos, batch_size=TAMANO_LOTE)
+            Enlace.objects.bulk_create(
+                [Enlace(from_producto_id=origen, to_producto_id=destino) for origen, destino in accesorios],
+                batch_size=TAMANO_LOTE,
+            )
+
+            # Con pk explícitos hay que poner al día las secuencias (PostgreSQL, Oracle).
+            modelos = {Categoria, Producto} | {apps.get_model(objeto['model']) for objeto in otros}
+            sentencias = connection.ops.sequence_reset_sql(no_style(), modelos)
+            if sentencias:
+                with connection.cursor() as cursor:
+                    for sentencia in sentencias:
+                        cursor.execute(sentencia)
+
+            reconstruir_jerarquia()
+            if get_backend().usa_tabla:
+                reconstruir_indice()
+
+        incrementar_version('categorias')
+        incrementar_version('productos')
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(categorias)} categorías, {len(productos)} productos, {len(accesorios)} refacciones y '
+            f'{len(otros)} objetos más cargados; {descartados} descartados. {time.monotonic() - inicio:.2f} s.'
+        ))
@@ -0,0 +1,115 @@
+# catalogo/management/commands/deduplicar_imagenes.py
+"""
+Pasa las imágenes existentes al almacenamiento por contenido (ver
+`catalogo/storage.py`) y reescribe `Producto.imagen` y `Producto.imagen_variantes`
+con los nombres nuevos.
+
+    python manage.py deduplicar_imagenes --dry-run            # solo informa
+    python manage.py deduplicar_imagenes                      # copia y reescribe rutas
+    python manage.py deduplicar_imagenes --borrar-originales  # y borra los archivos viejos
+
+Las copias repetidas (`000001_09l56tS.webp`, `000001_2FeOemB.webp`, ...) con los
+mismos bytes acaban en un único archivo.
+"""
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from catalogo.models import Producto, TrabajoImagen, marcar_modificados
+from catalogo.storage import es_nombre_por_contenido, hash_contenido, nombre_por_contenido
+from catalogo.versioning import incrementar_version
+
+TAMANO_LOTE = 500
+
+
+class Command(BaseCommand):
+    help = 'Migra las imágenes de producto al almacenamiento deduplicado por hash de contenido.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Calcula los cambios sin escribir nada.')
+        parser.add_argument('--borrar-originales', action='store_true',
+                            help='Borra los archivos viejos una vez reescritas las rutas.')
+
+    def handle(self, *args, **options):
+        if not getattr(default_storage, 'deduplica', False):
+            raise CommandError('El almacenamiento por defecto no es catalogo.storage.ContentHashStorage (revisa STORAGES).')
+        self.dry_run = options['dry_run']
+        self.nuevos = {}      # nombre viejo -> nombre por contenido (o None si falta el archivo)
+        self.bytes_antes = 0
+        self.bytes_despues = 0
+        self.contenidos = set()
+
+        productos = []
+        for producto in Producto.objects.only('id', 'imagen', 'imagen_variantes').iterator(chunk_size=TAMANO_LOTE):
+            cambiado = False
+            if producto.imagen:
+                nuevo = self.migrar(producto.imagen.name)
+                if nuevo and nuevo != producto.imagen.name:
+                    producto.imagen.name = nuevo
+                    cambiado = True
+            for variante in producto.imagen_variantes or []:
+                nuevo = self.migrar(variante['nombre'])
+                if nuevo and nuevo != variante['nombre']:
+                    variante['nombre'] = nuevo
+                    cambiado = True
+            if cambiado:
+                productos.append(producto)
+
+        faltantes = [nombre for nombre, nuevo in self.nuevos.items() if nuevo is None]
+        for nombre in faltantes:
+            self.stderr.write(f'No existe el archivo: {nombre}')
+
+        renombrados = {viejo: nuevo for viejo, nuevo in self.nuevos.items() if nuevo and nuevo != viejo}
+        if not self.dry_run and productos:
+            with transaction.atomic():
+                # bulk_update no ejecuta `Producto.save`, así que no se encolan conversiones.
+                Producto.objects.bulk_update(productos, ['imagen', 'imagen_variantes'], batch_size=TAMANO_LOTE)
+                # Cambian las URLs de las imágenes en sus páginas y en las de sus categorías.
+                marcar_modificados(productos=[producto.pk for producto in productos])
+                # Los trabajos pendientes deben apuntar al nombre nuevo o se darían por obsoletos.
+                for trabajo in TrabajoImagen.objects.filter(
+                        estado__in=[TrabajoImagen.PENDIENTE, TrabajoImagen.PROCESANDO], imagen__in=list(renombrados)):
+                    trabajo.imagen = renombrados[trabajo.imagen]
+                    trabajo.save(update_fields=['imagen'])
+            incrementar_version('productos')
+
+        borrados = 0
+        if options['borrar_originales'] and not self.dry_run:
+            for viejo in renombrados:
+                default_storage.delete(viejo)
+                borrados += 1
+
+        prefijo = '[dry-run] ' if self.dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefijo}{len(self.nuevos)} archivos referenciados, {len(self.contenidos)} contenidos distintos, '
+            f'{len(productos)} productos reescritos, {len(faltantes)} archivos faltantes, {borrados} originales borrados. '
+            f'{self.bytes_antes / 1e6:.1f} MB -> {self.bytes_despues / 1e6:.1f} MB.'
+        ))
+
+    def migrar(self, nombre):
+        """Copia `nombre` a su ruta por contenido (una sola vez por nombre) y la devuelve."""
+        if nombre in self.nuevos:
+            return self.nuevos[nombre]
+        if es_nombre_por_contenido(nombre):
+            self.nuevos[nombre] = nombre
+            if nombre not in self.contenidos and default_storage.exists(nombre):
+                tamano = default_storage.size(nombre)
+                self.bytes_antes += tamano
+                self.bytes_despues += tamano
+            self.contenidos.add(nombre)
+            return nombre
+        if not default_storage.exists(nombre):
+            self.nuevos[nombre] = None
+            return None
+
+        with default_storage.open(nombre, 'rb') as archivo:
+            nuevo = nombre_por_contenido(nombre, hash_contenido(archivo))
+            tamano = archivo.size
+            self.bytes_antes += tamano
+            if nuevo not in self.contenidos:
+                self.bytes_despues += tamano
+                if not self.dry_run:
+                    nuevo = default_storage.save(nombre, archivo)
+        self.contenidos.add(nuevo)
+        self.nuevos[nombre] = nuevo
+        return nuevo
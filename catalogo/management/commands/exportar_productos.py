@@ -0,0 +1,39 @@
+# catalogo/management/commands/exportar_productos.py
+"""
+Exporta el catálogo con las columnas de `ProductoResource` sin cargarlo entero
+en memoria (ver `catalogo/exportacion.py`).
+
+    python manage.py exportar_productos > productos.csv
+    python manage.py exportar_productos --formato jsonl --salida productos.jsonl
+    python manage.py exportar_productos --formato xlsx --salida productos.xlsx
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from catalogo import exportacion
+from catalogo.admin import ProductoResource
+
+
+class Command(BaseCommand):
+    help = 'Exporta los productos a CSV, JSON Lines o XLSX en streaming.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formato', choices=sorted(exportacion.FORMATOS), default='csv')
+        parser.add_argument('--salida', help='Archivo de salida. Por defecto, la salida estándar (no para XLSX).')
+
+    def handle(self, *args, **options):
+        formato = options['formato']
+        salida = options['salida']
+        resource = ProductoResource()
+        if formato == 'xlsx':
+            if not salida:
+                raise CommandError('El formato XLSX necesita --salida.')
+            exportacion.exportar_xlsx(resource, salida)
+            return
+        generador = exportacion.exportar_csv if formato == 'csv' else exportacion.exportar_jsonl
+        if salida:
+            with open(salida, 'w', encoding='utf-8', newline='') as archivo:
+                for trozo in generador(resource):
+                    archivo.write(trozo)
+        else:
+            for trozo in generador(resource):
+                self.stdout.write(trozo, ending='')
@@ -0,0 +1,88 @@
+# catalogo/management/commands/limpiar_media.py
+"""
+Borra los archivos de MEDIA_ROOT que ya no referencia ningún producto: imágenes
+reemplazadas, de productos borrados, originales ya convertidos o copias
+repetidas que dejó `deduplicar_imagenes`.
+
+    python manage.py limpiar_media --dry-run     # solo informa
+    python manage.py limpiar_media               # borra los huérfanos
+    python manage.py limpiar_media -v 2          # muestra cada archivo huérfano
+
+Las rutas referenciadas (`Producto.imagen`, `Producto.imagen_variantes` y las
+imágenes con conversión pendiente) se cargan en un conjunto en memoria; el
+árbol de carpetas se recorre con `os.scandir` sin listar todos los archivos a la
+vez, así que la memoria no crece con el número de archivos en disco.
+
+Los archivos modificados hace menos de `--edad-minima` minutos no se borran:
+pueden ser de una subida cuyo producto aún no se guardó. Cuando una subida
+reutiliza un archivo que ya existía, `ContentHashStorage` le pone la fecha actual.
+"""
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from catalogo.models import Producto, TrabajoImagen
+from catalogo.storage import recorrer_archivos
+
+
+def _normalizar(nombre):
+    nombre = nombre.replace('\\', '/')
+    return nombre[2:] if nombre.startswith('./') else nombre
+
+
+class Command(BaseCommand):
+    help = 'Busca (y borra) los archivos de MEDIA_ROOT que no referencia ningún producto.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Solo informa, no borra nada.')
+        parser.add_argument(
+            '--edad-minima', type=int, default=60,
+            help='Ignora archivos modificados hace menos de estos minutos (subidas en curso). Por defecto 60.')
+
+    def referenciados(self):
+        rutas = set()
+        for imagen, variantes in Producto.objects.values_list('imagen', 'imagen_variantes').iterator(chunk_size=2000):
+            if imagen:
+                rutas.add(_normalizar(imagen))
+            rutas.update(_normalizar(variante['nombre']) for variante in variantes or [])
+        # Originales que todavía espera el worker de conversión.
+        pendientes = TrabajoImagen.objects.filter(estado__in=[TrabajoImagen.PENDIENTE, TrabajoImagen.PROCESANDO])
+        rutas.update(_normalizar(imagen) for imagen in pendientes.values_list('imagen', flat=True))
+        return rutas
+
+    def handle(self, *args, **options):
+        raiz = settings.MEDIA_ROOT
+        dry_run = options['dry_run']
+        limite = time.time() - options['edad_minima'] * 60
+        referenciados = self.referenciados()
+
+        archivos = bytes_totales = huerfanos = bytes_huerfanos = recientes = 0
+        if os.path.isdir(raiz):
+            for entrada in recorrer_archivos(raiz):
+                info = entrada.stat(follow_symlinks=False)
+                archivos += 1
+                bytes_totales += info.st_size
+                nombre = _normalizar(os.path.relpath(entrada.path, raiz))
+                if nombre in referenciados:
+                    continue
+                if info.st_mtime > limite:
+                    recientes += 1
+                    continue
+                huerfanos += 1
+                bytes_huerfanos += info.st_size
+                if options['verbosity'] >= 2:
+                    self.stdout.write(f'  {nombre} ({info.st_size} bytes)')
+                if not dry_run:
+                    try:
+                        os.remove(entrada.path)
+                    except FileNotFoundError:
+                        pass
+
+        accion = 'se borrarían' if dry_run else 'borrados'
+        self.stdout.write(self.style.SUCCESS(
+            f'{archivos} archivos ({bytes_totales / 1e6:.1f} MB) revisados, {len(referenciados)} rutas referenciadas. '
+            f'Huérfanos {accion}: {huerfanos} ({bytes_huerfanos / 1e6:.1f} MB). '
+            f'{recientes} huérfanos recientes ignorados.'
+        ))
@@ -0,0 +1,54 @@
+# catalogo/management/commands/metricas_peticiones.py
+"""
+Muestra los histogramas de tiempos por vista que acumula la instrumentación de
+peticiones (ver `ferreteria/instrumentacion.py`), juntando los de todos los procesos:
+
+    python manage.py metricas_peticiones
+    python manage.py metricas_peticiones --json > metricas.json
+    python manage.py metricas_peticiones --reiniciar
+
+Los percentiles son aproximados: el límite superior del cubo del histograma.
+Los procesos vuelcan sus datos cada `INSTRUMENTACION_INTERVALO` segundos, así que
+lo más reciente puede faltar.
+"""
+import json
+
+from django.core.management.base import BaseCommand
+
+from ferreteria.instrumentacion import leer_metricas, reiniciar_metricas, resumen_metricas
+
+COLUMNAS = ('total', 'sql', 'plantillas', 'consultas')
+
+
+class Command(BaseCommand):
+    help = 'Muestra los tiempos por vista (p50/p95/p99) acumulados por el middleware de instrumentación.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Salida en JSON, con todas las métricas.')
+        parser.add_argument('--reiniciar', action='store_true', help='Borra lo acumulado y empieza de cero.')
+
+    def handle(self, *args, **options):
+        if options['reiniciar']:
+            reiniciar_metricas()
+            self.stdout.write(self.style.SUCCESS('Métricas reiniciadas.'))
+            return
+        resumen = resumen_metricas(leer_metricas())
+        if options['json']:
+            self.stdout.write(json.dumps(resumen, indent=2, ensure_ascii=False))
+            return
+        if not resumen:
+            self.stdout.write('Todavía no hay métricas.')
+            return
+
+        ancho = max(len(vista) for vista in resumen)
+        cabecera = f"{'vista':<{ancho}} {'peticiones':>10}" + ''.join(f' {columna + " p50/p95/p99":>26}' for columna in COLUMNAS)
+        self.stdout.write(cabecera)
+        for vista, metricas in resumen.items():
+            peticiones = metricas.get('total', {}).get('n', 0)
+            linea = f'{vista:<{ancho}} {peticiones:>10}'
+            for columna in COLUMNAS:
+                datos = metricas.get(columna)
+                valor = f"{datos['p50']:g}/{datos['p95']:g}/{datos['p99']:g}" if datos else '-'
+                linea += f' {valor:>26}'
+            self.stdout.write(linea)
+        self.stdout.write('Tiempos en ms; "consultas" es el número de consultas SQL por petición.')
@@ -0,0 +1,42 @@
+# catalogo/management/commands/procesar_imagenes.py
+"""
+Worker de la cola de conversión de imágenes (ver `catalogo/jobs.py`).
+
+    python manage.py procesar_imagenes              # se queda esperando trabajos
+    python manage.py procesar_imagenes --una-vez    # vacía la cola y termina (cron)
+
+Se pueden lanzar varios workers a la vez: cada trabajo se reclama una sola vez.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from catalogo.jobs import procesar_pendientes
+
+
+class Command(BaseCommand):
+    help = 'Procesa la cola de conversión de imágenes de producto.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--una-vez', action='store_true', help='Procesa lo pendiente y termina.')
+        parser.add_argument('--intervalo', type=float, default=5, help='Segundos de espera cuando la cola está vacía.')
+
+    def handle(self, *args, **options):
+        if options['una_vez']:
+            procesados = procesar_pendientes()
+            self.stdout.write(self.style.SUCCESS(f'{procesados} trabajos procesados.'))
+            return
+
+        self.stdout.write('Esperando trabajos de imágenes (Ctrl+C para salir)...')
+        try:
+            while True:
+                # Un proceso de larga duración debe descartar las conexiones caídas o viejas.
+                close_old_connections()
+                procesados = procesar_pendientes(limite=50)
+                if procesados:
+                    self.stdout.write(f'{procesados} trabajos procesados.')
+                else:
+                    time.sleep(options['intervalo'])
+        except KeyboardInterrupt:
+            self.stdout.write('Worker detenido.')
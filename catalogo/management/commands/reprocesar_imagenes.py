@@ -0,0 +1,139 @@
+# catalogo/management/commands/reprocesar_imagenes.py
+"""
+Convierte a WebP (máximo 1200px) y genera las variantes de `srcset` de las
+imágenes que ya estaban en la biblioteca, usando todos los núcleos.
+
+    python manage.py reprocesar_imagenes                  # productos sin variantes
+    python manage.py reprocesar_imagenes --todas          # todas las imágenes
+    python manage.py reprocesar_imagenes --procesos 4
+
+- Cada imagen distinta se procesa una sola vez aunque la compartan varios productos.
+- Los procesos del pool solo leen y escriben archivos; la base de datos se toca
+  una vez al final, con `bulk_update` de `imagen` e `imagen_variantes`.
+- El progreso se anota en un archivo JSON Lines (`--progreso`, por defecto
+  `progreso/reprocesar_imagenes.jsonl` en la raíz del proyecto). Si el comando se
+  interrumpe, al relanzarlo se saltan las imágenes ya hechas y solo se
+  reintentan las que fallaron.
+
+Los originales reemplazados no se borran aquí: los recoge `limpiar_media`.
+"""
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from catalogo.imagenes import MedicionMemoria, optimizar_imagen
+from catalogo.models import Producto, marcar_modificados
+from catalogo.versioning import incrementar_version
+
+TAMANO_LOTE = 500
+
+
+def _inicializar_proceso():
+    # Con el método "spawn" (macOS, Windows) el proceso hijo arranca sin Django configurado.
+    django.setup()
+
+
+def _procesar(nombre):
+    """Se ejecuta en un proceso del pool. Devuelve un dict serializable con el resultado."""
+    medicion = MedicionMemoria()
+    try:
+        nuevo, variantes = optimizar_imagen(nombre, medicion=medicion)
+    except Exception as e:
+        return {'imagen': nombre, 'error': f'{type(e).__name__}: {e}'}
+    return {'imagen': nombre, 'nuevo': nuevo, 'variantes': variantes, 'pico_mb': round(medicion.pico / 2**20, 1)}
+
+
+class Command(BaseCommand):
+    help = 'Reconvierte en paralelo las imágenes de producto y genera sus variantes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true', help='Procesa también las que ya tienen variantes.')
+        parser.add_argument('--procesos', type=int, default=os.cpu_count(), help='Procesos en paralelo.')
+        parser.add_argument('--progreso', default=os.path.join(settings.BASE_DIR, 'progreso', 'reprocesar_imagenes.jsonl'),
+                            help='Archivo donde se anota el progreso para poder reanudar.')
+        parser.add_argument('--reiniciar', action='store_true', help='Ignora el progreso anotado y empieza de cero.')
+
+    def handle(self, *args, **options):
+        ruta_progreso = options['progreso']
+        hechos = {} if options['reiniciar'] else self.leer_progreso(ruta_progreso)
+
+        productos = Producto.objects.exclude(imagen='').exclude(imagen__isnull=True)
+        if not options['todas']:
+            productos = productos.filter(imagen_variantes=[])
+        nombres = sorted(set(productos.values_list('imagen', flat=True)))
+        faltan = [nombre for nombre in nombres if nombre not in hechos]
+        self.stdout.write(
+            f'{len(nombres)} imágenes a procesar, {len(nombres) - len(faltan)} ya hechas en una ejecución anterior.')
+
+        errores = 0
+        pico = (0, None)
+        if faltan:
+            # Los procesos hijos no deben heredar la conexión abierta del padre.
+            connections.close_all()
+            inicio = time.monotonic()
+            modo = 'w' if options['reiniciar'] else 'a'
+            os.makedirs(os.path.dirname(os.path.abspath(ruta_progreso)), exist_ok=True)
+            with open(ruta_progreso, modo, encoding='utf-8') as progreso, \
+                    ProcessPoolExecutor(max_workers=options['procesos'], initializer=_inicializar_proceso) as pool:
+                for i, resultado in enumerate(pool.map(_procesar, faltan, chunksize=4), start=1):
+                    progreso.write(json.dumps(resultado) + '\n')
+                    progreso.flush()
+                    if 'error' in resultado:
+                        errores += 1
+                        self.stderr.write(f"{resultado['imagen']}: {resultado['error']}")
+                    else:
+                        hechos[resultado['imagen']] = resultado
+                        pico = max(pico, (resultado['pico_mb'], resultado['imagen']))
+                    if i % 100 == 0:
+                        self.stdout.write(f'  {i}/{len(faltan)} ({i / (time.monotonic() - inicio):.1f} imágenes/s)')
+
+        actualizados = self.guardar(hechos)
+        if pico[1]:
+            self.stdout.write(f'Mayor pico de memoria estimado: {pico[0]} MB ({pico[1]}).')
+        if errores == 0 and os.path.exists(ruta_progreso):
+            os.remove(ruta_progreso)
+        self.stdout.write(self.style.SUCCESS(
+            f'{actualizados} productos actualizados, {errores} errores.'
+            + (f' Vuelve a ejecutar el comando para reintentarlos (progreso en {ruta_progreso}).' if errores else '')
+        ))
+
+    def leer_progreso(self, ruta):
+        hechos = {}
+        if not os.path.exists(ruta):
+            return hechos
+        with open(ruta, encoding='utf-8') as archivo:
+            for linea in archivo:
+                try:
+                    resultado = json.loads(linea)
+                except ValueError:
+                    continue  # Línea a medio escribir si el proceso murió.
+                if 'error' not in resultado:
+                    hechos[resultado['imagen']] = resultado
+        return hechos
+
+    def guardar(self, hechos):
+        """Aplica los resultados a los productos que siguen teniendo la imagen original."""
+        actualizados = 0
+        nombres = list(hechos)
+        with transaction.atomic():
+            for i in range(0, len(nombres), TAMANO_LOTE):
+                lote = Producto.objects.filter(imagen__in=nombres[i:i + TAMANO_LOTE]).only('id', 'imagen', 'imagen_variantes')
+                productos = []
+                for producto in lote:
+                    resultado = hechos[producto.imagen.name]
+                    producto.imagen.name = resultado['nuevo']
+                    producto.imagen_variantes = resultado['variantes']
+                    productos.append(producto)
+                # bulk_update no ejecuta `Producto.save`, así que no se encolan conversiones.
+                Producto.objects.bulk_update(productos, ['imagen', 'imagen_variantes'], batch_size=TAMANO_LOTE)
+                marcar_modificados(productos=[producto.pk for producto in productos])
+                actualizados += len(productos)
+        if actualizados:
+            incrementar_version('productos')
+        return actualizados
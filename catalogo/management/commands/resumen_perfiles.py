@@ -0,0 +1,78 @@
+# catalogo/management/commands/resumen_perfiles.py
+"""
+Junta los perfiles que guarda el perfilador por muestreo (ver
+`ferreteria/perfilador.py`) y muestra las funciones donde más tiempo se pasa:
+
+    python manage.py resumen_perfiles
+    python manage.py resumen_perfiles --vista catalogo:producto_detalle --limite 40
+    python manage.py resumen_perfiles --motivo lento --plegadas > pilas.txt   # para flamegraph.pl / speedscope
+
+- "propio": muestras en las que la función estaba ejecutándose (la hoja de la pila).
+- "acumulado": muestras en las que la función estaba en la pila (ella o lo que llama).
+"""
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from ferreteria.perfilador import leer_perfiles
+
+
+class Command(BaseCommand):
+    help = 'Resume los perfiles de peticiones lentas: funciones con más tiempo propio y acumulado.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vista', help='Solo los perfiles de esta vista (p. ej. catalogo:producto_detalle).')
+        parser.add_argument('--motivo', choices=['lento', 'muestra'], help='Solo las peticiones lentas o las de muestra.')
+        parser.add_argument('--limite', type=int, default=20, help='Número de funciones a mostrar.')
+        parser.add_argument('--plegadas', action='store_true',
+                            help='Escribe las pilas juntas en formato plegado ("a;b;c muestras").')
+
+    def handle(self, *args, **options):
+        perfiles = [
+            perfil for perfil in leer_perfiles()
+            if (not options['vista'] or perfil['vista'] == options['vista'])
+            and (not options['motivo'] or perfil['motivo'] == options['motivo'])
+        ]
+        pilas = Counter()
+        for perfil in perfiles:
+            pilas.update(perfil['pilas'])
+
+        if options['plegadas']:
+            for pila, muestras in pilas.most_common():
+                self.stdout.write(f'{pila} {muestras}')
+            return
+        if not perfiles:
+            self.stdout.write('No hay perfiles.')
+            return
+
+        propio, acumulado = Counter(), Counter()
+        for pila, muestras in pilas.items():
+            funciones = pila.split(';')
+            propio[funciones[-1]] += muestras
+            for funcion in set(funciones):
+                acumulado[funcion] += muestras
+        total = sum(pilas.values())
+
+        por_vista = Counter(perfil['vista'] for perfil in perfiles)
+        self.stdout.write(f'{len(perfiles)} perfiles, {total} muestras: ' + ', '.join(
+            f'{vista} ({cantidad})' for vista, cantidad in por_vista.most_common()))
+        lentos = sorted(perfiles, key=lambda perfil: -perfil['duracion_ms'])[:5]
+        self.stdout.write('Más lentos: ' + ', '.join(
+            f"{perfil['ruta']}{'?' + perfil['query_string'] if perfil['query_string'] else ''} "
+            f"({perfil['duracion_ms']:g} ms)" for perfil in lentos))
+        if not total:
+            return
+
+        self.stdout.write(f"\n{'propio':>8} {'acumulado':>10}  función")
+        for funcion, muestras in propio.most_common(options['limite']):
+            self.stdout.write(f'{muestras / total:>8.1%} {acumulado[funcion] / total:>10.1%}  {funcion}')
+        self.stdout.write(f"\n{'acumulado':>10}  función (sin las de Django y la biblioteca estándar)")
+        del_proyecto = [(funcion, muestras) for funcion, muestras in acumulado.most_common() if not es_ajena(funcion)]
+        for funcion, muestras in del_proyecto[:options['limite']]:
+            self.stdout.write(f'{muestras / total:>10.1%}  {funcion}')
+
+
+def es_ajena(funcion):
+    """Las funciones de Django, del servidor y de Python llenan el acumulado sin decir nada."""
+    ruta = funcion.rsplit('(', 1)[-1]
+    return ruta.startswith(('django/', 'gunicorn/', 'asgiref/', '/', '<'))
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def crear_indice_busqueda(apps, schema_editor):
+    from catalogo.search import instalar_indice
+    instalar_indice(schema_editor.connection)
+
+
+def eliminar_indice_busqueda(apps, schema_editor):
+    from catalogo.search import get_backend
+    get_backend(schema_editor.connection).desinstalar()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogo', '0008_alter_categoria_nombre_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice_busqueda, eliminar_indice_busqueda),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:53
+
+import django.db.models.deletion
+from django.db import DatabaseError, migrations, models, transaction
+
+
+def indexar_trigramas(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        # Si podemos usar pg_trgm, la tabla local no hace falta.
+        try:
+            with transaction.atomic(using=connection.alias):
+                with connection.cursor() as cursor:
+                    cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                    cursor.execute(
+                        "CREATE INDEX IF NOT EXISTS catalogo_producto_nombre_trgm "
+                        "ON catalogo_producto USING GIN (nombre gin_trgm_ops)"
+                    )
+            return
+        except DatabaseError:
+            pass
+    from catalogo.trigrams import reconstruir_indice
+    reconstruir_indice(
+        productos=apps.get_model('catalogo', 'Producto').objects.all(),
+        trigrama_model=apps.get_model('catalogo', 'TrigramaProducto'),
+    )
+
+
+def eliminar_indice_pg_trgm(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("DROP INDEX IF EXISTS catalogo_producto_nombre_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogo', '0009_producto_busqueda_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrigramaProducto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigrama', models.CharField(max_length=3)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigramas', to='catalogo.producto')),
+            ],
+            options={
+                'verbose_name': 'Trigrama de producto',
+                'verbose_name_plural': 'Trigramas de productos',
+                'constraints': [models.UniqueConstraint(fields=('trigrama', 'producto'), name='unique_trigrama_producto')],
+            },
+        ),
+        migrations.RunPython(indexar_trigramas, eliminar_indice_pg_trgm),
+    ]
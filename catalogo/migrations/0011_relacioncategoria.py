@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def poblar_jerarquia(apps, schema_editor):
+    from catalogo.models import reconstruir_jerarquia
+    reconstruir_jerarquia(
+        categoria_model=apps.get_model('catalogo', 'Categoria'),
+        relacion_model=apps.get_model('catalogo', 'RelacionCategoria'),
+        using=schema_editor.connection.alias,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogo', '0010_trigramaproducto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelacionCategoria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('profundidad', models.PositiveSmallIntegerField()),
+                ('ancestro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='relaciones_descendiente', to='catalogo.categoria')),
+                ('descendiente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='relaciones_ancestro', to='catalogo.categoria')),
+            ],
+            options={
+                'verbose_name': 'Relación de categorías',
+                'verbose_name_plural': 'Relaciones de categorías',
+                'constraints': [models.UniqueConstraint(fields=('ancestro', 'descendiente'), name='unique_relacion_categoria')],
+            },
+        ),
+        migrations.RunPython(poblar_jerarquia, migrations.RunPython.noop),
+    ]
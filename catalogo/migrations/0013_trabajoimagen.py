@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:04
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogo', '0012_producto_imagen_variantes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoImagen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('imagen', models.CharField(max_length=255)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('completado', 'Completado'), ('fallido', 'Fallido')], default='pendiente', max_length=20)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('disponible_en', models.DateTimeField(default=django.utils.timezone.now, help_text='No se procesa antes de esta fecha (reintentos).')),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('actualizado', models.DateTimeField(default=django.utils.timezone.now)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trabajos_imagen', to='catalogo.producto')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de imagen',
+                'verbose_name_plural': 'Trabajos de imágenes',
+                'ordering': ['-creado'],
+                'indexes': [models.Index(fields=['estado', 'disponible_en'], name='trabajo_imagen_cola_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:15
+
+import catalogo.imagenes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalogo', '0013_trabajoimagen'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='producto',
+            name='imagen',
+            field=models.ImageField(blank=True, null=True, upload_to='productos_imagenes/', validators=[catalogo.imagenes.validar_imagen]),
+        ),
+    ]
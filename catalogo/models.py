@@ -2,9 +2,6 @@
 
 from django.db import models
 # --- NUEVAS IMPORTACIONES ---
-from PIL import Image
-from io import BytesIO
-from django.core.files.base import ContentFile
 import os
 # --- NUEVAS IMPORTACIONES PARA LA SEÑAL ---
 from django.db.models.signals import post_save
@@ -12,6 +9,12 @@ from django.dispatch import receiver
 from django.utils.text import slugify
 from django.db.models import Q # <-- NUEVA IMPORTACIÓN
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import router, transaction
+from django.utils import timezone
+
+from .imagenes import borrar_variantes, validar_imagen
+from .tracking import SeguimientoCambiosMixin
 
 class Empleado(models.Model):
     nombre = models.CharField(max_length=100)
@@ -24,7 +27,7 @@ class Empleado(models.Model):
     def __str__(self):
         return self.nombre
 
-class Categoria(models.Model):
+class Categoria(SeguimientoCambiosMixin, models.Model):
     # --- CAMBIO CLAVE: Quitamos unique=True de aquí ---
     nombre = models.CharField(max_length=100)
     # --- NUEVO CAMPO PARA SUBCATEGORÍAS ---
@@ -38,6 +41,10 @@ class Categoria(models.Model):
         related_name='subcategorias',
         verbose_name='Categoría Padre'
     )
+    # Última modificación de lo que muestra la página de la categoría: ella, sus
+    # subcategorías y los productos de su subárbol (ver `marcar_modificados`).
+    # La usan las respuestas 304 de `categoria_detalle`.
+    actualizado = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         # Ordena las categorías alfabéticamente para una mejor visualización en el admin.
@@ -59,18 +66,132 @@ class Categoria(models.Model):
 
     def __str__(self):
         # Mejora la visualización en el admin para mostrar la jerarquía. Ej: "Mezcladoras > De Baño"
-        return f"{self.parent.nombre} > {self.nombre}" if self.parent else self.nombre
+        if self.parent_id is None:
+            return self.nombre
+        # Tomamos la ruta del padre del árbol en memoria (ver tree.py) en lugar de
+        # consultar `self.parent`, que hacía una consulta por cada fila impresa.
+        from .tree import obtener_arbol
+        arbol = obtener_arbol()
+        if self.parent_id in arbol:
+            return f"{arbol.nombre_completo(self.parent_id)} > {self.nombre}"
+        return f"{self.parent.nombre} > {self.nombre}"
+
+    def clean(self):
+        super().clean()
+        if self.pk and self.parent_id and (
+            self.parent_id == self.pk
+            or RelacionCategoria.objects.filter(ancestro_id=self.pk, descendiente_id=self.parent_id).exists()
+        ):
+            raise ValidationError({'parent': 'Una categoría no puede ser subcategoría de sí misma ni de sus subcategorías.'})
+
+    def save(self, *args, **kwargs):
+        # --- MANTENIMIENTO DE LA TABLA DE CIERRE (RelacionCategoria) ---
+        # Solo hace falta tocarla si la categoría es nueva o si cambió de padre.
+        cambio_padre = self._state.adding or self.ha_cambiado('parent_id')
+        using = kwargs.get('using') or router.db_for_write(Categoria, instance=self)
+        marcar_actualizado(self, kwargs)
+        # Todo en una transacción: si la jerarquía no se puede actualizar, no se guarda nada.
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            if cambio_padre:
+                actualizar_jerarquia(self, using=using)
+
+    def productos_del_subarbol(self):
+        """
+        Productos de esta categoría y de todas sus subcategorías, a cualquier
+        profundidad, con una sola consulta indexada sobre la tabla de cierre.
+        """
+        return Producto.objects.filter(categoria__relaciones_ancestro__ancestro=self)
+
+# --- TABLA DE CIERRE (CLOSURE TABLE) DE LA JERARQUÍA DE CATEGORÍAS ---
+class RelacionCategoria(models.Model):
+    """
+    Una fila por cada par (ancestro, descendiente) de la jerarquía, incluida la
+    propia categoría con profundidad 0. Así, "todo lo que cuelga de Herramientas"
+    es un simple filtro `ancestro=Herramientas`, sin importar cuántos niveles haya.
+    La mantiene `Categoria.save()` dentro de la misma transacción.
+    """
+    ancestro = models.ForeignKey(Categoria, on_delete=models.CASCADE, related_name='relaciones_descendiente')
+    descendiente = models.ForeignKey(Categoria, on_delete=models.CASCADE, related_name='relaciones_ancestro')
+    profundidad = models.PositiveSmallIntegerField()
+
+    class Meta:
+        verbose_name = 'Relación de categorías'
+        verbose_name_plural = 'Relaciones de categorías'
+        constraints = [
+            models.UniqueConstraint(fields=['ancestro', 'descendiente'], name='unique_relacion_categoria'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestro_id} > {self.descendiente_id} ({self.profundidad})"
+
+
+def actualizar_jerarquia(categoria, using=None):
+    """
+    Coloca `categoria` (y todo su subárbol) bajo su padre actual en la tabla de cierre.
+    Sirve tanto para categorías nuevas como para las que cambiaron de padre.
+    """
+    relaciones = RelacionCategoria.objects.using(using)
+    # 1. El subárbol que se mueve: {descendiente: profundidad relativa}.
+    subarbol = dict(relaciones.filter(ancestro_id=categoria.pk).values_list('descendiente_id', 'profundidad'))
+    nuevas = []
+    if not subarbol:
+        subarbol = {categoria.pk: 0}
+        nuevas.append(RelacionCategoria(ancestro_id=categoria.pk, descendiente_id=categoria.pk, profundidad=0))
+    elif categoria.parent_id in subarbol:
+        raise ValueError(f'La categoría {categoria.pk} no puede colgar de una de sus subcategorías.')
+    else:
+        # 2. Quitamos los enlaces del subárbol con sus antiguos ancestros.
+        relaciones.filter(descendiente_id__in=subarbol).exclude(ancestro_id__in=subarbol).delete()
+    # 3. Enlazamos cada nodo del subárbol con cada ancestro del nuevo padre.
+    if categoria.parent_id is not None:
+        ancestros = relaciones.filter(descendiente_id=categoria.parent_id).values_list('ancestro_id', 'profundidad')
+        nuevas.extend(
+            RelacionCategoria(ancestro_id=ancestro, descendiente_id=descendiente, profundidad=p_ancestro + p_descendiente + 1)
+            for ancestro, p_ancestro in ancestros
+            for descendiente, p_descendiente in subarbol.items()
+        )
+    relaciones.bulk_create(nuevas)
+
+
+def reconstruir_jerarquia(categoria_model=None, relacion_model=None, using=None):
+    """
+    Regenera la tabla de cierre completa a partir de `parent`. Se usa en la
+    migración inicial y tras cargas que no pasan por `Categoria.save()` (loaddata,
+    bulk_create). Acepta los modelos históricos de una migración.
+    """
+    categoria_model = categoria_model or Categoria
+    relacion_model = relacion_model or RelacionCategoria
+    using = using or router.db_for_write(categoria_model)
+    padres = dict(categoria_model.objects.using(using).values_list('id', 'parent_id'))
+    filas = []
+    for pk in padres:
+        actual, profundidad, vistos = pk, 0, set()
+        while actual is not None and actual in padres and actual not in vistos:
+            filas.append(relacion_model(ancestro_id=actual, descendiente_id=pk, profundidad=profundidad))
+            vistos.add(actual)
+            actual = padres[actual]
+            profundidad += 1
+    with transaction.atomic(using=using):
+        relacion_model.objects.using(using).all().delete()
+        relacion_model.objects.using(using).bulk_create(filas, batch_size=1000)
 
-class Producto(models.Model):
+class Producto(SeguimientoCambiosMixin, models.Model):
     nombre = models.CharField(max_length=800)
     descripcion = models.TextField(blank=True, null=True)
     precio = models.DecimalField(max_digits=10, decimal_places=2)
     # Cambiado a SET_NULL para evitar borrados en cascada. Si se borra una categoría,
     # los productos asociados no se eliminarán, solo se quedarán sin categoría.
     categoria = models.ForeignKey(Categoria, on_delete=models.SET_NULL, null=True, related_name='productos')
-    imagen = models.ImageField(upload_to='productos_imagenes/', blank=True, null=True)
+    # `validar_imagen` rechaza al subirlas las imágenes de más de IMAGENES_MAX_PIXELES.
+    imagen = models.ImageField(upload_to='productos_imagenes/', blank=True, null=True, validators=[validar_imagen])
     stock = models.PositiveIntegerField(default=0)
     es_mas_vendido = models.BooleanField(default=False)
+    # Copias de la imagen en varios anchos para `srcset` (ver `imagenes.py`).
+    imagen_variantes = models.JSONField(default=list, blank=True, editable=False)
+    # Última modificación de lo que muestra la página del producto: él, su categoría
+    # y sus refacciones (ver `marcar_modificados`). La usan las respuestas 304.
+    actualizado = models.DateTimeField(default=timezone.now, editable=False)
     
     # --- CAMPO AÑADIDO PARA RELACIONAR PRODUCTOS ---
     # Este es el campo que faltaba y que causa el error.
@@ -81,6 +202,14 @@ class Producto(models.Model):
         related_name='producto_principal',
         verbose_name="Refacciones"  # <-- AÑADIMOS ESTO
     )
+
+    class Meta:
+        indexes = [
+            # Paginación por cursor de los listados por nombre (ver `paginacion.py`):
+            # cada página es un rango de uno de estos índices, sin OFFSET.
+            models.Index(fields=['categoria', 'nombre', 'id'], name='producto_categoria_nombre_idx'),
+            models.Index(fields=['nombre', 'id'], name='producto_nombre_idx'),
+        ]
     
     def __str__(self):
         return self.nombre
@@ -90,59 +219,139 @@ class Producto(models.Model):
         from django.urls import reverse
         return reverse('catalogo:producto_detalle', args=[str(self.id)])
 
-    # --- MÉTODO SAVE MODIFICADO PARA CONVERTIR IMÁGENES A WEBP ---
+    # --- MÉTODO SAVE: LA CONVERSIÓN A WEBP SE HACE EN SEGUNDO PLANO ---
     def save(self, *args, **kwargs):
-        # --- NUEVA LÓGICA PARA EVITAR DUPLICADOS EN IMPORTACIÓN ---
-        # Si el campo 'imagen' tiene un valor y no es un archivo subido (es decir, es una cadena de texto
-        # de la importación), y ya es un archivo .webp, no hacemos nada y guardamos directamente.
-        # Esto evita que el proceso de conversión se ejecute sobre imágenes que ya están en el servidor.
-        if self.imagen and not hasattr(self.imagen.file, 'content_type') and str(self.imagen.name).endswith('.webp'):
-            super().save(*args, **kwargs)
-            return
-
-        # Primero, verificamos si el objeto ya existe en la BD para comparar la imagen.
-        if self.pk:
-            try:
-                old_instance = Producto.objects.get(pk=self.pk)
-                # Si la imagen no ha cambiado, simplemente guardamos y salimos.
-                if old_instance.imagen == self.imagen:
-                    super().save(*args, **kwargs)
-                    return
-            except Producto.DoesNotExist:
-                # Esto ocurre si el objeto se está creando, así que continuamos.
-                pass
-
-        # Si llegamos aquí, es un producto nuevo o la imagen ha sido actualizada.
-        # Procedemos a la conversión solo si hay una imagen.
+        # Guardamos la imagen original tal cual y encolamos su conversión (ver `jobs.py`):
+        # redimensionar y codificar WebP tarda segundos y no debe bloquear la petición.
+        # El worker `procesar_imagenes` la reemplaza por la versión optimizada al terminar.
+        marcar_actualizado(self, kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'imagen' not in update_fields:
+            # Guardado parcial (p. ej. precio/stock desde el admin): la imagen no se toca.
+            return super().save(*args, **kwargs)
+
+        imagen_cambiada = False
         if self.imagen:
-            # Abrimos la imagen en memoria con Pillow
-            img = Image.open(self.imagen)
-            
-            # --- NUEVO: Redimensionar la imagen si es muy grande ---
-            # Definimos un ancho máximo. 1200px es un buen valor para imágenes de producto.
-            max_width = 1200
-            if img.width > max_width:
-                # Calculamos el alto proporcional para no deformar la imagen
-                new_height = int((max_width / img.width) * img.height)
-                img = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
-
-            # Creamos un buffer en memoria para la nueva imagen
-            buffer = BytesIO()
-
-            # Guardamos la imagen en el buffer en formato WebP.
-            # `quality=80` es un buen balance entre calidad y tamaño. `optimize=True` ayuda un poco más.
-            img.save(buffer, format='WEBP', quality=80)
-
-            # Obtenemos el nombre del archivo original sin la extensión
-            filename = os.path.splitext(os.path.basename(self.imagen.name))[0]
-            new_filename = f"{filename}.webp"
-
-            # Reemplazamos la imagen original con la nueva versión WebP en memoria.
-            # `save=False` es crucial para evitar un bucle infinito de guardado.
-            self.imagen.save(new_filename, ContentFile(buffer.getvalue()), save=False)
-
-        # Finalmente, llamamos al método de guardado original.
-        super().save(*args, **kwargs)
+            if not self.imagen._committed or self._state.adding:
+                # Archivo recién subido, o producto nuevo (por ejemplo, desde una importación).
+                imagen_cambiada = True
+            elif self.tiene_valor_cargado('imagen'):
+                # Comparamos con el valor con que se cargó la instancia: sin consulta extra.
+                imagen_cambiada = self.ha_cambiado('imagen')
+            else:
+                # Instancia creada a mano con un pk existente: no sabemos qué había guardado.
+                anterior = Producto.objects.filter(pk=self.pk).values_list('imagen', flat=True).first()
+                imagen_cambiada = anterior != self.imagen.name
+
+        # Las variantes de la imagen anterior ya no corresponden: las tarjetas usarán
+        # la imagen original hasta que el worker genere las nuevas.
+        if (imagen_cambiada or not self.imagen) and self.imagen_variantes:
+            borrar_variantes(self.imagen_variantes)
+            self.imagen_variantes = []
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'imagen_variantes'}
+
+        if not imagen_cambiada:
+            return super().save(*args, **kwargs)
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(Producto, instance=self)):
+            super().save(*args, **kwargs)
+            from .jobs import encolar_conversion
+            encolar_conversion(self)
+
+def marcar_actualizado(instancia, kwargs_save):
+    """Pone `actualizado` a ahora antes de `save()`, también en los guardados parciales."""
+    instancia.actualizado = timezone.now()
+    update_fields = kwargs_save.get('update_fields')
+    if update_fields is not None:
+        kwargs_save['update_fields'] = {*update_fields, 'actualizado'}
+
+
+def marcar_modificados(productos=(), categorias=(), using=None):
+    """
+    Pone `actualizado` a ahora en los productos `productos` (ids), en las categorías
+    `categorias` y en las de esos productos, con todos sus ancestros: las portadas y
+    los listados de subcategorías dependen de todo el subárbol.
+
+    Lo llaman las señales y los caminos que escriben sin `save()` (`update`,
+    `bulk_update`). Con solo categorías es una consulta; con productos, dos más
+    por cada 1000.
+    Los cambios de un producto que se ven en las páginas de sus refacciones se
+    comprueban al leer (ver `views.ultima_modificacion_producto`).
+    """
+    ahora = timezone.now()
+    productos = [pk for pk in productos if pk is not None]
+    categorias = {pk for pk in categorias if pk is not None}
+    # En lotes, para no pasar del límite de parámetros por consulta de SQLite.
+    for i in range(0, len(productos), 1000):
+        lote = productos[i:i + 1000]
+        Producto.objects.using(using).filter(pk__in=lote).update(actualizado=ahora)
+        categorias.update(
+            Producto.objects.using(using).filter(pk__in=lote, categoria__isnull=False)
+            .values_list('categoria_id', flat=True).distinct())
+    if categorias:
+        Categoria.objects.using(using).filter(
+            relaciones_descendiente__descendiente_id__in=categorias
+        ).update(actualizado=ahora)
+
+
+# --- COLA DE CONVERSIÓN DE IMÁGENES ---
+class TrabajoImagen(models.Model):
+    """
+    Conversión pendiente de la imagen de un producto (ver `jobs.py`). La cola vive
+    en la base de datos para no depender de un broker externo.
+    """
+    PENDIENTE = 'pendiente'
+    PROCESANDO = 'procesando'
+    COMPLETADO = 'completado'
+    FALLIDO = 'fallido'
+    ESTADOS = [
+        (PENDIENTE, 'Pendiente'),
+        (PROCESANDO, 'Procesando'),
+        (COMPLETADO, 'Completado'),
+        (FALLIDO, 'Fallido'),
+    ]
+
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='trabajos_imagen')
+    # Imagen que había que convertir al encolar; si el producto ya tiene otra, el trabajo está obsoleto.
+    imagen = models.CharField(max_length=255)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=PENDIENTE)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    disponible_en = models.DateTimeField(default=timezone.now, help_text='No se procesa antes de esta fecha (reintentos).')
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Trabajo de imagen'
+        verbose_name_plural = 'Trabajos de imágenes'
+        ordering = ['-creado']
+        indexes = [
+            models.Index(fields=['estado', 'disponible_en'], name='trabajo_imagen_cola_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.imagen} ({self.get_estado_display()})"
+
+# --- ÍNDICE DE TRIGRAMAS PARA BÚSQUEDA TOLERANTE A ERRORES ---
+class TrigramaProducto(models.Model):
+    """
+    Índice local de trigramas del nombre de cada producto (ver `trigrams.py`).
+    Permite encontrar "desarmador" cuando el cliente escribe "desarmadr".
+    En PostgreSQL con `pg_trgm` disponible esta tabla no se usa.
+    """
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='trigramas')
+    trigrama = models.CharField(max_length=3)
+
+    class Meta:
+        verbose_name = 'Trigrama de producto'
+        verbose_name_plural = 'Trigramas de productos'
+        constraints = [
+            # El índice empieza por `trigrama` porque las búsquedas filtran por él.
+            models.UniqueConstraint(fields=['trigrama', 'producto'], name='unique_trigrama_producto'),
+        ]
+
+    def __str__(self):
+        return f"{self.trigrama!r} -> {self.producto_id}"
 
 # --- SEÑAL PARA CREAR CARPETAS AUTOMÁTICAMENTE ---
 @receiver(post_save, sender=Categoria)
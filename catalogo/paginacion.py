@@ -0,0 +1,144 @@
+# catalogo/paginacion.py
+"""
+Paginación por cursor (keyset) para los listados de productos ordenados por nombre.
+
+`Paginator` cuenta todas las filas (`COUNT(*)`) y salta las de las páginas
+anteriores con `OFFSET`: la página 200 de una categoría grande obliga a la base de
+datos a recorrer 2400 productos para tirarlos. Aquí cada página recuerda dónde
+terminó (el `nombre` y el `id` de su último producto) y la siguiente pide
+"los 12 siguientes a ese" con el índice (`categoria`, `nombre`, `id`): la página
+200 cuesta lo mismo que la primera.
+
+El cursor va en la URL (`?cursor=...`) codificado en base64 para que sea opaco:
+la plantilla solo lo copia en los enlaces "Anterior" / "Siguiente". Un cursor
+inválido o manipulado muestra la primera página, como `Paginator.get_page`
+con un número de página inválido.
+
+No hay números de página ni "página X de Y". El total es opcional y aproximado:
+se cuentan como mucho `PAGINACION_CONTAR_HASTA` productos ("más de 1000").
+"""
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.db.models import Q
+
+ADELANTE = 's'
+ATRAS = 'a'
+
+
+def codificar_cursor(direccion, nombre, pk):
+    datos = json.dumps([direccion, nombre, pk], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(datos.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """(dirección, nombre, id) o None si el cursor no es válido."""
+    if not cursor:
+        return None
+    try:
+        datos = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direccion, nombre, pk = json.loads(datos.decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        return None
+    if direccion not in (ADELANTE, ATRAS) or not isinstance(nombre, str) or type(pk) is not int:
+        return None
+    return direccion, nombre, pk
+
+
+class PaginaCursor:
+    """
+    Una página de `PaginadorCursor`. Se usa en las plantillas como una `Page` de
+    Django (`{% if productos %}`, `{% for producto in productos %}`,
+    `productos.has_other_pages`), más `cursor_anterior` / `cursor_siguiente`.
+    """
+
+    def __init__(self, object_list, paginador, has_previous, has_next):
+        self.object_list = object_list
+        self.paginator = paginador
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __repr__(self):
+        return f'<PaginaCursor de {len(self)} elementos>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, indice):
+        return self.object_list[indice]
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    @property
+    def cursor_anterior(self):
+        if not self._has_previous or not self.object_list:
+            return None
+        primero = self.object_list[0]
+        return codificar_cursor(ATRAS, primero.nombre, primero.pk)
+
+    @property
+    def cursor_siguiente(self):
+        if not self._has_next or not self.object_list:
+            return None
+        ultimo = self.object_list[-1]
+        return codificar_cursor(ADELANTE, ultimo.nombre, ultimo.pk)
+
+
+class PaginadorCursor:
+    """
+    Pagina `queryset` por (`nombre`, `id`), descartando el orden que traiga.
+
+    `contar_hasta` limita el conteo del total (por defecto `PAGINACION_CONTAR_HASTA`;
+    0 para no contar).
+    """
+
+    def __init__(self, queryset, por_pagina, contar_hasta=None):
+        self.queryset = queryset
+        self.por_pagina = por_pagina
+        self.contar_hasta = settings.PAGINACION_CONTAR_HASTA if contar_hasta is None else contar_hasta
+
+    def get_page(self, cursor):
+        posicion = decodificar_cursor(cursor)
+        if posicion is None:
+            filas = list(self.queryset.order_by('nombre', 'id')[:self.por_pagina + 1])
+            return PaginaCursor(filas[:self.por_pagina], self, False, len(filas) > self.por_pagina)
+
+        direccion, nombre, pk = posicion
+        if direccion == ADELANTE:
+            # `nombre >= x` es un rango del índice; la segunda condición solo descarta
+            # los empates ya mostrados. Con un OR de primer nivel la base de datos
+            # recorrería el índice desde el principio.
+            despues = Q(nombre__gte=nombre) & (Q(nombre__gt=nombre) | Q(id__gt=pk))
+            filas = list(self.queryset.filter(despues).order_by('nombre', 'id')[:self.por_pagina + 1])
+            return PaginaCursor(filas[:self.por_pagina], self, True, len(filas) > self.por_pagina)
+
+        antes = Q(nombre__lte=nombre) & (Q(nombre__lt=nombre) | Q(id__lt=pk))
+        filas = list(self.queryset.filter(antes).order_by('-nombre', '-id')[:self.por_pagina + 1])
+        hay_anteriores = len(filas) > self.por_pagina
+        return PaginaCursor(filas[:self.por_pagina][::-1], self, hay_anteriores, True)
+
+    @property
+    def total(self):
+        """Número de elementos, hasta `contar_hasta` (None si no se cuenta)."""
+        if not self.contar_hasta:
+            return None
+        if not hasattr(self, '_total'):
+            self._total = self.queryset.order_by()[:self.contar_hasta + 1].count()
+        return min(self._total, self.contar_hasta)
+
+    @property
+    def total_aproximado(self):
+        """True si hay más elementos que los contados."""
+        return self.total is not None and self._total > self.contar_hasta
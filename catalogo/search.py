@@ -0,0 +1,263 @@
+# catalogo/search.py
+"""
+Motor de búsqueda de texto completo para los productos del catálogo.
+
+En SQLite usamos una tabla virtual FTS5 (con contenido externo apuntando a
+`catalogo_producto`) y en PostgreSQL una columna `tsvector` con índice GIN.
+En ambos casos el índice lo mantienen triggers de la base de datos, así que
+también se actualiza con `bulk_create`, `queryset.update()` o `loaddata`.
+Los resultados se ordenan por relevancia (el nombre pesa más que la descripción)
+y la búsqueda ignora mayúsculas y acentos.
+"""
+import re
+
+from django.conf import settings
+from django.db import OperationalError, connection as default_connection
+from django.db.models import Case, IntegerField, When
+
+from .trigrams import buscar_similares
+
+FTS_TABLE = 'catalogo_producto_fts'
+
+# Extrae las palabras del término de búsqueda. Solo caracteres de palabra, así que
+# el resultado es seguro para construir la expresión MATCH / tsquery.
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# --- SQL PARA SQLITE (FTS5) ---
+# `remove_diacritics 2` hace que "electrico" encuentre "Eléctrico".
+_SQLITE_TRIGGERS = {
+    f'{FTS_TABLE}_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON catalogo_producto BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, nombre, descripcion)
+            VALUES (new.id, new.nombre, new.descripcion);
+        END
+    """,
+    f'{FTS_TABLE}_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON catalogo_producto BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, nombre, descripcion)
+            VALUES ('delete', old.id, old.nombre, old.descripcion);
+        END
+    """,
+    f'{FTS_TABLE}_au': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF nombre, descripcion ON catalogo_producto BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, nombre, descripcion)
+            VALUES ('delete', old.id, old.nombre, old.descripcion);
+            INSERT INTO {FTS_TABLE}(rowid, nombre, descripcion)
+            VALUES (new.id, new.nombre, new.descripcion);
+        END
+    """,
+}
+
+# --- SQL PARA POSTGRESQL (tsvector + GIN) ---
+_POSTGRES_SETUP = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    "ALTER TABLE catalogo_producto ADD COLUMN IF NOT EXISTS busqueda tsvector",
+    """
+    CREATE OR REPLACE FUNCTION catalogo_producto_busqueda_trigger() RETURNS trigger AS $$
+    BEGIN
+        NEW.busqueda :=
+            setweight(to_tsvector(%(config)s::regconfig, unaccent(coalesce(NEW.nombre, ''))), 'A') ||
+            setweight(to_tsvector(%(config)s::regconfig, unaccent(coalesce(NEW.descripcion, ''))), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS catalogo_producto_busqueda_update ON catalogo_producto",
+    """
+    CREATE TRIGGER catalogo_producto_busqueda_update
+        BEFORE INSERT OR UPDATE OF nombre, descripcion ON catalogo_producto
+        FOR EACH ROW EXECUTE FUNCTION catalogo_producto_busqueda_trigger()
+    """,
+    # Forzamos el trigger sobre las filas existentes para poblar la columna.
+    "UPDATE catalogo_producto SET nombre = nombre",
+    "CREATE INDEX IF NOT EXISTS catalogo_producto_busqueda_gin ON catalogo_producto USING GIN (busqueda)",
+]
+
+
+def _tokens(query):
+    return _TOKEN_RE.findall(query or '')
+
+
+class BaseSearchBackend:
+    """Búsqueda simple con `icontains`. Se usa cuando no hay índice disponible."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def instalar(self):
+        """Crea (o repara) el índice en la base de datos. Debe ser idempotente."""
+
+    def desinstalar(self):
+        """Elimina el índice de la base de datos."""
+
+    def disponible(self):
+        return True
+
+    def buscar(self, queryset, query):
+        for token in _tokens(query):
+            queryset = queryset.filter(nombre__icontains=token)
+        return queryset.order_by('nombre', 'id')
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """Búsqueda con la extensión FTS5 de SQLite, ordenada con bm25."""
+
+    def _existe(self, tipo, nombre):
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = %s AND name = %s", [tipo, nombre])
+            return cursor.fetchone() is not None
+
+    def instalar(self):
+        with self.connection.cursor() as cursor:
+            if not self._existe('table', FTS_TABLE):
+                try:
+                    cursor.execute(
+                        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                        "nombre, descripcion, content='catalogo_producto', content_rowid='id', "
+                        "tokenize='unicode61 remove_diacritics 2')"
+                    )
+                except OperationalError:
+                    # SQLite compilado sin FTS5: nos quedamos con la búsqueda simple.
+                    return
+                reconstruir = True
+            else:
+                # Si una migración posterior reconstruyó `catalogo_producto` (SQLite lo hace
+                # en muchos ALTER), los triggers se pierden y el índice queda desfasado.
+                reconstruir = not all(self._existe('trigger', nombre) for nombre in _SQLITE_TRIGGERS)
+            for sql in _SQLITE_TRIGGERS.values():
+                cursor.execute(sql)
+            if reconstruir:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+    def desinstalar(self):
+        with self.connection.cursor() as cursor:
+            for nombre in _SQLITE_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {nombre}")
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+    def disponible(self):
+        return self._existe('table', FTS_TABLE)
+
+    def buscar(self, queryset, query):
+        tokens = _tokens(query)
+        if not tokens:
+            return queryset.none()
+        # Cada palabra se busca como prefijo: "tala elec" -> "tala"* "elec"*
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = catalogo_producto.id', f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+            # bm25 devuelve valores negativos: cuanto menor, más relevante.
+            select={'rank': f'bm25({FTS_TABLE}, 10.0, 1.0)'},
+            order_by=['rank', 'nombre', 'id'],
+        )
+
+
+class PostgresFTSBackend(BaseSearchBackend):
+    """Búsqueda con `tsvector` e índice GIN en PostgreSQL."""
+
+    def instalar(self):
+        config = settings.BUSQUEDA_CONFIG_POSTGRES
+        with self.connection.cursor() as cursor:
+            for sql in _POSTGRES_SETUP:
+                if '%(config)s' in sql:
+                    cursor.execute(sql, {'config': config})
+                else:
+                    cursor.execute(sql)
+
+    def desinstalar(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER IF EXISTS catalogo_producto_busqueda_update ON catalogo_producto")
+            cursor.execute("DROP FUNCTION IF EXISTS catalogo_producto_busqueda_trigger()")
+            cursor.execute("DROP INDEX IF EXISTS catalogo_producto_busqueda_gin")
+            cursor.execute("ALTER TABLE catalogo_producto DROP COLUMN IF EXISTS busqueda")
+
+    def disponible(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_name = 'catalogo_producto' AND column_name = 'busqueda'"
+            )
+            return cursor.fetchone() is not None
+
+    def buscar(self, queryset, query):
+        tokens = _tokens(query)
+        if not tokens:
+            return queryset.none()
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+        config = settings.BUSQUEDA_CONFIG_POSTGRES
+        return queryset.extra(
+            where=['catalogo_producto.busqueda @@ to_tsquery(%s::regconfig, unaccent(%s))'],
+            params=[config, tsquery],
+            select={'rank': 'ts_rank(catalogo_producto.busqueda, to_tsquery(%s::regconfig, unaccent(%s)))'},
+            select_params=[config, tsquery],
+            order_by=['-rank', 'nombre', 'id'],
+        )
+
+
+_BACKENDS = {
+    'sqlite': SQLiteFTSBackend,
+    'postgresql': PostgresFTSBackend,
+}
+
+# Cache por alias de conexión de si el índice está instalado, para no consultar
+# el catálogo del sistema en cada búsqueda.
+_disponibilidad = {}
+
+
+def get_backend(connection=None):
+    connection = connection or default_connection
+    backend_class = _BACKENDS.get(connection.vendor, BaseSearchBackend)
+    return backend_class(connection)
+
+
+def instalar_indice(connection=None):
+    """Crea o repara el índice de búsqueda. Se llama desde la migración y tras `migrate`."""
+    backend = get_backend(connection)
+    backend.instalar()
+    _disponibilidad.pop(backend.connection.alias, None)
+
+
+def buscar_productos(query, queryset=None):
+    """
+    Devuelve un queryset de productos que coinciden con `query`, ordenado por relevancia.
+    Si se pasa `queryset`, la búsqueda se restringe a él (por ejemplo, a una categoría).
+    """
+    from .models import Producto
+
+    if queryset is None:
+        queryset = Producto.objects.all()
+    backend = get_backend(default_connection)
+    alias = backend.connection.alias
+    if alias not in _disponibilidad:
+        _disponibilidad[alias] = backend.disponible()
+    if not _disponibilidad[alias]:
+        backend = BaseSearchBackend(backend.connection)
+    return backend.buscar(queryset, query)
+
+
+def buscar_productos_tolerante(query, queryset=None):
+    """
+    Como `buscar_productos`, pero si la búsqueda exacta encuentra menos de
+    `BUSQUEDA_MIN_RESULTADOS_EXACTOS` productos, completa los resultados con los
+    nombres más parecidos según el índice de trigramas ("mescladora" -> "Mezcladora").
+    """
+    from .models import Producto
+
+    if queryset is None:
+        queryset = Producto.objects.all()
+    exactos = buscar_productos(query, queryset)
+    minimo = settings.BUSQUEDA_MIN_RESULTADOS_EXACTOS
+    ids = list(exactos.values_list('id', flat=True)[:minimo])
+    if len(ids) >= minimo:
+        return exactos
+
+    for pk, _similitud in buscar_similares(query, settings.BUSQUEDA_MAX_RESULTADOS_APROXIMADOS, queryset):
+        if pk not in ids:
+            ids.append(pk)
+    if not ids:
+        return queryset.none()
+    # Conservamos el orden: primero los exactos y luego los aproximados por similitud.
+    orden = Case(*[When(id=pk, then=posicion) for posicion, pk in enumerate(ids)], output_field=IntegerField())
+    return queryset.filter(id__in=ids).order_by(orden)
@@ -0,0 +1,105 @@
+# catalogo/signals.py
+"""
+Señales que invalidan los cachés del catálogo cuando cambian los datos y que
+mantienen la fecha `actualizado` de las páginas afectadas (respuestas 304).
+Se registran desde `CatalogoConfig.ready()`.
+"""
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Categoria, Producto, marcar_modificados, reconstruir_jerarquia
+from .trigrams import actualizar_trigramas
+from .versioning import incrementar_version_al_confirmar
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+@receiver(m2m_changed, sender=Producto.accesorios.through)
+def invalidar_productos(sender, **kwargs):
+    # El índice de sugerencias de cada proceso se reconstruirá en su siguiente petición
+    # y las páginas cacheadas del catálogo dejan de usarse (su clave incluye la versión).
+    if kwargs.get('action', 'post_').startswith('post_'):
+        incrementar_version_al_confirmar('productos', using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=Producto)
+def indexar_trigramas_producto(sender, instance, created, **kwargs):
+    # Los borrados no necesitan nada: los trigramas se eliminan en cascada.
+    # Si el nombre no cambió (p. ej. al editar precio o stock) no hay nada que reindexar.
+    if created or instance.ha_cambiado('nombre'):
+        actualizar_trigramas(instance, created=created)
+
+
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def invalidar_categorias(sender, **kwargs):
+    # El árbol de categorías en memoria (tree.py) se reconstruirá en la siguiente petición.
+    incrementar_version_al_confirmar('categorias', using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=Categoria)
+def jerarquia_tras_carga(sender, raw=False, using=None, **kwargs):
+    # `loaddata` guarda con raw=True y no pasa por Categoria.save(), así que
+    # regeneramos la tabla de cierre (son unas decenas de filas).
+    if raw:
+        reconstruir_jerarquia(using=using)
+
+
+@receiver(post_save, sender=Producto)
+def marcar_producto(sender, instance, created, raw=False, using=None, **kwargs):
+    # `save()` ya puso su fecha; faltan su categoría (y la anterior, si cambió),
+    # que lo muestran en el listado o en las portadas.
+    if raw:
+        return
+    anterior = None if created else instance.valor_cargado('categoria_id')
+    marcar_modificados(categorias=[instance.categoria_id, anterior], using=using)
+
+
+@receiver(pre_delete, sender=Producto)
+def marcar_producto_borrado(sender, instance, using=None, **kwargs):
+    # Antes de borrar, mientras aún existen sus enlaces: las páginas de sus
+    # refacciones y de los productos de los que es refacción lo dejan de mostrar.
+    Producto.objects.using(using).filter(
+        Q(accesorios=instance) | Q(producto_principal=instance)
+    ).update(actualizado=timezone.now())
+    marcar_modificados(categorias=[instance.categoria_id], using=using)
+
+
+@receiver(m2m_changed, sender=Producto.accesorios.through)
+def marcar_refacciones(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+    # Cambian las dos puntas: "Refacciones" de una y "Compatible con" de la otra.
+    # Para `clear` se mira antes quiénes estaban enlazados.
+    if action == 'pre_clear':
+        relacion = instance.producto_principal if reverse else instance.accesorios
+        pk_set = set(relacion.using(using).values_list('pk', flat=True))
+    elif action not in ('post_add', 'post_remove'):
+        return
+    Producto.objects.using(using).filter(pk__in=[instance.pk, *pk_set]).update(actualizado=timezone.now())
+
+
+@receiver(post_save, sender=Categoria)
+def marcar_categoria(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    categorias = [instance.pk]
+    if not created:
+        padre_anterior = instance.valor_cargado('parent_id')
+        movida = padre_anterior != instance.parent_id
+        if movida:
+            categorias.append(padre_anterior)
+        if movida or instance.ha_cambiado('nombre'):
+            # Las migas de pan de todo el subárbol muestran su nombre y su ruta,
+            # y la página de cada producto suyo, su nombre.
+            ahora = timezone.now()
+            Categoria.objects.using(using).filter(relaciones_ancestro__ancestro=instance).update(actualizado=ahora)
+            Producto.objects.using(using).filter(categoria=instance).update(actualizado=ahora)
+    marcar_modificados(categorias=categorias, using=using)
+
+
+@receiver(pre_delete, sender=Categoria)
+def marcar_categoria_borrada(sender, instance, using=None, **kwargs):
+    # Sus productos se quedan sin categoría (SET_NULL, sin señales) y el padre pierde una subcategoría.
+    Producto.objects.using(using).filter(categoria=instance).update(actualizado=timezone.now())
+    marcar_modificados(categorias=[instance.parent_id], using=using)
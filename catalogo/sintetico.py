@@ -0,0 +1,94 @@
+# catalogo/sintetico.py
+"""
+Catálogos sintéticos reproducibles para medir rendimiento (`benchmark_catalogo`)
+y para las pruebas.
+
+    generar_catalogo(10_000, semilla=1)
+
+crea un árbol de categorías de varios niveles (los productos cuelgan de las
+hojas), productos con nombres de ferretería combinados, imágenes en el 80% de
+ellos, refacciones y algunos "más vendidos". La misma semilla produce siempre
+el mismo catálogo. Todo se inserta en bloque, sin señales; al final se ponen
+al día la tabla de cierre, los trigramas y las versiones del catálogo, igual
+que en `cargar_catalogo`.
+"""
+import random
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import Categoria, Producto, reconstruir_jerarquia
+from .trigrams import get_backend, reconstruir_indice
+from .versioning import incrementar_version
+
+TAMANO_LOTE = 1000
+
+TIPOS = [
+    'Taladro', 'Martillo', 'Desarmador', 'Llave', 'Pinza', 'Sierra', 'Lija', 'Broca', 'Tornillo',
+    'Clavo', 'Manguera', 'Mezcladora', 'Regadera', 'Candado', 'Cerradura', 'Bisagra', 'Brocha',
+    'Rodillo', 'Cinta', 'Flexómetro', 'Nivel', 'Escalera', 'Foco', 'Contacto', 'Apagador', 'Cable',
+]
+DETALLES = [
+    'inalámbrico', 'de acero', 'de latón', 'industrial', 'profesional', 'para madera', 'para metal',
+    'de baño', 'de cocina', 'reforzado', 'ajustable', 'magnético', 'de uso rudo', 'cromado', 'compacto',
+]
+MARCAS = ['Truper', 'Pretul', 'Foset', 'Dofoset', 'Urrea', 'Surtek', 'Volteck', 'Hermex', 'Rugo']
+RAMAS = ['Herramientas', 'Plomería', 'Electricidad', 'Pintura', 'Cerrajería', 'Jardinería', 'Tornillería', 'Iluminación']
+
+
+def generar_catalogo(productos, semilla=0, raices=len(RAMAS), ramas=3, profundidad=3, max_refacciones=3):
+    """
+    Inserta un catálogo sintético de `productos` productos en la base de datos (que
+    debería estar vacía) y devuelve (categorías, ids de productos).
+    `profundidad` es el número de niveles por debajo de las raíces.
+    """
+    aleatorio = random.Random(semilla)
+    with transaction.atomic():
+        # Las categorías se crean nivel a nivel para conocer el pk del padre.
+        nivel = Categoria.objects.bulk_create(
+            [Categoria(nombre=RAMAS[i % len(RAMAS)] + ('' if i < len(RAMAS) else f' {i}')) for i in range(raices)])
+        categorias = list(nivel)
+        for profundidad_actual in range(1, profundidad + 1):
+            nivel = Categoria.objects.bulk_create([
+                Categoria(nombre=f'{padre.nombre.split(" ")[0]} {profundidad_actual}.{j + 1}', parent=padre)
+                for padre in nivel for j in range(ramas)
+            ])
+            categorias.extend(nivel)
+        hojas = nivel
+        reconstruir_jerarquia()
+
+        ids = []
+        lote = []
+        for i in range(productos):
+            tipo = aleatorio.choice(TIPOS)
+            nombre = f'{tipo} {aleatorio.choice(DETALLES)} {aleatorio.choice(MARCAS)} {i:06d}'
+            lote.append(Producto(
+                nombre=nombre,
+                descripcion=f'{tipo} {aleatorio.choice(DETALLES)} de la marca {aleatorio.choice(MARCAS)}.',
+                precio=Decimal(aleatorio.randint(500, 500000)) / 100,
+                categoria=hojas[i % len(hojas)],
+                imagen=f'productos_imagenes/sintetico/{i:06d}.webp' if aleatorio.random() < 0.8 else '',
+                stock=aleatorio.choice([0, 0, 1, 5, 20, 100]),
+                es_mas_vendido=aleatorio.random() < 0.05,
+            ))
+            if len(lote) >= TAMANO_LOTE:
+                ids.extend(p.pk for p in Producto.objects.bulk_create(lote))
+                lote = []
+        ids.extend(p.pk for p in Producto.objects.bulk_create(lote))
+        if None in ids:
+            # La base de datos no devuelve los pk de bulk_create (MySQL): los leemos.
+            ids = list(Producto.objects.order_by('pk').values_list('pk', flat=True))
+
+        Enlace = Producto.accesorios.through
+        enlaces = []
+        for origen in ids:
+            for destino in set(aleatorio.sample(ids, min(len(ids), aleatorio.randint(0, max_refacciones)))):
+                if destino != origen:
+                    enlaces.append(Enlace(from_producto_id=origen, to_producto_id=destino))
+        Enlace.objects.bulk_create(enlaces, batch_size=TAMANO_LOTE)
+
+        if get_backend().usa_tabla:
+            reconstruir_indice()
+    incrementar_version('categorias')
+    incrementar_version('productos')
+    return categorias, ids
@@ -0,0 +1,105 @@
+# catalogo/storage.py
+"""
+Almacenamiento de archivos direccionado por contenido.
+
+Cada archivo se guarda con el nombre del hash SHA-256 de sus bytes, dentro de
+la carpeta que pida el campo y repartido en subcarpetas por los dos primeros
+caracteres del hash:
+
+    productos_imagenes/taladro.png -> productos_imagenes/3f/3fa9...c2.png
+
+- Dos productos con la misma imagen comparten un único archivo.
+- Volver a guardar los mismos bytes no escribe nada: el archivo ya existe.
+- Como el contenido de un nombre nunca cambia, se puede servir con cabeceras de
+  caché "immutable" a un año (ver `servir_media` y el ejemplo de nginx en settings).
+
+Como un archivo puede estar compartido, este almacenamiento no se usa para
+borrar archivos sueltos (`deduplica = True`); los que ya no referencia ningún
+producto los elimina `manage.py limpiar_media`.
+"""
+import hashlib
+import os
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.views.static import serve
+
+# Longitud del hash en el nombre: 32 caracteres hexadecimales (128 bits) son más que
+# suficientes y mantienen las rutas por debajo de los 100 caracteres del ImageField.
+LONGITUD_HASH = 32
+
+_NOMBRE_POR_CONTENIDO_RE = re.compile(r'(^|/)([0-9a-f]{2})/\2[0-9a-f]{%d}\.\w+$' % (LONGITUD_HASH - 2))
+
+CACHE_CONTROL_INMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def hash_contenido(content):
+    """SHA-256 (recortado) de un archivo de Django, leyendo por bloques."""
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for bloque in content.chunks():
+        digest.update(bloque)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()[:LONGITUD_HASH]
+
+
+def nombre_por_contenido(nombre, digest):
+    carpeta = os.path.dirname(nombre)
+    if es_nombre_por_contenido(nombre):
+        # Ya era un nombre por contenido: no anidamos otra subcarpeta de hash.
+        carpeta = os.path.dirname(carpeta)
+    extension = os.path.splitext(nombre)[1].lower()
+    return '/'.join(filter(None, [carpeta, digest[:2], f'{digest}{extension}']))
+
+
+def es_nombre_por_contenido(nombre):
+    return bool(_NOMBRE_POR_CONTENIDO_RE.search(nombre.replace('\\', '/')))
+
+
+def recorrer_archivos(raiz):
+    """Genera las entradas (`os.DirEntry`) de los archivos bajo `raiz`, sin los ocultos."""
+    pendientes = [raiz]
+    while pendientes:
+        carpeta = pendientes.pop()
+        with os.scandir(carpeta) as entradas:
+            for entrada in entradas:
+                if entrada.name.startswith('.'):
+                    continue
+                if entrada.is_dir(follow_symlinks=False):
+                    pendientes.append(entrada.path)
+                elif entrada.is_file(follow_symlinks=False):
+                    yield entrada
+
+
+class ContentHashStorage(FileSystemStorage):
+    """`FileSystemStorage` que nombra cada archivo por el hash de su contenido."""
+    deduplica = True
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = nombre_por_contenido(name, hash_contenido(content))
+        try:
+            # Mismos bytes, mismo nombre: ya está guardado. Le ponemos la fecha de ahora
+            # porque puede ser un huérfano antiguo: `limpiar_media` respeta los archivos
+            # recientes y así no lo borra antes de que se confirme el producto que lo usa.
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return super().save(name, content, max_length=max_length)
+        return name
+
+
+def servir_media(request, path, document_root=None, show_indexes=False):
+    """
+    Igual que `django.views.static.serve` (solo para desarrollo), pero marca como
+    inmutables los archivos con nombre por contenido.
+    """
+    response = serve(request, path, document_root=document_root, show_indexes=show_indexes)
+    if response.status_code == 200 and es_nombre_por_contenido(path):
+        response['Cache-Control'] = CACHE_CONTROL_INMUTABLE
+    return response
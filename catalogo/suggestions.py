@@ -0,0 +1,123 @@
+# catalogo/suggestions.py
+"""
+Índice en memoria para el autocompletado de `search_suggestions`.
+
+El índice se construye de forma perezosa con una sola consulta y después las
+sugerencias se sirven sin tocar la base de datos. Guarda, por cada producto, su
+nombre y las URLs relativas del detalle y de la imagen, más una lista ordenada
+de (palabra, producto) para encontrar prefijos con búsqueda binaria.
+
+Si el término no encuentra ninguna coincidencia (probablemente tiene una
+errata), se recurre al índice de trigramas de `trigrams.py`.
+
+Cada proceso tiene su propia copia, marcada con la versión 'productos' (ver
+`versioning.py`). Las señales de `Producto` incrementan esa versión y el índice
+se reconstruye en la siguiente petición.
+"""
+import threading
+from array import array
+from bisect import bisect_left
+
+from django.urls import reverse
+
+from .text import palabras
+from .trigrams import buscar_similares
+from .versioning import obtener_version
+
+VERSION = 'productos'
+
+_indice = None
+_lock = threading.Lock()
+
+
+class IndiceSugerencias:
+    def __init__(self, filas, version):
+        """
+        `filas` es un iterable de (id, nombre, url, imagen_url) ya ordenado por nombre;
+        `imagen_url` puede ser None.
+        """
+        self.version = version
+        self.entradas = list(filas)
+        self._por_id = None
+        pares = sorted(
+            {(palabra, i) for i, (_, nombre, _, _) in enumerate(self.entradas) for palabra in palabras(nombre)}
+        )
+        self._palabras = [palabra for palabra, _ in pares]
+        # array('L') ocupa bastante menos memoria que una lista de enteros de Python.
+        self._posiciones = array('L', (i for _, i in pares))
+
+    def __len__(self):
+        return len(self.entradas)
+
+    def _rango(self, prefijo):
+        inicio = bisect_left(self._palabras, prefijo)
+        fin = bisect_left(self._palabras, prefijo + '\U0010ffff', inicio)
+        return inicio, fin
+
+    def buscar(self, termino, limite):
+        """
+        Devuelve hasta `limite` entradas cuyo nombre contiene, para cada palabra del
+        término, alguna palabra que empiece por ella. El resultado sigue el orden del índice.
+        """
+        prefijos = palabras(termino)
+        if not prefijos:
+            return []
+        # Empezamos por el prefijo más selectivo para que los conjuntos sean pequeños.
+        rangos = sorted((self._rango(prefijo) for prefijo in prefijos), key=lambda r: r[1] - r[0])
+        candidatos = None
+        for inicio, fin in rangos:
+            posiciones = set(self._posiciones[inicio:fin])
+            candidatos = posiciones if candidatos is None else candidatos & posiciones
+            if not candidatos:
+                return []
+        return [self.entradas[i] for i in sorted(candidatos)[:limite]]
+
+    def por_id(self, pk):
+        if self._por_id is None:
+            # Solo se construye si alguna vez hace falta (búsqueda aproximada).
+            self._por_id = {entrada[0]: entrada for entrada in self.entradas}
+        return self._por_id.get(pk)
+
+
+def construir_indice(version):
+    from .models import Producto
+
+    # `reverse` es relativamente caro; resolvemos la URL una vez y la usamos de plantilla.
+    marcador = 987654321
+    plantilla_url = reverse('catalogo:producto_detalle', args=[marcador]).replace(str(marcador), '{}')
+    storage = Producto._meta.get_field('imagen').storage
+    filas = (
+        (pk, nombre, plantilla_url.format(pk), storage.url(imagen) if imagen else None)
+        for pk, nombre, imagen in Producto.objects.order_by('nombre', 'id').values_list('id', 'nombre', 'imagen').iterator()
+    )
+    return IndiceSugerencias(filas, version)
+
+
+def obtener_indice():
+    """Devuelve el índice del proceso, reconstruyéndolo si su versión está desfasada."""
+    global _indice
+    version = obtener_version(VERSION)
+    indice = _indice
+    if indice is None or indice.version != version:
+        with _lock:
+            if _indice is None or _indice.version != version:
+                _indice = construir_indice(version)
+            indice = _indice
+    return indice
+
+
+def obtener_sugerencias(termino, limite):
+    """
+    Devuelve hasta `limite` entradas (id, nombre, url, imagen_url) para `termino`.
+    Primero por prefijo en memoria; solo si no hay ninguna coincidencia (el término
+    probablemente tiene una errata) se consulta el índice de trigramas.
+    """
+    indice = obtener_indice()
+    entradas = indice.buscar(termino, limite)
+    if entradas:
+        return entradas
+    for pk, _similitud in buscar_similares(termino, limite):
+        entrada = indice.por_id(pk)
+        if entrada is not None:
+            entradas.append(entrada)
+    return entradas
@@ -0,0 +1,74 @@
+# catalogo/templatetags/tarjetas.py
+"""
+Caché de fragmentos para las tarjetas de producto.
+
+Uso en una plantilla:
+
+    {% load tarjetas %}
+    {% tarjetas_productos productos 'catalogo' %}
+
+Renderiza la tarjeta de cada producto con `templates/tarjetas/<variante>.html`.
+Todas las tarjetas de la página se piden a la caché con un solo `get_many` y
+solo se renderizan las que faltan, que se guardan con un solo `set_many`.
+
+La clave de cada tarjeta incluye el id del producto y su versión: un resumen
+de los campos que aparecen en la tarjeta. Si cambian el nombre, el precio o la
+imagen, la clave cambia sola y no hace falta invalidar nada. También incluye
+`huella_plantillas()`, así que un despliegue que cambia el HTML de las tarjetas
+no sigue sirviendo las anteriores.
+
+También define el filtro `srcset` con las variantes de tamaño de la imagen:
+
+    <img src="{{ producto.imagen.url }}" srcset="{{ producto|srcset }}" sizes="...">
+"""
+import hashlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from ..decorators import huella_plantillas
+from ..imagenes import srcset as construir_srcset
+
+register = template.Library()
+
+
+def version_tarjeta(producto):
+    variantes = ','.join(variante['nombre'] for variante in producto.imagen_variantes or [])
+    datos = f'{producto.nombre}\x00{producto.precio}\x00{producto.imagen.name or ""}\x00{variantes}'
+    return hashlib.md5(datos.encode()).hexdigest()[:12]
+
+
+def clave_tarjeta(producto, variante):
+    return f'catalogo:tarjeta:{huella_plantillas()}:{variante}:{producto.pk}:{version_tarjeta(producto)}'
+
+
+@register.simple_tag
+def tarjetas_productos(productos, variante):
+    productos = list(productos)
+    if not productos:
+        return ''
+    claves = [clave_tarjeta(producto, variante) for producto in productos]
+    en_cache = cache.get_many(claves)
+
+    plantilla = None
+    nuevas = {}
+    partes = []
+    for clave, producto in zip(claves, productos):
+        html = en_cache.get(clave)
+        if html is None:
+            if plantilla is None:
+                plantilla = get_template(f'tarjetas/{variante}.html')
+            html = nuevas[clave] = plantilla.render({'producto': producto})
+        partes.append(html)
+    if nuevas:
+        cache.set_many(nuevas, settings.CACHE_TARJETAS_TIMEOUT)
+    return mark_safe(''.join(partes))
+
+
+@register.filter
+def srcset(producto, formato='webp'):
+    """`{{ producto|srcset }}` o `{{ producto|srcset:'avif' }}`; cadena vacía si no hay variantes."""
+    return construir_srcset(producto.imagen_variantes, formato)
@@ -1,9 +1,126 @@
-from django.test import TestCase
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from PIL import Image
+
+from django.conf import settings
+from django.test import RequestFactory, TestCase, override_settings
+from django.core.files.storage import default_storage
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
 from django.urls import reverse
-from .models import Categoria, Producto
+from django.utils import timezone
+from .models import Categoria, Producto, RelacionCategoria, TrabajoImagen, marcar_modificados, reconstruir_jerarquia
 from django.db.utils import IntegrityError
+from django.core.exceptions import ValidationError
+from django.core.cache import cache, caches
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from .search import buscar_productos, buscar_productos_tolerante
+from .views import productos_portada
+from .tree import obtener_arbol
+from .versioning import version_catalogo
+from .paginacion import ADELANTE, PaginadorCursor, codificar_cursor, decodificar_cursor
+from .trigrams import buscar_similares, reconstruir_indice, trigramas
+from .templatetags.tarjetas import clave_tarjeta, tarjetas_productos
+from .jobs import procesar_pendientes, procesar_trabajo, reclamar_trabajo
+from .storage import es_nombre_por_contenido, servir_media
+from .imagenes import MedicionMemoria, optimizar_imagen
+
+# Las pruebas no tocan la caché en disco del proyecto.
+CACHES_PRUEBAS = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pruebas'},
+    'versiones': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pruebas-versiones'},
+}
+
+
+def vaciar_caches():
+    """Páginas, tarjetas y versiones: sin versiones, los índices en memoria se reconstruyen."""
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+@override_settings(CACHES=CACHES_PRUEBAS)
+class CatalogoTestCase(TestCase):
+    """
+    Base de las pruebas: vacía las cachés antes de cada prueba, porque los índices en
+    memoria y las páginas cacheadas sobreviven al rollback de la base de datos. Las
+    métricas de las peticiones de prueba se vuelcan en una carpeta temporal, no en
+    la de producción.
+    """
+    def setUp(self):
+        super().setUp()
+        vaciar_caches()
+        metricas = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, metricas, ignore_errors=True)
+        ajustes = override_settings(INSTRUMENTACION_DIRECTORIO=metricas)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+
+class MediaTemporalMixin:
+    """MEDIA_ROOT en una carpeta temporal (`self.media`) que se borra al terminar cada prueba."""
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+
+class PresupuestoConsultasMixin:
+    """
+    Presupuestos de consultas SQL para las pruebas de vistas.
+
+        with self.assertPresupuestoConsultas(4):
+            self.client.get(url)
+
+    Falla si se hacen más consultas que el presupuesto y, para localizar un N+1,
+    el mensaje agrupa las consultas por su forma (sin los valores concretos) y
+    muestra cuántas veces se repitió cada una.
+    """
+    _VALORES_SQL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+    _LISTAS_SQL = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+
+    @classmethod
+    def forma_sql(cls, sql):
+        return cls._LISTAS_SQL.sub('(...)', cls._VALORES_SQL.sub('?', sql))
+
+    def describir_consultas(self, consultas):
+        formas = Counter(self.forma_sql(consulta['sql']) for consulta in consultas)
+        return '\n'.join(f'  {veces}x {forma[:300]}' for forma, veces in formas.most_common())
 
-class CategoriaModelTests(TestCase):
+    @contextmanager
+    def assertPresupuestoConsultas(self, presupuesto, using='default'):
+        with CaptureQueriesContext(connections[using]) as contexto:
+            yield contexto
+        total = len(contexto.captured_queries)
+        if total > presupuesto:
+            self.fail(
+                f'{total} consultas, el presupuesto es {presupuesto}:\n'
+                + self.describir_consultas(contexto.captured_queries))
+
+    def consultas_vista(self, url):
+        """Pide `url` con la caché vacía (el peor caso) y devuelve (respuesta, número de consultas)."""
+        vaciar_caches()
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200, url)
+        return respuesta, len(contexto.captured_queries)
+
+
+class CategoriaModelTests(CatalogoTestCase):
     """
     Pruebas específicas para el modelo Categoria y su lógica de jerarquía.
     """
@@ -48,7 +165,7 @@ class CategoriaModelTests(TestCase):
         self.assertEqual(Categoria.objects.filter(nombre='Doméstico').count(), 2)
 
 
-class CatalogoViewsTests(TestCase):
+class CatalogoViewsTests(CatalogoTestCase):
     """
     Pruebas para las vistas de la aplicación 'catalogo'.
     """
@@ -164,3 +281,1654 @@ class CatalogoViewsTests(TestCase):
         url = reverse('catalogo:producto_detalle', args=[999])
         response = self.client.get(url)
         self.assertEqual(response.status_code, 404)
+
+
+class BusquedaTextoCompletoTests(CatalogoTestCase):
+    """
+    Pruebas para el índice de texto completo usado por la búsqueda del catálogo.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre='Herramientas')
+        cls.otra_categoria = Categoria.objects.create(nombre='Plomería')
+        cls.taladro = Producto.objects.create(nombre='Taladro Eléctrico', categoria=cls.categoria, precio=100)
+        cls.broca = Producto.objects.create(
+            nombre='Broca para concreto', descripcion='Ideal para taladro eléctrico', categoria=cls.categoria, precio=15)
+        cls.llave = Producto.objects.create(nombre='Llave eléctrica', categoria=cls.otra_categoria, precio=30)
+
+    def test_busqueda_ignora_acentos_y_mayusculas(self):
+        """Prueba que 'ELECTRICO' encuentra productos con 'Eléctrico'."""
+        resultados = list(buscar_productos('ELECTRICO'))
+        self.assertIn(self.taladro, resultados)
+        self.assertIn(self.broca, resultados)
+
+    def test_busqueda_ordena_por_relevancia(self):
+        """Prueba que una coincidencia en el nombre pesa más que en la descripción."""
+        resultados = list(buscar_productos('taladro'))
+        self.assertEqual(resultados, [self.taladro, self.broca])
+
+    def test_busqueda_por_prefijo_y_varias_palabras(self):
+        """Prueba que cada palabra se busca como prefijo y todas deben coincidir."""
+        self.assertEqual(list(buscar_productos('tala elec')), [self.taladro, self.broca])
+        self.assertEqual(list(buscar_productos('broca concr')), [self.broca])
+
+    def test_indice_se_actualiza_con_cambios(self):
+        """Prueba que el índice refleja ediciones y borrados, incluso con queryset.update()."""
+        Producto.objects.filter(pk=self.llave.pk).update(nombre='Llave Stillson')
+        self.assertEqual(list(buscar_productos('stillson')), [self.llave])
+        self.assertNotIn(self.llave, list(buscar_productos('electrica')))
+        self.llave.delete()
+        self.assertEqual(list(buscar_productos('stillson')), [])
+
+    def test_busqueda_sin_palabras_no_devuelve_nada(self):
+        """Prueba que un término sin palabras (solo símbolos) no devuelve resultados."""
+        self.assertEqual(list(buscar_productos('***')), [])
+
+    def test_vista_catalogo_usa_busqueda(self):
+        """Prueba que la vista de catálogo pagina los resultados de la búsqueda."""
+        response = self.client.get(reverse('catalogo:catalogo'), {'q': 'electric'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['productos'].paginator.count, 3)
+        # La coincidencia solo en la descripción queda al final.
+        self.assertEqual(list(response.context['productos'])[-1], self.broca)
+
+    def test_vista_categoria_detalle_busqueda_restringida(self):
+        """Prueba que la búsqueda dentro de una categoría no devuelve productos de otras."""
+        url = reverse('catalogo:categoria_detalle', args=[self.otra_categoria.id])
+        response = self.client.get(url, {'q': 'electric'})
+        self.assertEqual(list(response.context['productos']), [self.llave])
+
+
+class SugerenciasBusquedaTests(CatalogoTestCase):
+    """
+    Pruebas para el índice en memoria del autocompletado.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre='Herramientas')
+        cls.taladro = Producto.objects.create(nombre='Taladro Percutor', categoria=cls.categoria, precio=100)
+        cls.broca = Producto.objects.create(nombre='Broca para taladro', categoria=cls.categoria, precio=15)
+        cls.mezcladora = Producto.objects.create(nombre='Mezcladora de baño', categoria=cls.categoria, precio=800)
+
+    def sugerencias(self, term):
+        response = self.client.get(reverse('catalogo:search_suggestions'), {'term': term})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_sugerencias_por_prefijo_de_palabra(self):
+        """Prueba que el término coincide con el inicio de cualquier palabra del nombre."""
+        etiquetas = [s['label'] for s in self.sugerencias('tala')]
+        self.assertEqual(etiquetas, ['Broca para taladro', 'Taladro Percutor'])
+        self.assertEqual([s['label'] for s in self.sugerencias('tala perc')], ['Taladro Percutor'])
+
+    def test_sugerencias_ignoran_acentos(self):
+        """Prueba que 'bano' encuentra 'baño' y 'MEZ' encuentra 'Mezcladora'."""
+        self.assertEqual([s['label'] for s in self.sugerencias('MEZ bano')], ['Mezcladora de baño'])
+
+    def test_sugerencias_urls_absolutas(self):
+        """Prueba que se devuelven la URL del detalle y una imagen absoluta."""
+        sugerencia = self.sugerencias('percutor')[0]
+        self.assertEqual(sugerencia['url'], reverse('catalogo:producto_detalle', args=[self.taladro.id]))
+        self.assertTrue(sugerencia['image_url'].startswith('http://testserver/'))
+
+    def test_sugerencias_no_consultan_la_bd(self):
+        """Prueba que, con el índice construido, las sugerencias no hacen consultas."""
+        self.sugerencias('tala')
+        with self.assertNumQueries(0):
+            self.sugerencias('broca')
+
+    def test_indice_se_invalida_al_guardar_y_borrar(self):
+        """Prueba que las altas, ediciones y bajas se reflejan en la siguiente petición."""
+        self.assertEqual(self.sugerencias('desarmador'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo = Producto.objects.create(nombre='Desarmador plano', categoria=self.categoria, precio=10)
+        self.assertEqual([s['label'] for s in self.sugerencias('desarmador')], ['Desarmador plano'])
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo.delete()
+        self.assertEqual(self.sugerencias('desarmador'), [])
+
+
+class BusquedaToleranteTests(CatalogoTestCase):
+    """
+    Pruebas para el índice de trigramas y la búsqueda tolerante a errores de escritura.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre='Herramientas')
+        cls.otra_categoria = Categoria.objects.create(nombre='Plomería')
+        cls.desarmador = Producto.objects.create(nombre='Desarmador plano', categoria=cls.categoria, precio=10)
+        cls.mezcladora = Producto.objects.create(nombre='Mezcladora para lavabo', categoria=cls.otra_categoria, precio=500)
+        cls.martillo = Producto.objects.create(nombre='Martillo de uña', categoria=cls.categoria, precio=80)
+
+    def test_trigramas_con_relleno(self):
+        """Prueba que los trigramas se calculan por palabra, sin acentos y con relleno."""
+        self.assertEqual(trigramas('Uña'), {'  u', ' un', 'una', 'na '})
+
+    def test_buscar_similares_tolera_erratas(self):
+        """Prueba que 'desarmadr' y 'mescladora' encuentran el producto correcto."""
+        self.assertEqual(buscar_similares('desarmadr', 5)[0][0], self.desarmador.id)
+        self.assertEqual(buscar_similares('mescladora', 5)[0][0], self.mezcladora.id)
+        self.assertEqual(buscar_similares('xyzzy', 5), [])
+
+    def test_indice_trigramas_sigue_al_nombre(self):
+        """Prueba que al renombrar un producto se actualizan sus trigramas."""
+        self.martillo.nombre = 'Pinzas de presión'
+        self.martillo.save()
+        self.assertEqual(buscar_similares('martilo', 5), [])
+        self.assertEqual(buscar_similares('pinsas', 5)[0][0], self.martillo.id)
+
+    def test_busqueda_tolerante_completa_resultados(self):
+        """Prueba que la vista de catálogo recurre a los trigramas si no hay coincidencias exactas."""
+        response = self.client.get(reverse('catalogo:catalogo'), {'q': 'mescladora'})
+        self.assertEqual(list(response.context['productos']), [self.mezcladora])
+
+    def test_busqueda_tolerante_respeta_categoria(self):
+        """Prueba que la búsqueda aproximada dentro de una categoría no sale de ella."""
+        productos = Producto.objects.filter(categoria=self.categoria)
+        self.assertEqual(list(buscar_productos_tolerante('mescladora', productos)), [])
+        self.assertEqual(list(buscar_productos_tolerante('desarmadr', productos)), [self.desarmador])
+
+    def test_sugerencias_con_errata(self):
+        """Prueba que el autocompletado también tolera erratas."""
+        response = self.client.get(reverse('catalogo:search_suggestions'), {'term': 'desarmadr'})
+        self.assertEqual([s['label'] for s in response.json()], ['Desarmador plano'])
+
+
+class PortadasCategoriaTests(CatalogoTestCase):
+    """
+    Pruebas para la selección de portadas de categoría con una sola consulta.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.herramientas = Categoria.objects.create(nombre='Herramientas')
+        cls.electricas = Categoria.objects.create(nombre='Eléctricas', parent=cls.herramientas)
+        cls.sin_imagen = Producto.objects.create(nombre='Sin imagen', categoria=cls.electricas, precio=1)
+        cls.con_imagen = Producto.objects.create(
+            nombre='Con imagen', categoria=cls.electricas, precio=1, imagen='productos_imagenes/000001.webp')
+        cls.otro_con_imagen = Producto.objects.create(
+            nombre='Otro con imagen', categoria=cls.electricas, precio=1, imagen='productos_imagenes/000002.webp')
+
+    def test_portada_prefiere_productos_con_imagen_y_es_determinista(self):
+        """Prueba que se elige el primer producto (por id) que tiene imagen."""
+        self.assertEqual(productos_portada([self.herramientas.id])[self.herramientas.id], self.con_imagen)
+        self.assertEqual(productos_portada([self.electricas.id])[self.electricas.id], self.con_imagen)
+
+    def test_portada_prefiere_la_propia_categoria(self):
+        """Prueba que un producto de la categoría principal gana a los de sus subcategorías."""
+        propio = Producto.objects.create(
+            nombre='Propio', categoria=self.herramientas, precio=1, imagen='productos_imagenes/000003.webp')
+        self.assertEqual(productos_portada([self.herramientas.id])[self.herramientas.id], propio)
+
+    def test_catalogo_consultas_constantes(self):
+        """Prueba que la portada del catálogo no hace una consulta por categoría."""
+        with CaptureQueriesContext(connection) as pocas:
+            self.client.get(reverse('catalogo:catalogo'))
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(10):
+                categoria = Categoria.objects.create(nombre=f'Categoría {i}')
+                Producto.objects.create(nombre=f'Producto {i}', categoria=categoria, precio=1)
+        with CaptureQueriesContext(connection) as muchas:
+            self.client.get(reverse('catalogo:catalogo'))
+        self.assertEqual(len(pocas), len(muchas))
+
+
+class ArbolCategoriasTests(CatalogoTestCase):
+    """
+    Pruebas para el árbol de categorías en memoria.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.herramientas = Categoria.objects.create(nombre='Herramientas')
+        cls.electricas = Categoria.objects.create(nombre='Eléctricas', parent=cls.herramientas)
+        cls.taladros = Categoria.objects.create(nombre='Taladros', parent=cls.electricas)
+        cls.manuales = Categoria.objects.create(nombre='Manuales', parent=cls.herramientas)
+        cls.plomeria = Categoria.objects.create(nombre='Plomería')
+
+    def test_consultas_del_arbol(self):
+        """Prueba padre, hijos, ancestros, descendientes y ruta."""
+        arbol = obtener_arbol()
+        self.assertEqual(arbol.padre(self.taladros.id).id, self.electricas.id)
+        self.assertEqual([n.nombre for n in arbol.hijos(self.herramientas.id)], ['Eléctricas', 'Manuales'])
+        self.assertEqual([n.id for n in arbol.ancestros(self.taladros.id)], [self.herramientas.id, self.electricas.id])
+        self.assertEqual(
+            set(arbol.ids_descendientes(self.herramientas.id)),
+            {self.herramientas.id, self.electricas.id, self.taladros.id, self.manuales.id})
+        self.assertEqual(arbol.nombre_completo(self.taladros.id), 'Herramientas > Eléctricas > Taladros')
+        self.assertEqual([n.nombre for n in arbol.raices], ['Herramientas', 'Plomería'])
+
+    def test_str_sin_consultas(self):
+        """Prueba que imprimir categorías no hace una consulta por fila."""
+        categorias = list(Categoria.objects.all())
+        obtener_arbol()
+        with self.assertNumQueries(0):
+            nombres = [str(categoria) for categoria in categorias]
+        self.assertIn('Herramientas > Eléctricas > Taladros', nombres)
+
+    def test_arbol_se_invalida_al_guardar_y_borrar(self):
+        """Prueba que el árbol refleja altas, renombres y bajas."""
+        obtener_arbol()
+        self.electricas.nombre = 'Eléctricas Pro'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.electricas.save()
+        self.assertEqual(str(self.taladros), 'Herramientas > Eléctricas Pro > Taladros')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.manuales.delete()
+        self.assertNotIn(self.manuales.id, obtener_arbol())
+
+    def test_categoria_detalle_muestra_migas_de_pan(self):
+        """Prueba que las migas de pan funcionan a cualquier profundidad."""
+        response = self.client.get(reverse('catalogo:categoria_detalle', args=[self.taladros.id]))
+        self.assertEqual([miga.nombre for miga in response.context['migas']], ['Herramientas', 'Eléctricas', 'Taladros'])
+        self.assertContains(response, reverse('catalogo:categoria_detalle', args=[self.electricas.id]))
+
+    def test_portada_busca_en_todo_el_subarbol(self):
+        """Prueba que la portada de una categoría puede venir de una sub-subcategoría."""
+        producto = Producto.objects.create(nombre='Taladro', categoria=self.taladros, precio=1)
+        self.assertEqual(productos_portada([self.herramientas.id])[self.herramientas.id], producto)
+
+    def test_changelist_admin_sin_n_mas_1(self):
+        """Prueba que el listado de categorías del admin no hace una consulta por fila."""
+        from django.contrib.auth.models import User
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        self.client.force_login(admin)
+        url = reverse('admin:catalogo_categoria_changelist')
+        obtener_arbol()
+        with CaptureQueriesContext(connection) as pocas:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        for i in range(10):
+            Categoria.objects.create(nombre=f'Sub {i}', parent=self.plomeria)
+        obtener_arbol()
+        with CaptureQueriesContext(connection) as muchas:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(len(pocas), len(muchas))
+
+
+class JerarquiaCategoriasTests(CatalogoTestCase):
+    """
+    Pruebas para la tabla de cierre (RelacionCategoria) de la jerarquía.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.herramientas = Categoria.objects.create(nombre='Herramientas')
+        cls.electricas = Categoria.objects.create(nombre='Eléctricas', parent=cls.herramientas)
+        cls.taladros = Categoria.objects.create(nombre='Taladros', parent=cls.electricas)
+        cls.plomeria = Categoria.objects.create(nombre='Plomería')
+        cls.taladro = Producto.objects.create(nombre='Taladro', categoria=cls.taladros, precio=1)
+        cls.pinzas = Producto.objects.create(nombre='Pinzas', categoria=cls.herramientas, precio=1)
+        cls.tubo = Producto.objects.create(nombre='Tubo', categoria=cls.plomeria, precio=1)
+
+    def relaciones(self):
+        return set(RelacionCategoria.objects.values_list('ancestro_id', 'descendiente_id', 'profundidad'))
+
+    def test_relaciones_al_crear(self):
+        """Prueba que cada categoría se enlaza consigo misma y con todos sus ancestros."""
+        h, e, t = self.herramientas.id, self.electricas.id, self.taladros.id
+        self.assertTrue({(h, h, 0), (e, e, 0), (t, t, 0), (h, e, 1), (e, t, 1), (h, t, 2)} <= self.relaciones())
+
+    def test_productos_del_subarbol_en_una_consulta(self):
+        """Prueba que los productos de todo el subárbol se obtienen con una consulta."""
+        with self.assertNumQueries(1):
+            productos = set(self.herramientas.productos_del_subarbol())
+        self.assertEqual(productos, {self.taladro, self.pinzas})
+
+    def test_mover_subarbol(self):
+        """Prueba que al cambiar de padre se mueve todo el subárbol."""
+        self.electricas.parent = self.plomeria
+        self.electricas.save()
+        self.assertEqual(set(self.plomeria.productos_del_subarbol()), {self.taladro, self.tubo})
+        self.assertEqual(set(self.herramientas.productos_del_subarbol()), {self.pinzas})
+        self.assertIn((self.plomeria.id, self.taladros.id, 2), self.relaciones())
+
+    def test_no_se_puede_crear_un_ciclo(self):
+        """Prueba que una categoría no puede colgar de su propia subcategoría."""
+        self.herramientas.parent = self.taladros
+        with self.assertRaises(ValidationError):
+            self.herramientas.full_clean()
+        antes = self.relaciones()
+        with self.assertRaises(ValueError):
+            self.herramientas.save()
+        self.assertEqual(self.relaciones(), antes)
+
+    def test_reconstruir_jerarquia(self):
+        """Prueba que la reconstrucción completa da el mismo resultado que el mantenimiento incremental."""
+        antes = self.relaciones()
+        RelacionCategoria.objects.all().delete()
+        reconstruir_jerarquia()
+        self.assertEqual(self.relaciones(), antes)
+
+    def test_portadas_de_categorias_anidadas(self):
+        """Prueba que se pueden pedir a la vez portadas de una categoría y de su subcategoría."""
+        portadas = productos_portada([self.herramientas.id, self.electricas.id, self.plomeria.id])
+        self.assertEqual(portadas, {
+            self.herramientas.id: self.pinzas,
+            self.electricas.id: self.taladro,
+            self.plomeria.id: self.tubo,
+        })
+
+
+class CachePaginasTests(CatalogoTestCase):
+    """
+    Pruebas para la caché de páginas de inicio y catálogo invalidada por versión.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre='Herramientas')
+        cls.producto = Producto.objects.create(nombre='Martillo', categoria=cls.categoria, precio=20, stock=3)
+
+    def test_segunda_visita_sin_consultas(self):
+        """Prueba que las visitas repetidas se sirven de la caché sin tocar la BD."""
+        for nombre in ('catalogo:inicio', 'catalogo:catalogo'):
+            primera = self.client.get(reverse(nombre))
+            with self.assertNumQueries(0):
+                segunda = self.client.get(reverse(nombre))
+            self.assertEqual(primera.content, segunda.content)
+
+    def test_cambio_de_plantillas_cambia_la_clave(self):
+        """Prueba que un despliegue con otro HTML no sirve las páginas cacheadas antes."""
+        self.client.get(reverse('catalogo:catalogo'))
+        with mock.patch('catalogo.decorators.huella_plantillas', return_value='otra'), \
+                mock.patch('catalogo.decorators.cache.set') as guardar:
+            self.client.get(reverse('catalogo:catalogo'))
+        guardar.assert_called_once()
+
+    def test_edicion_invalida_la_cache(self):
+        """Prueba que una edición de producto aparece en la siguiente visita."""
+        self.assertContains(self.client.get(reverse('catalogo:catalogo')), 'Martillo')
+        self.producto.nombre = 'Martillo de bola'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.save()
+        self.assertContains(self.client.get(reverse('catalogo:catalogo')), 'Martillo de bola')
+
+    def test_cambios_de_categoria_y_accesorios_invalidan_la_cache(self):
+        """Prueba que las ediciones de categorías y de accesorios (m2m) cambian la versión."""
+        version = version_catalogo()
+        with self.captureOnCommitCallbacks(execute=True):
+            Categoria.objects.create(nombre='Plomería')
+        self.assertNotEqual(version_catalogo(), version)
+        version = version_catalogo()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.accesorios.add(Producto.objects.create(nombre='Mango', precio=5))
+        self.assertNotEqual(version_catalogo(), version)
+
+    def test_version_cambia_al_confirmar(self):
+        """Prueba que la versión cambia al confirmarse la transacción, no antes."""
+        version = version_catalogo()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.producto.precio = 99
+            self.producto.save()
+            self.assertEqual(version_catalogo(), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(version_catalogo(), version)
+
+    def test_usuarios_autenticados_no_usan_la_cache(self):
+        """Prueba que el personal que edita siempre ve la página generada al momento."""
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_user('staff', password='clave'))
+        self.client.get(reverse('catalogo:inicio'))
+        response = self.client.get(reverse('catalogo:inicio'))
+        self.assertTemplateUsed(response, 'inicio.html')
+
+
+    def test_cache_archivos_poda_de_vez_en_cuando(self):
+        """Prueba que la caché en archivos solo lista el directorio en una de cada PODA_CADA escrituras."""
+        from ferreteria.cache import CacheArchivos
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        archivos = CacheArchivos(directorio, {'OPTIONS': {'MAX_ENTRIES': 5, 'CULL_FREQUENCY': 2, 'PODA_CADA': 1000}})
+        with mock.patch.object(archivos, '_list_cache_files', wraps=archivos._list_cache_files) as listar:
+            for i in range(20):
+                archivos.set(f'clave{i}', i)
+        self.assertLessEqual(listar.call_count, 2)
+        self.assertGreater(len(os.listdir(directorio)), 5)
+
+        archivos = CacheArchivos(directorio, {'OPTIONS': {'MAX_ENTRIES': 5, 'CULL_FREQUENCY': 2, 'PODA_CADA': 1}})
+        archivos.set('otra', 1)
+        self.assertLessEqual(len(os.listdir(directorio)), 12)
+
+    @skipUnless(os.name == 'posix', 'El bloqueo de CacheArchivos usa fcntl.')
+    def test_cache_archivos_incr_no_pierde_incrementos(self):
+        """Prueba que los incrementos simultáneos de una versión en archivos no se pisan."""
+        from ferreteria.cache import CacheArchivos
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        CacheArchivos(directorio, {}).add('version', 0, timeout=None)
+
+        def incrementar():
+            # Una instancia por hilo, como un worker por proceso.
+            archivos = CacheArchivos(directorio, {})
+            for _ in range(50):
+                archivos.incr('version')
+
+        hilos = [threading.Thread(target=incrementar) for _ in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(CacheArchivos(directorio, {}).get('version'), 400)
+
+
+class TarjetasProductoTests(CatalogoTestCase):
+    """
+    Pruebas para la caché de fragmentos de las tarjetas de producto.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.productos = [
+            Producto.objects.create(nombre=f'Pinza {i}', precio=10 + i) for i in range(3)
+        ]
+
+    def test_tarjetas_se_cachean_por_producto(self):
+        """Prueba que la primera llamada guarda cada tarjeta y la segunda las reutiliza."""
+        html = tarjetas_productos(self.productos, 'catalogo')
+        for producto in self.productos:
+            self.assertIn(producto.nombre, html)
+            self.assertIsNotNone(cache.get(clave_tarjeta(producto, 'catalogo')))
+        self.assertEqual(tarjetas_productos(self.productos, 'catalogo'), html)
+
+    def test_tarjetas_usan_una_sola_lectura_de_cache(self):
+        """Prueba que una página ya cacheada se lee con un solo get_many y sin renderizar."""
+        tarjetas_productos(self.productos, 'catalogo')
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many, \
+                mock.patch.object(cache, 'set_many') as set_many:
+            tarjetas_productos(self.productos, 'catalogo')
+        self.assertEqual(get_many.call_count, 1)
+        set_many.assert_not_called()
+
+    def test_edicion_cambia_la_tarjeta(self):
+        """Prueba que cambiar el precio genera una clave nueva y se ve el precio actualizado."""
+        producto = self.productos[0]
+        clave = clave_tarjeta(producto, 'catalogo')
+        tarjetas_productos([producto], 'catalogo')
+        producto.precio = 99
+        producto.save()
+        self.assertNotEqual(clave_tarjeta(producto, 'catalogo'), clave)
+        self.assertIn('$99', tarjetas_productos([producto], 'catalogo'))
+
+    def test_variantes_no_comparten_clave(self):
+        """Prueba que la misma tarjeta en inicio y en catálogo se guarda por separado."""
+        producto = self.productos[0]
+        self.assertNotEqual(clave_tarjeta(producto, 'inicio'), clave_tarjeta(producto, 'catalogo'))
+
+    def test_cambio_de_plantillas_cambia_la_clave(self):
+        """Prueba que un despliegue con otro HTML no reutiliza las tarjetas cacheadas."""
+        producto = self.productos[0]
+        clave = clave_tarjeta(producto, 'catalogo')
+        with mock.patch('catalogo.templatetags.tarjetas.huella_plantillas', return_value='otra'):
+            self.assertNotEqual(clave_tarjeta(producto, 'catalogo'), clave)
+
+
+@override_settings(IMAGENES_AVIF=False)
+class VariantesImagenTests(MediaTemporalMixin, CatalogoTestCase):
+    """
+    Pruebas para la conversión en segundo plano y las variantes de tamaño de las imágenes.
+    """
+    def subir(self, ancho, alto, nombre='taladro.png'):
+        buffer = BytesIO()
+        Image.new('RGB', (ancho, alto), 'red').save(buffer, format='PNG')
+        return SimpleUploadedFile(nombre, buffer.getvalue(), content_type='image/png')
+
+    def crear_convertido(self, ancho, alto):
+        producto = Producto.objects.create(nombre='Taladro', precio=10, imagen=self.subir(ancho, alto))
+        procesar_pendientes()
+        producto.refresh_from_db()
+        return producto
+
+    def test_guardar_no_convierte_en_la_peticion(self):
+        """Prueba que save guarda la original y deja la conversión encolada."""
+        producto = Producto.objects.create(nombre='Taladro', precio=10, imagen=self.subir(400, 400))
+        self.assertTrue(producto.imagen.name.endswith('.png'))
+        self.assertEqual(producto.imagen_variantes, [])
+        trabajo = TrabajoImagen.objects.get(producto=producto)
+        self.assertEqual(trabajo.estado, TrabajoImagen.PENDIENTE)
+        self.assertEqual(trabajo.imagen, producto.imagen.name)
+
+    def test_worker_reemplaza_la_original(self):
+        """Prueba que el worker deja un WebP y marca el trabajo como completado."""
+        Producto.objects.create(nombre='Taladro', precio=10, imagen=self.subir(1600, 800))
+        self.assertEqual(procesar_pendientes(), 1)
+        producto = Producto.objects.get(nombre='Taladro')
+        self.assertTrue(producto.imagen.name.endswith('.webp'))
+        with default_storage.open(producto.imagen.name) as archivo, Image.open(archivo) as img:
+            self.assertEqual(img.width, 1200)
+        self.assertEqual(TrabajoImagen.objects.get().estado, TrabajoImagen.COMPLETADO)
+        # La versión optimizada no vuelve a encolarse.
+        self.assertEqual(procesar_pendientes(), 0)
+
+    def test_worker_conserva_la_original_reutilizada(self):
+        """
+        Prueba que con el almacenamiento por contenido el worker no borra la original:
+        una subida en curso puede haberla reutilizado sin confirmar aún su producto.
+        """
+        original = Producto.objects.create(nombre='Taladro', precio=10, imagen=self.subir(1600, 800)).imagen.name
+        # Otra subida con los mismos bytes: mismo archivo, producto todavía sin guardar.
+        self.assertEqual(default_storage.save('productos_imagenes/otra.png', self.subir(1600, 800)), original)
+        procesar_pendientes()
+        self.assertTrue(default_storage.exists(original))
+        # El huérfano lo borra `limpiar_media`.
+        self.assertNotEqual(Producto.objects.get().imagen.name, original)
+
+    @override_settings(STORAGES={
+        **settings.STORAGES, 'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'}})
+    def test_worker_borra_la_original_sin_deduplicar(self):
+        """Prueba que con un almacenamiento que no deduplica la original sin uso se borra."""
+        original = Producto.objects.create(nombre='Taladro', precio=10, imagen=self.subir(1600, 800)).imagen.name
+        procesar_pendientes()
+        self.assertFalse(default_storage.exists(original))
+
+    @override_settings(STORAGES={
+        **settings.STORAGES, 'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'}})
+    def test_variantes_de_carpetas_distintas_no_se_pisan(self):
+        """
+        Prueba que dos imágenes con el mismo nombre en carpetas distintas (como las de
+        la importación) no comparten variantes en un almacenamiento que no deduplica.
+        """
+        nombres = {}
+        for carpeta, color in (('lijas', 'red'), ('brocas', 'blue')):
+            buffer = BytesIO()
+            Image.new('RGB', (400, 400), color).save(buffer, format='WEBP')
+            nombre = default_storage.save(f'productos_imagenes/{carpeta}/000001.webp', ContentFile(buffer.getvalue()))
+            nombres[color] = optimizar_imagen(nombre)[1][0]['nombre']
+        self.assertNotEqual(nombres['red'], nombres['blue'])
+        with default_storage.open(nombres['red']) as archivo, Image.open(archivo) as img:
+            rojo, verde, azul = img.convert('RGB').getpixel((0, 0))
+        self.assertGreater(rojo, azul)
+
+    def test_subida_genera_variantes_sin_ampliar(self):
+        """Prueba que se generan los anchos menores al original más uno con el ancho original."""
+        producto = self.crear_convertido(800, 400)
+        anchos = [variante['ancho'] for variante in producto.imagen_variantes]
+        self.assertEqual(anchos, [160, 320, 640, 800])
+        for variante in producto.imagen_variantes:
+            self.assertTrue(default_storage.exists(variante['nombre']))
+            with default_storage.open(variante['nombre']) as archivo, Image.open(archivo) as img:
+                self.assertEqual(img.width, variante['ancho'])
+
+    def test_tarjeta_usa_srcset(self):
+        """Prueba que la tarjeta del catálogo ofrece las variantes en el srcset."""
+        producto = self.crear_convertido(400, 400)
+        html = tarjetas_productos([producto], 'catalogo')
+        self.assertIn('srcset="', html)
+        self.assertRegex(html, r'\.webp 160w, ')
+        self.assertIn('sizes="', html)
+
+    def test_quitar_imagen_limpia_variantes(self):
+        """
+        Prueba que al quitar la imagen se vacían sus variantes, pero los archivos se
+        conservan porque en el almacenamiento por contenido pueden ser de otro producto.
+        """
+        producto = self.crear_convertido(400, 400)
+        Producto.objects.create(nombre='Taladro 2', precio=10, imagen=self.subir(400, 400))
+        procesar_pendientes()
+        nombres = [variante['nombre'] for variante in producto.imagen_variantes]
+        producto.imagen = None
+        producto.save()
+        self.assertEqual(producto.imagen_variantes, [])
+        self.assertEqual(Producto.objects.get(nombre='Taladro 2').imagen_variantes[0]['nombre'], nombres[0])
+        self.assertTrue(all(default_storage.exists(nombre) for nombre in nombres))
+
+    def test_reprocesar_en_paralelo_y_reanudar(self):
+        """Prueba que el comando convierte la biblioteca, comparte resultados y salta lo ya hecho."""
+        buffer = BytesIO()
+        Image.new('RGB', (1600, 800), 'blue').save(buffer, format='PNG')
+        original = default_storage.save('productos_imagenes/vieja.png', ContentFile(buffer.getvalue()))
+        for nombre in ('Uno', 'Dos'):
+            Producto.objects.create(nombre=nombre, precio=1, imagen=original)
+        progreso = os.path.join(settings.MEDIA_ROOT, 'progreso.jsonl')
+        # Una ejecución anterior interrumpida ya había procesado una imagen que no existe.
+        with open(progreso, 'w') as archivo:
+            archivo.write(json.dumps({'imagen': 'productos_imagenes/ya-hecha.png', 'nuevo': 'x.webp', 'variantes': []}) + '\n')
+
+        salida = StringIO()
+        call_command('reprocesar_imagenes', '--procesos', '2', '--progreso', progreso, stdout=salida, stderr=StringIO())
+
+        self.assertIn('2 productos actualizados, 0 errores', salida.getvalue())
+        uno, dos = Producto.objects.order_by('nombre')
+        self.assertEqual(uno.imagen.name, dos.imagen.name)
+        self.assertTrue(uno.imagen.name.endswith('.webp'))
+        self.assertEqual([v['ancho'] for v in uno.imagen_variantes], [160, 320, 640, 1200])
+        self.assertFalse(os.path.exists(progreso))
+
+    def test_jpeg_grande_se_decodifica_reducido(self):
+        """Prueba que un JPEG enorme se decodifica con draft y el pico queda muy por debajo del tamaño completo."""
+        buffer = BytesIO()
+        Image.new('RGB', (4800, 3200), 'green').save(buffer, format='JPEG')
+        nombre = default_storage.save('productos_imagenes/foto.jpg', ContentFile(buffer.getvalue()))
+        medicion = MedicionMemoria()
+        with self.assertLogs('catalogo.imagenes', 'INFO') as logs:
+            nuevo, _variantes = optimizar_imagen(nombre, medicion=medicion)
+        with default_storage.open(nuevo) as archivo, Image.open(archivo) as img:
+            self.assertEqual(img.size, (1200, 800))
+        self.assertLess(medicion.pico, 4800 * 3200 * 3 / 2)
+        self.assertIn('pico estimado', logs.output[0])
+
+    def test_imagen_gigante_se_rechaza(self):
+        """Prueba que se rechaza al subirla y que el worker no la reintenta."""
+        with self.settings(IMAGENES_MAX_PIXELES=100 * 100):
+            producto = Producto(nombre='Taladro', precio=10, imagen=self.subir(200, 200))
+            with self.assertRaises(ValidationError) as error:
+                producto.full_clean()
+            self.assertIn('imagen', error.exception.message_dict)
+            producto.save()
+            procesar_pendientes()
+        trabajo = TrabajoImagen.objects.get()
+        self.assertEqual((trabajo.estado, trabajo.intentos), (TrabajoImagen.FALLIDO, 1))
+        self.assertIn('megapíxeles', trabajo.error)
+
+    def test_trabajo_fallido_se_reintenta(self):
+        """Prueba que un error deja el trabajo pendiente con espera y al agotar los intentos queda fallido."""
+        producto = Producto.objects.create(nombre='Taladro', precio=10, imagen=self.subir(400, 400))
+        default_storage.delete(producto.imagen.name)
+        with self.settings(IMAGENES_MAX_INTENTOS=2), self.assertLogs('catalogo.jobs', 'WARNING'):
+            procesar_pendientes()
+            trabajo = TrabajoImagen.objects.get()
+            self.assertEqual(trabajo.estado, TrabajoImagen.PENDIENTE)
+            self.assertEqual(trabajo.intentos, 1)
+            self.assertGreater(trabajo.disponible_en, timezone.now())
+            # La espera todavía no venció: el worker no lo toma.
+            self.assertEqual(procesar_pendientes(), 0)
+            TrabajoImagen.objects.update(disponible_en=timezone.now())
+            procesar_pendientes()
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, TrabajoImagen.FALLIDO)
+        self.assertTrue(trabajo.error)
+
+    def test_trabajo_obsoleto_no_pisa_la_imagen_nueva(self):
+        """Prueba que si la imagen cambia antes de procesar, el trabajo viejo no la sobrescribe."""
+        producto = Producto.objects.create(nombre='Taladro', precio=10, imagen=self.subir(400, 400))
+        viejo = TrabajoImagen.objects.get()
+        Producto.objects.filter(pk=producto.pk).update(imagen='productos_imagenes/otra.png')
+        self.assertIsNotNone(reclamar_trabajo())
+        viejo.refresh_from_db()
+        procesar_trabajo(viejo)
+        producto.refresh_from_db()
+        self.assertEqual(producto.imagen.name, 'productos_imagenes/otra.png')
+        self.assertEqual(TrabajoImagen.objects.get().estado, TrabajoImagen.COMPLETADO)
+
+
+    def test_producto_borrado_durante_la_conversion(self):
+        """Prueba que borrar el producto mientras se convierte no tumba al worker."""
+        producto = Producto.objects.create(nombre='Taladro', precio=10, imagen=self.subir(400, 400))
+        convertir = optimizar_imagen
+
+        def convertir_y_borrar(nombre):
+            resultado = convertir(nombre)
+            Producto.objects.filter(pk=producto.pk).delete()
+            return resultado
+
+        with mock.patch('catalogo.jobs.optimizar_imagen', side_effect=convertir_y_borrar), \
+                self.assertLogs('catalogo.jobs', 'INFO') as registro:
+            self.assertEqual(procesar_pendientes(), 1)
+        self.assertIn('se borró', registro.output[0])
+        self.assertFalse(TrabajoImagen.objects.exists())
+
+
+class AlmacenamientoPorContenidoTests(MediaTemporalMixin, CatalogoTestCase):
+    """
+    Pruebas para el almacenamiento de imágenes direccionado por contenido.
+    """
+    def test_mismos_bytes_mismo_archivo(self):
+        """Prueba que el nombre depende del contenido y que guardar dos veces no duplica."""
+        primero = default_storage.save('productos_imagenes/a.webp', ContentFile(b'imagen'))
+        segundo = default_storage.save('productos_imagenes/b.webp', ContentFile(b'imagen'))
+        otro = default_storage.save('productos_imagenes/a.webp', ContentFile(b'otra imagen'))
+        self.assertEqual(primero, segundo)
+        self.assertNotEqual(primero, otro)
+        self.assertTrue(es_nombre_por_contenido(primero))
+        self.assertTrue(primero.startswith('productos_imagenes/'))
+        _carpetas, archivos = default_storage.listdir(primero.rsplit('/', 1)[0])
+        self.assertEqual(len(archivos), 1)
+
+    def test_media_con_hash_es_inmutable(self):
+        """Prueba que al servir un archivo con nombre por contenido se marca como inmutable."""
+        nombre = default_storage.save('productos_imagenes/a.webp', ContentFile(b'imagen'))
+        response = servir_media(RequestFactory().get('/'), nombre, document_root=self.media)
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_comando_deduplica_y_reescribe_rutas(self):
+        """Prueba que el comando une las copias repetidas y actualiza las rutas de los productos."""
+        carpeta = os.path.join(self.media, 'productos_imagenes')
+        os.makedirs(carpeta)
+        for nombre in ('000001.webp', '000001_09l56tS.webp'):
+            with open(os.path.join(carpeta, nombre), 'wb') as archivo:
+                archivo.write(b'mismos bytes')
+        uno = Producto.objects.create(nombre='Uno', precio=1, imagen='productos_imagenes/000001.webp')
+        dos = Producto.objects.create(nombre='Dos', precio=1, imagen='productos_imagenes/000001_09l56tS.webp')
+        TrabajoImagen.objects.all().delete()
+
+        call_command('deduplicar_imagenes', '--borrar-originales', stdout=StringIO(), stderr=StringIO())
+
+        uno.refresh_from_db()
+        dos.refresh_from_db()
+        self.assertEqual(uno.imagen.name, dos.imagen.name)
+        self.assertTrue(es_nombre_por_contenido(uno.imagen.name))
+        self.assertTrue(default_storage.exists(uno.imagen.name))
+        self.assertFalse(default_storage.exists('productos_imagenes/000001.webp'))
+        self.assertFalse(TrabajoImagen.objects.exists())
+
+    def test_reutilizar_un_archivo_le_pone_la_fecha_actual(self):
+        """Prueba que un huérfano antiguo que vuelve a subirse no parece antiguo a `limpiar_media`."""
+        nombre = default_storage.save('productos_imagenes/a.webp', ContentFile(b'imagen'))
+        ruta = default_storage.path(nombre)
+        os.utime(ruta, (0, 0))
+        self.assertEqual(default_storage.save('productos_imagenes/b.webp', ContentFile(b'imagen')), nombre)
+        self.assertGreater(os.path.getmtime(ruta), time.time() - 60)
+        call_command('limpiar_media', stdout=StringIO())
+        self.assertTrue(os.path.exists(ruta))
+
+
+class LimpiarMediaTests(MediaTemporalMixin, CatalogoTestCase):
+    """
+    Pruebas para el comando que borra los archivos de media huérfanos.
+    """
+    def setUp(self):
+        super().setUp()
+        for nombre in ('productos_imagenes/usada.webp', 'productos_imagenes/vieja.webp',
+                       'productos_imagenes/variantes/ab/usada-160.webp', 'productos_imagenes/pendiente.png'):
+            ruta = os.path.join(self.media, nombre)
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            with open(ruta, 'wb') as archivo:
+                archivo.write(b'x' * 10)
+        producto = Producto.objects.create(nombre='Taladro', precio=1, imagen='productos_imagenes/usada.webp')
+        Producto.objects.filter(pk=producto.pk).update(imagen_variantes=[
+            {'ancho': 160, 'formato': 'webp', 'nombre': 'productos_imagenes/variantes/ab/usada-160.webp'}])
+        TrabajoImagen.objects.update(imagen='productos_imagenes/pendiente.png')
+
+    def limpiar(self, *args):
+        salida = StringIO()
+        call_command('limpiar_media', '--edad-minima', '0', *args, stdout=salida)
+        return salida.getvalue()
+
+    def existe(self, nombre):
+        return os.path.exists(os.path.join(self.media, nombre))
+
+    def test_dry_run_no_borra(self):
+        """Prueba que --dry-run informa del huérfano y de sus bytes sin borrarlo."""
+        salida = self.limpiar('--dry-run')
+        self.assertIn('se borrarían: 1', salida)
+        self.assertTrue(self.existe('productos_imagenes/vieja.webp'))
+
+    def test_borra_solo_huerfanos(self):
+        """Prueba que se conservan la imagen, sus variantes y los originales en cola."""
+        self.limpiar()
+        self.assertFalse(self.existe('productos_imagenes/vieja.webp'))
+        self.assertTrue(self.existe('productos_imagenes/usada.webp'))
+        self.assertTrue(self.existe('productos_imagenes/variantes/ab/usada-160.webp'))
+        self.assertTrue(self.existe('productos_imagenes/pendiente.png'))
+
+    def test_respeta_archivos_recientes(self):
+        """Prueba que un archivo recién escrito no se borra aunque aún no esté referenciado."""
+        call_command('limpiar_media', stdout=StringIO())
+        self.assertTrue(self.existe('productos_imagenes/vieja.webp'))
+
+
+class SeguimientoCambiosTests(CatalogoTestCase):
+    """
+    Pruebas para el seguimiento de cambios de Producto y los guardados parciales.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.producto = Producto.objects.create(
+            nombre='Martillo', precio=20, stock=3, imagen='productos_imagenes/000001.webp')
+        TrabajoImagen.objects.all().delete()
+
+    def consultas_producto(self, contexto):
+        return [q['sql'] for q in contexto.captured_queries if 'catalogo_producto"' in q['sql']]
+
+    def test_campos_cambiados(self):
+        """Prueba que se detectan solo los campos modificados desde la carga."""
+        producto = Producto.objects.get(pk=self.producto.pk)
+        self.assertEqual(producto.campos_cambiados(), [])
+        producto.precio = 25
+        producto.stock = 3
+        self.assertEqual(producto.campos_cambiados(), ['precio'])
+        producto.save()
+        self.assertEqual(producto.campos_cambiados(), [])
+
+    def test_save_no_vuelve_a_leer_el_producto(self):
+        """Prueba que guardar un producto cargado no hace un SELECT para comparar la imagen."""
+        producto = Producto.objects.get(pk=self.producto.pk)
+        producto.stock = 10
+        with CaptureQueriesContext(connection) as contexto:
+            producto.save()
+        consultas = self.consultas_producto(contexto)
+        self.assertEqual(len(consultas), 1)
+        self.assertTrue(consultas[0].startswith('UPDATE'))
+        self.assertFalse(TrabajoImagen.objects.exists())
+
+    def test_cambio_de_imagen_se_detecta_sin_consulta(self):
+        """Prueba que un cambio de ruta de imagen encola la conversión sin leer la fila anterior."""
+        producto = Producto.objects.get(pk=self.producto.pk)
+        producto.imagen = 'productos_imagenes/000002.webp'
+        with CaptureQueriesContext(connection) as contexto:
+            producto.save()
+        self.assertFalse([sql for sql in self.consultas_producto(contexto) if sql.startswith('SELECT')])
+        self.assertEqual(TrabajoImagen.objects.get().imagen, 'productos_imagenes/000002.webp')
+
+    def test_list_editable_guarda_solo_lo_cambiado(self):
+        """Prueba que editar el precio desde la lista del admin es un único UPDATE de esa columna."""
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'clave'))
+        datos = {
+            'form-TOTAL_FORMS': '1', 'form-INITIAL_FORMS': '1', 'form-MIN_NUM_FORMS': '0',
+            'form-MAX_NUM_FORMS': '1000', 'form-0-id': str(self.producto.pk),
+            'form-0-precio': '30.00', 'form-0-stock': '3', '_save': 'Guardar',
+        }
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.client.post(reverse('admin:catalogo_producto_changelist'), datos)
+        self.assertEqual(response.status_code, 302)
+        updates = [sql for sql in self.consultas_producto(contexto) if sql.startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"precio"', updates[0])
+        self.assertNotIn('"nombre"', updates[0])
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.precio, 30)
+
+
+class ImportacionProductosTests(MediaTemporalMixin, CatalogoTestCase):
+    """
+    Pruebas para la importación en bloque de ProductoResource.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.herramientas = Categoria.objects.create(nombre='Herramientas')
+        cls.martillo = Producto.objects.create(nombre='Martillo', precio=20, categoria=cls.herramientas)
+        cls.clavos = Producto.objects.create(nombre='Clavos', precio=5, categoria=cls.herramientas)
+        cls.martillo.accesorios.add(cls.clavos)
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.media, 'productos_imagenes', 'lijas'))
+        for ruta in ('taladro.webp', 'lijas/Lija-120.webp'):
+            with open(os.path.join(self.media, 'productos_imagenes', ruta), 'wb') as archivo:
+                archivo.write(b'imagen')
+
+    def importar(self, filas, dry_run=False):
+        import tablib
+        from .admin import ProductoResource
+        datos = tablib.Dataset(headers=['nombre', 'precio', 'categoria', 'imagen', 'stock', 'refacciones'])
+        for fila in filas:
+            datos.append(fila)
+        return ProductoResource().import_data(datos, dry_run=dry_run, use_transactions=True)
+
+    def test_crea_actualiza_y_enlaza_refacciones(self):
+        """Prueba que la importación crea y actualiza productos y escribe sus refacciones."""
+        resultado = self.importar([
+            ('Martillo', '25.00', 'Herramientas', '', 3, 'Clavos,Broca'),
+            ('Taladro', '900.00', 'Herramientas', 'productos_imagenes/taladro.webp', 1, 'Broca'),
+            ('Broca', '30.00', 'Herramientas', '', 10, ''),
+        ])
+        self.assertFalse(resultado.has_errors())
+        self.assertFalse(resultado.has_validation_errors())
+        self.martillo.refresh_from_db()
+        self.assertEqual(self.martillo.precio, 25)
+        taladro = Producto.objects.get(nombre='Taladro')
+        self.assertEqual(taladro.categoria, self.herramientas)
+        # Las refacciones pueden ser productos creados en la misma importación.
+        self.assertEqual(set(self.martillo.accesorios.values_list('nombre', flat=True)), {'Clavos', 'Broca'})
+        self.assertEqual(list(taladro.accesorios.values_list('nombre', flat=True)), ['Broca'])
+        # Lo que harían Producto.save y las señales: trigramas y conversión de la imagen.
+        self.assertEqual(buscar_similares('taladr', 5)[0][0], taladro.pk)
+        self.assertEqual(TrabajoImagen.objects.get().producto, taladro)
+
+    def test_consultas_no_crecen_con_las_filas(self):
+        """Prueba que el número de consultas no depende del número de filas."""
+        def contar(filas):
+            with CaptureQueriesContext(connection) as contexto:
+                resultado = self.importar(filas)
+            self.assertFalse(resultado.has_errors())
+            # Los INSERT en bloque se parten según el límite de parámetros de la base de datos.
+            return len([q for q in contexto.captured_queries if 'INSERT INTO' not in q['sql']])
+
+        pocas = contar([(f'Tornillo {i}', '1.00', 'Herramientas', '', i, 'Clavos') for i in range(5)])
+        muchas = contar([(f'Pija {i}', '1.00', 'Herramientas', '', i, 'Clavos') for i in range(200)])
+        self.assertEqual(pocas, muchas)
+
+    def test_filas_sin_cambios_se_omiten(self):
+        """Prueba que las filas iguales a lo guardado no se reescriben."""
+        resultado = self.importar([
+            ('Clavos', '5.00', 'Herramientas', '', 0, ''),
+            ('Martillo', '20.00', 'Herramientas', '', 0, 'Broca'),
+        ])
+        self.assertEqual(resultado.totals['skip'], 1)
+        self.assertEqual(resultado.totals['update'], 1)
+
+    def test_imagenes_se_validan_contra_el_indice(self):
+        """Prueba que las rutas se validan en memoria, sin distinguir mayúsculas."""
+        with mock.patch('catalogo.admin.os.path.exists') as exists:
+            resultado = self.importar([('Lija', '8.00', 'Herramientas', 'productos_imagenes/Lijas/LIJA-120.webp', 1, '')])
+        exists.assert_not_called()
+        self.assertFalse(resultado.has_validation_errors())
+        self.assertEqual(Producto.objects.get(nombre='Lija').imagen.name, 'productos_imagenes/lijas/Lija-120.webp')
+
+    def test_imagen_inexistente_sugiere_la_mas_parecida(self):
+        """Prueba que una imagen que no existe propone el archivo más parecido."""
+        resultado = self.importar([('Lija', '8.00', 'Herramientas', 'productos_imagenes/lijas/lija-12.webp', 1, '')])
+        self.assertTrue(resultado.has_validation_errors())
+        mensaje = str(resultado.invalid_rows[0].error_dict['imagen'])
+        self.assertIn("productos_imagenes/lijas/Lija-120.webp", mensaje)
+
+    def test_imagen_cambiada_borra_las_variantes_anteriores(self):
+        """Prueba que cambiar la imagen borra los archivos de las variantes viejas, salvo en un dry run."""
+        variantes = [{'ancho': 160, 'formato': 'webp', 'nombre': 'productos_imagenes/variantes/ab/martillo-160.webp'}]
+        Producto.objects.filter(pk=self.martillo.pk).update(imagen='productos_imagenes/viejo.webp', imagen_variantes=variantes)
+        fila = ('Martillo', '20.00', 'Herramientas', 'productos_imagenes/taladro.webp', 0, 'Clavos')
+        with mock.patch('catalogo.admin.borrar_variantes') as borrar:
+            self.assertFalse(self.importar([fila], dry_run=True).has_errors())
+            borrar.assert_not_called()
+            self.assertFalse(self.importar([fila]).has_errors())
+        borrar.assert_called_once_with(variantes)
+        self.martillo.refresh_from_db()
+        self.assertEqual(self.martillo.imagen_variantes, [])
+
+    def test_categoria_inexistente_es_error_de_validacion(self):
+        """Prueba que una categoría desconocida marca la fila como inválida."""
+        resultado = self.importar([('Serrucho', '80.00', 'Jardinería', '', 1, '')])
+        self.assertTrue(resultado.has_validation_errors())
+        self.assertFalse(Producto.objects.filter(nombre='Serrucho').exists())
+
+
+class ExportacionProductosTests(CatalogoTestCase):
+    """
+    Pruebas para la exportación del catálogo en streaming.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        herramientas = Categoria.objects.create(nombre='Herramientas')
+        cls.martillo = Producto.objects.create(nombre='Martillo', precio=20, categoria=herramientas, stock=3)
+        for i in range(5):
+            cls.martillo.accesorios.add(Producto.objects.create(nombre=f'Clavo {i}', precio=1, categoria=herramientas))
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:catalogo_producto_exportar_stream')
+
+    def test_csv_en_streaming(self):
+        """Prueba que el CSV se envía en streaming con las columnas de la importación."""
+        import csv
+        response = self.client.get(self.url, {'formato': 'csv'})
+        self.assertTrue(response.streaming)
+        contenido = b''.join(response.streaming_content).decode('utf-8-sig')
+        filas = list(csv.DictReader(StringIO(contenido)))
+        self.assertEqual(len(filas), 6)
+        martillo = next(fila for fila in filas if fila['nombre'] == 'Martillo')
+        self.assertEqual(martillo['categoria'], 'Herramientas')
+        self.assertEqual(set(martillo['refacciones'].split(',')), {f'Clavo {i}' for i in range(5)})
+
+    def test_consultas_por_bloque_y_filtros(self):
+        """Prueba que las refacciones se precargan por bloque y se respeta la búsqueda de la lista."""
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.client.get(self.url, {'formato': 'jsonl', 'q': 'Clavo'})
+            lineas = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lineas), 5)
+        self.assertEqual(json.loads(lineas[0])['categoria'], 'Herramientas')
+        consultas_producto = [q for q in contexto.captured_queries if 'FROM "catalogo_producto"' in q['sql']]
+        # Productos + refacciones del bloque (más las de la sesión/permisos del admin).
+        self.assertLessEqual(len(consultas_producto), 2)
+
+    def test_botones_de_la_lista(self):
+        """Prueba que la lista enlaza la exportación en streaming conservando los filtros, no la de tablib."""
+        response = self.client.get(reverse('admin:catalogo_producto_changelist'), {'q': 'Clavo'})
+        for formato in ('csv', 'jsonl', 'xlsx'):
+            self.assertContains(response, f'{self.url}?q=Clavo&amp;formato={formato}')
+        self.assertNotContains(response, reverse('admin:catalogo_producto_export'))
+
+    def test_accion_exportar_seleccionados(self):
+        """Prueba que la acción de exportar los seleccionados también va en streaming."""
+        ids = list(Producto.objects.filter(nombre__startswith='Clavo').values_list('pk', flat=True)[:2])
+        response = self.client.post(reverse('admin:catalogo_producto_changelist'),
+                                    {'action': 'exportar_seleccionados', '_selected_action': ids})
+        self.assertTrue(response.streaming)
+        contenido = b''.join(response.streaming_content).decode('utf-8-sig')
+        self.assertEqual(len(contenido.strip().splitlines()), 3)
+
+    def test_exportar_de_import_export_redirige(self):
+        """Prueba que el "Exportar" de django-import-export lleva a la exportación en streaming."""
+        response = self.client.get(reverse('admin:catalogo_producto_export'), {'q': 'Clavo'})
+        self.assertRedirects(response, f'{self.url}?q=Clavo', fetch_redirect_response=False)
+
+    def test_xlsx_desde_el_comando(self):
+        """Prueba que el comando escribe un XLSX con todos los productos."""
+        from openpyxl import load_workbook
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, 'productos.xlsx')
+            call_command('exportar_productos', formato='xlsx', salida=ruta)
+            hoja = load_workbook(ruta, read_only=True).active
+            filas = list(hoja.values)
+        self.assertEqual(filas[0][0], 'nombre')
+        self.assertEqual(len(filas), 7)
+
+
+class CargarCatalogoTests(MediaTemporalMixin, CatalogoTestCase):
+    """
+    Pruebas para la carga rápida de fixtures (`cargar_catalogo`).
+    """
+    def fixture(self, objetos):
+        archivo = tempfile.NamedTemporaryFile('w', suffix='.json', encoding='utf-8', delete=False)
+        self.addCleanup(os.remove, archivo.name)
+        with archivo:
+            json.dump(objetos, archivo)
+        return archivo.name
+
+    def cargar(self, objetos, **opciones):
+        salida = StringIO()
+        call_command('cargar_catalogo', self.fixture(objetos), stdout=salida, **opciones)
+        return salida.getvalue()
+
+    def objetos(self):
+        return [
+            {'model': 'admin.logentry', 'pk': 1, 'fields': {'object_repr': 'pan', 'action_flag': 1}},
+            # La subcategoría aparece antes que su padre.
+            {'model': 'catalogo.categoria', 'pk': 2, 'fields': {'nombre': 'Eléctricas', 'parent': 1}},
+            {'model': 'catalogo.categoria', 'pk': 1, 'fields': {'nombre': 'Herramientas'}},
+            {'model': 'catalogo.producto', 'pk': 10, 'fields': {
+                'nombre': 'Taladro', 'precio': '900.00', 'categoria': 2, 'stock': 2,
+                'imagen': 'productos_imagenes/taladro.png', 'accesorios': [11]}},
+            {'model': 'catalogo.producto', 'pk': 11, 'fields': {
+                'nombre': 'Broca', 'precio': '30.00', 'categoria': 2, 'accesorios': []}},
+            {'model': 'sessions.session', 'pk': 'abc', 'fields': {'session_data': '', 'expire_date': '2030-01-01T00:00:00Z'}},
+        ]
+
+    def test_carga_el_catalogo_sin_logs_ni_sesiones(self):
+        """Prueba que se cargan categorías, productos y refacciones y se descartan los excluidos."""
+        version = version_catalogo()
+        salida = self.cargar(self.objetos())
+        self.assertIn('2 descartados', salida)
+        taladro = Producto.objects.get(pk=10)
+        self.assertEqual(taladro.categoria.parent.nombre, 'Herramientas')
+        self.assertEqual(list(taladro.accesorios.values_list('nombre', flat=True)), ['Broca'])
+        # Lo que no hace bulk_create: jerarquía, trigramas y cachés se ponen al día al final.
+        self.assertEqual(list(Categoria.objects.get(pk=1).productos_del_subarbol().order_by('pk')), [taladro, Producto.objects.get(pk=11)])
+        self.assertEqual(buscar_similares('taladr', 5)[0][0], 10)
+        self.assertNotEqual(version_catalogo(), version)
+        # Sin conversiones encoladas ni carpetas creadas por la señal de Categoria.
+        self.assertFalse(TrabajoImagen.objects.exists())
+        self.assertEqual(os.listdir(self.media), [])
+
+    def test_lectura_por_bloques(self):
+        """Prueba que los objetos que cruzan el límite de un bloque se leen bien."""
+        from .management.commands.cargar_catalogo import iterar_fixture
+        objetos = self.objetos()
+        with open(self.fixture(objetos), encoding='utf-8') as archivo:
+            self.assertEqual(list(iterar_fixture(archivo, tamano_bloque=7)), objetos)
+
+    def test_no_sobrescribe_sin_reemplazar(self):
+        """Prueba que no se carga sobre un catálogo existente salvo con --reemplazar."""
+        Categoria.objects.create(nombre='Plomería')
+        with self.assertRaises(CommandError):
+            self.cargar(self.objetos())
+        self.cargar(self.objetos(), reemplazar=True)
+        self.assertEqual(sorted(Categoria.objects.values_list('nombre', flat=True)), ['Eléctricas', 'Herramientas'])
+
+
+class CatalogoSinteticoTests(CatalogoTestCase):
+    """
+    Pruebas para el generador de catálogos sintéticos del benchmark.
+    """
+    def test_catalogo_reproducible_y_completo(self):
+        """Prueba que la misma semilla genera el mismo catálogo, con árbol, refacciones e índices."""
+        from .sintetico import generar_catalogo
+        categorias, ids = generar_catalogo(60, semilla=3, raices=2, ramas=2, profundidad=2)
+        self.assertEqual(len(categorias), 2 + 4 + 8)
+        self.assertEqual(Producto.objects.count(), 60)
+        # Los productos cuelgan de las hojas, a dos niveles por debajo de la raíz.
+        raiz = Categoria.objects.get(nombre='Herramientas')
+        self.assertEqual(raiz.productos_del_subarbol().count(), 32)
+        self.assertTrue(Producto.accesorios.through.objects.exists())
+        nombre = Producto.objects.get(pk=ids[0]).nombre
+        self.assertEqual(buscar_similares(nombre, 1)[0][0], ids[0])
+
+        primeros = list(Producto.objects.order_by('pk').values_list('nombre', 'precio', 'stock'))
+        Producto.objects.all().delete()
+        Categoria.objects.all().delete()
+        generar_catalogo(60, semilla=3, raices=2, ramas=2, profundidad=2)
+        self.assertEqual(list(Producto.objects.order_by('pk').values_list('nombre', 'precio', 'stock')), primeros)
+
+
+class PresupuestoConsultasTests(PresupuestoConsultasMixin, CatalogoTestCase):
+    """
+    Número de consultas de cada vista pública, con la caché vacía. Los presupuestos
+    son exactos: si un cambio los reduce, hay que bajarlos aquí; si los sube, la
+    prueba enseña qué consulta se repite.
+    """
+    PRESUPUESTOS = {
+        'inicio': 1,
+        'catalogo': 4,
+        'catalogo_busqueda': 3,
+        'catalogo_busqueda_pagina_2': 3,
+        'catalogo_busqueda_errata': 3,
+        # Los detalles incluyen la consulta de `actualizado` para los GET condicionales.
+        'categoria_detalle_raiz': 5,
+        'categoria_detalle_intermedia': 5,
+        # La hoja más grande: primera página (con el total) y una página por cursor.
+        'categoria_detalle_hoja': 5,
+        'categoria_detalle_hoja_cursor': 5,
+        # Pocos resultados exactos en una hoja: se completa con trigramas (+2 consultas).
+        'categoria_detalle_hoja_busqueda': 7,
+        'producto_detalle': 5,
+        'search_suggestions': 1,
+        'search_suggestions_errata': 2,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        from .sintetico import generar_catalogo
+        # Suficiente para que un N+1 se note: 3 raíces con dos niveles de subcategorías
+        # (39 categorías), 300 productos, refacciones y "más vendidos".
+        generar_catalogo(300, semilla=1, raices=3, ramas=3, profundidad=2)
+        cls.raiz = Categoria.objects.filter(parent__isnull=True).order_by('pk').first()
+        cls.intermedia = Categoria.objects.filter(parent=cls.raiz).order_by('pk').first()
+        cls.hoja = Categoria.objects.filter(parent=cls.intermedia).order_by('pk').first()
+        # Una hoja con varias páginas de productos.
+        cls.hoja_grande = Categoria.objects.filter(subcategorias__isnull=True).exclude(pk=cls.hoja.pk).order_by('pk').first()
+        Producto.objects.bulk_create([
+            Producto(nombre=f'Surtido {i:02d}', precio=10, categoria=cls.hoja_grande) for i in range(30)
+        ])
+        cls.producto = Producto.objects.filter(accesorios__isnull=False).order_by('pk').first()
+
+    def setUp(self):
+        super().setUp()
+        # La comprobación de que existe el índice FTS se hace una vez por proceso;
+        # la hacemos aquí para que no cuente en la primera vista que busque.
+        buscar_productos('taladro')
+
+    def urls(self):
+        catalogo = reverse('catalogo:catalogo')
+        sugerencias = reverse('catalogo:search_suggestions')
+        hoja = reverse('catalogo:categoria_detalle', args=[self.hoja.pk])
+        hoja_grande = reverse('catalogo:categoria_detalle', args=[self.hoja_grande.pk])
+        ultimo = self.hoja_grande.productos.order_by('nombre', 'id')[settings.PRODUCTOS_POR_PAGINA - 1]
+        return {
+            'inicio': reverse('catalogo:inicio'),
+            'catalogo': catalogo,
+            'catalogo_busqueda': f'{catalogo}?q=taladro',
+            'catalogo_busqueda_pagina_2': f'{catalogo}?q=taladro&page=2',
+            'catalogo_busqueda_errata': f'{catalogo}?q=taladr',
+            'categoria_detalle_raiz': reverse('catalogo:categoria_detalle', args=[self.raiz.pk]),
+            'categoria_detalle_intermedia': reverse('catalogo:categoria_detalle', args=[self.intermedia.pk]),
+            'categoria_detalle_hoja': hoja_grande,
+            'categoria_detalle_hoja_cursor': f'{hoja_grande}?cursor={codificar_cursor(ADELANTE, ultimo.nombre, ultimo.pk)}',
+            'categoria_detalle_hoja_busqueda': f'{hoja}?q=martillo',
+            'producto_detalle': reverse('catalogo:producto_detalle', args=[self.producto.pk]),
+            'search_suggestions': f'{sugerencias}?term=tal',
+            'search_suggestions_errata': f'{sugerencias}?term=taldro',
+        }
+
+    def test_vistas_dentro_del_presupuesto(self):
+        """Prueba que cada vista hace exactamente las consultas de su presupuesto."""
+        for nombre, url in self.urls().items():
+            with self.subTest(vista=nombre):
+                presupuesto = self.PRESUPUESTOS[nombre]
+                with self.assertPresupuestoConsultas(presupuesto) as contexto:
+                    self.consultas_vista(url)
+                self.assertEqual(len(contexto.captured_queries), presupuesto,
+                                 f'{nombre} hace menos consultas: actualiza su presupuesto.')
+
+    def test_consultas_no_crecen_con_los_datos(self):
+        """
+        Prueba que el número de consultas es el mismo con el triple de productos en las
+        mismas páginas y más refacciones en el detalle. Los productos nuevos no coinciden
+        con las búsquedas para no cambiar de rama (la búsqueda aproximada solo se hace
+        cuando hay pocos resultados exactos, y cuesta sus propias consultas).
+        """
+        antes = {nombre: self.consultas_vista(url)[1] for nombre, url in self.urls().items()}
+
+        categorias = list(Categoria.objects.filter(subcategorias__isnull=True))
+        nuevos = Producto.objects.bulk_create([
+            Producto(nombre=f'Artículo extra {i:04d}', precio=10, categoria=categorias[i % len(categorias)],
+                     imagen=f'productos_imagenes/extra/{i}.webp', stock=i % 3, es_mas_vendido=i % 4 == 0)
+            for i in range(600)
+        ])
+        Enlace = Producto.accesorios.through
+        Enlace.objects.bulk_create([Enlace(from_producto_id=self.producto.pk, to_producto_id=p.pk) for p in nuevos[:30]])
+        reconstruir_indice()
+
+        for nombre, url in self.urls().items():
+            with self.subTest(vista=nombre):
+                self.assertEqual(self.consultas_vista(url)[1], antes[nombre])
+
+    def test_mensaje_agrupa_consultas_repetidas(self):
+        """Prueba que al pasarse del presupuesto se indica qué consulta se repite (N+1)."""
+        with self.assertRaises(AssertionError) as error:
+            with self.assertPresupuestoConsultas(1):
+                for producto in Producto.objects.order_by('pk')[:5]:
+                    producto.categoria.nombre
+        self.assertIn('6 consultas, el presupuesto es 1', str(error.exception))
+        self.assertIn('5x SELECT', str(error.exception))
+
+
+class InstrumentacionTests(CatalogoTestCase):
+    """
+    Pruebas para la instrumentación de las peticiones (Server-Timing e histogramas por vista).
+    """
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Categoria.objects.create(nombre='Herramientas')
+        cls.producto = Producto.objects.create(nombre='Taladro', categoria=categoria, precio=100)
+
+    def setUp(self):
+        super().setUp()
+        from ferreteria import instrumentacion
+        self.instrumentacion = instrumentacion
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+        ajustes = override_settings(INSTRUMENTACION_DIRECTORIO=self.directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        # Un registro vacío por prueba: el del módulo vive lo que el proceso.
+        parche = mock.patch.object(instrumentacion, 'registro', instrumentacion.RegistroMetricas())
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_cabecera_server_timing(self):
+        """Prueba que la respuesta a un usuario staff lleva los tiempos de SQL, plantillas y JSON-LD."""
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_user('staff', password='clave', is_staff=True))
+        response = self.client.get(reverse('catalogo:producto_detalle', args=[self.producto.pk]))
+        segmentos = {parte.split(';')[0]: parte for parte in response['Server-Timing'].split(', ')}
+        self.assertEqual({'total', 'sql', 'plantillas', 'json'}, set(segmentos))
+        self.assertRegex(segmentos['sql'], r'^sql;dur=[\d.]+;desc="\d+ consultas"$')
+
+    def test_server_timing_solo_para_staff(self):
+        """Prueba que por defecto los visitantes anónimos no reciben la cabecera."""
+        self.assertNotIn('Server-Timing', self.client.get(reverse('catalogo:inicio')))
+        with override_settings(INSTRUMENTACION_SERVER_TIMING=True):
+            self.assertIn('Server-Timing', self.client.get(reverse('catalogo:inicio')))
+
+    @override_settings(INSTRUMENTACION_SERVER_TIMING=False)
+    def test_server_timing_desactivado(self):
+        """Prueba que sin la cabecera se siguen acumulando los histogramas."""
+        response = self.client.get(reverse('catalogo:inicio'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(self.instrumentacion.registro.datos['catalogo:inicio']['total'].n, 1)
+
+    def test_histogramas_por_vista(self):
+        """Prueba que cada petición se suma al histograma de su nombre de URL."""
+        url = reverse('catalogo:producto_detalle', args=[self.producto.pk])
+        with CaptureQueriesContext(connection) as contexto:
+            self.client.get(url)
+        consultas = len(contexto.captured_queries)  # cada petición vacía connection.queries
+        self.client.get(url)
+        self.client.get(reverse('catalogo:inicio'))
+        datos = self.instrumentacion.registro.datos
+        self.assertEqual(datos['catalogo:producto_detalle']['total'].n, 2)
+        self.assertEqual(datos['catalogo:producto_detalle']['consultas'].maximo, consultas)
+        self.assertEqual(datos['catalogo:inicio']['total'].n, 1)
+
+    def test_endpoint_solo_para_staff(self):
+        """Prueba que el resumen junta los volcados de todos los procesos y solo lo ve el personal."""
+        from django.contrib.auth.models import User
+        url = reverse('metricas_peticiones')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        # Volcado de otro proceso.
+        otro = self.instrumentacion.Histograma()
+        otro.agregar(30)
+        with open(os.path.join(self.directorio, 'otro-1.json'), 'w') as archivo:
+            json.dump({'desde': 0, 'vistas': {'catalogo:inicio': {'total': otro.a_dict()}}}, archivo)
+        self.client.get(reverse('catalogo:inicio'))
+
+        self.client.force_login(User.objects.create_user('staff', password='clave', is_staff=True))
+        resumen = self.client.get(url).json()
+        self.assertEqual(resumen['catalogo:inicio']['total']['n'], 2)
+
+    def test_comando_y_reinicio(self):
+        """Prueba la tabla del comando y que --reiniciar empieza de cero también en los procesos vivos."""
+        self.client.get(reverse('catalogo:inicio'))
+        self.instrumentacion.registro.volcar()
+        salida = StringIO()
+        call_command('metricas_peticiones', stdout=salida)
+        self.assertIn('catalogo:inicio', salida.getvalue())
+
+        call_command('metricas_peticiones', '--reiniciar', stdout=StringIO())
+        self.instrumentacion.registro.desde -= 10  # el proceso arrancó antes del reinicio
+        self.instrumentacion.registro.volcar()
+        salida = StringIO()
+        call_command('metricas_peticiones', '--json', stdout=salida)
+        self.assertEqual(json.loads(salida.getvalue()), {})
+
+    def test_percentiles_del_histograma(self):
+        """Prueba que los percentiles se leen del límite superior del cubo y el máximo es exacto."""
+        histograma = self.instrumentacion.Histograma()
+        for valor in [3] * 90 + [40] * 9 + [20000]:
+            histograma.agregar(valor)
+        self.assertEqual(histograma.percentil(50), 5)
+        self.assertEqual(histograma.percentil(95), 50)
+        self.assertEqual(histograma.percentil(100), 20000)
+        self.assertEqual(histograma.resumen()['max'], 20000)
+
+
+class PerfiladorTests(CatalogoTestCase):
+    """
+    Pruebas para el perfilador por muestreo de las peticiones lentas.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre='Herramientas')
+
+    def setUp(self):
+        super().setUp()
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+        ajustes = override_settings(
+            PERFILADOR_ACTIVO=True, PERFILADOR_DIRECTORIO=self.directorio, PERFILADOR_INTERVALO_MS=1,
+            PERFILADOR_UMBRAL_MS=None, PERFILADOR_CADA=0, PERFILADOR_MAX_ARCHIVOS=200)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def perfiles(self):
+        from ferreteria.perfilador import leer_perfiles
+        return leer_perfiles(self.directorio)
+
+    def test_muestreo_de_la_pila(self):
+        """Prueba que el hilo muestreador ve la función en la que está el hilo perfilado."""
+        from ferreteria.perfilador import muestreador
+
+        def funcion_lenta():
+            time.sleep(0.05)
+
+        ident = threading.get_ident()
+        muestreador.iniciar(ident)
+        funcion_lenta()
+        muestras = muestreador.detener(ident)
+        self.assertTrue(any(pila.split(';')[-1].startswith('funcion_lenta (catalogo/tests.py:') for pila in muestras))
+
+    @override_settings(PERFILADOR_UMBRAL_MS=0)
+    def test_guarda_las_peticiones_lentas_con_vista_y_query_string(self):
+        """Prueba que una petición lenta guarda su perfil con la vista, la query string y las pilas."""
+        self.client.get(reverse('catalogo:catalogo'), {'q': 'taladro'})
+        [perfil] = self.perfiles()
+        self.assertEqual(perfil['vista'], 'catalogo:catalogo')
+        self.assertEqual(perfil['query_string'], 'q=taladro')
+        self.assertEqual(perfil['motivo'], 'lento')
+        self.assertEqual(perfil['muestras'], sum(perfil['pilas'].values()))
+
+    @override_settings(PERFILADOR_UMBRAL_MS=60_000, PERFILADOR_CADA=2)
+    def test_una_de_cada_n(self):
+        """Prueba que con PERFILADOR_CADA se guarda una de cada N peticiones aunque no sean lentas."""
+        for _ in range(5):
+            self.client.get(reverse('catalogo:inicio'))
+        self.assertEqual([perfil['motivo'] for perfil in self.perfiles()], ['muestra', 'muestra'])
+
+    @override_settings(PERFILADOR_UMBRAL_MS=0)
+    def test_solo_urls_del_catalogo(self):
+        """Prueba que no se perfilan las vistas fuera de PERFILADOR_NAMESPACES (p. ej. el admin)."""
+        self.client.get(reverse('admin:login'))
+        self.assertEqual(self.perfiles(), [])
+
+    @override_settings(PERFILADOR_UMBRAL_MS=0, PERFILADOR_MAX_ARCHIVOS=3)
+    def test_rota_los_archivos(self):
+        """Prueba que solo se conservan los PERFILADOR_MAX_ARCHIVOS perfiles más recientes."""
+        for pagina in range(1, 6):
+            self.client.get(reverse('catalogo:catalogo'), {'page': pagina})
+        self.assertEqual([perfil['query_string'] for perfil in self.perfiles()], ['page=3', 'page=4', 'page=5'])
+
+    @override_settings(PERFILADOR_ACTIVO=False, PERFILADOR_UMBRAL_MS=0)
+    def test_desactivado(self):
+        """Prueba que con PERFILADOR_ACTIVO = False no se guarda ningún perfil."""
+        self.client.get(reverse('catalogo:inicio'))
+        self.assertEqual(self.perfiles(), [])
+
+    def test_resumen_de_funciones(self):
+        """Prueba que el comando suma el tiempo propio (hoja) y el acumulado (en la pila)."""
+        from ferreteria.perfilador import guardar_perfil
+        base = {'metodo': 'GET', 'estado': 200, 'motivo': 'lento', 'fecha': '', 'intervalo_ms': 5}
+        guardar_perfil(dict(base, vista='catalogo:catalogo', ruta='/catalogo/', query_string='q=x', duracion_ms=900,
+                            muestras=4, pilas={'vista (catalogo/views.py:80);buscar (catalogo/search.py:240)': 3,
+                                               'vista (catalogo/views.py:80)': 1}), self.directorio)
+        guardar_perfil(dict(base, vista='catalogo:inicio', ruta='/', query_string='', duracion_ms=600,
+                            muestras=4, pilas={'inicio (catalogo/views.py:40)': 4}), self.directorio)
+        salida = StringIO()
+        call_command('resumen_perfiles', stdout=salida)
+        texto = salida.getvalue()
+        self.assertIn('2 perfiles, 8 muestras', texto)
+        self.assertIn('/catalogo/?q=x (900 ms)', texto)
+        self.assertRegex(texto, r'37\.5%\s+37\.5%\s+buscar \(catalogo/search\.py:240\)')
+        self.assertRegex(texto, r'12\.5%\s+50\.0%\s+vista \(catalogo/views\.py:80\)')
+
+        salida = StringIO()
+        call_command('resumen_perfiles', '--vista', 'catalogo:inicio', '--plegadas', stdout=salida)
+        self.assertEqual(salida.getvalue(), 'inicio (catalogo/views.py:40) 4\n')
+
+
+class PaginasCondicionalesTests(CatalogoTestCase):
+    """
+    Pruebas de las respuestas 304 (ETag / Last-Modified) y de la fecha `actualizado`
+    que las señales propagan a las páginas afectadas.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.raiz = Categoria.objects.create(nombre='Herramientas')
+        cls.electricas = Categoria.objects.create(nombre='Eléctricas', parent=cls.raiz)
+        cls.manuales = Categoria.objects.create(nombre='Manuales', parent=cls.raiz)
+        cls.plomeria = Categoria.objects.create(nombre='Plomería')
+        cls.taladro = Producto.objects.create(nombre='Taladro', categoria=cls.electricas, precio=100)
+        cls.broca = Producto.objects.create(nombre='Broca', categoria=cls.electricas, precio=5)
+        cls.martillo = Producto.objects.create(nombre='Martillo', categoria=cls.manuales, precio=20)
+        cls.tubo = Producto.objects.create(nombre='Tubo', categoria=cls.plomeria, precio=10)
+        cls.taladro.accesorios.add(cls.broca)
+
+    def url_producto(self, producto):
+        return reverse('catalogo:producto_detalle', args=[producto.pk])
+
+    def url_categoria(self, categoria):
+        return reverse('catalogo:categoria_detalle', args=[categoria.pk])
+
+    def etags(self, *urls):
+        return {url: self.client.get(url)['ETag'] for url in urls}
+
+    def cambiadas(self, etags):
+        """URLs cuya copia (por ETag) ya no vale."""
+        return {url for url, etag in etags.items() if self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code != 304}
+
+    def test_304_sin_cargar_refacciones_ni_renderizar(self):
+        """Prueba que la revalidación es una sola consulta y no renderiza plantillas."""
+        url = self.url_producto(self.taladro)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with CaptureQueriesContext(connection) as contexto:
+            condicional = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(condicional.status_code, 304)
+        self.assertEqual(condicional.content, b'')
+        self.assertEqual(len(contexto.captured_queries), 1)
+        self.assertEqual(condicional.templates, [])
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    def test_categoria_304_con_una_consulta(self):
+        """Prueba que una categoría sin cambios responde 304 con una sola consulta."""
+        url = self.url_categoria(self.electricas)
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as contexto:
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(len(contexto.captured_queries), 1)
+
+    def test_no_existe(self):
+        """Prueba que un producto o una categoría que no existen siguen dando 404."""
+        self.assertEqual(self.client.get(reverse('catalogo:producto_detalle', args=[999999])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('catalogo:categoria_detalle', args=[999999])).status_code, 404)
+
+    def test_editar_producto_marca_su_categoria_y_ancestros(self):
+        """Prueba que editar un producto cambia su página, la de su refacción principal y las categorías de arriba."""
+        urls = [self.url_producto(p) for p in (self.taladro, self.broca, self.martillo, self.tubo)]
+        urls += [self.url_categoria(c) for c in (self.raiz, self.electricas, self.manuales, self.plomeria)]
+        etags = self.etags(*urls)
+        self.broca.precio = 6
+        self.broca.save()
+        self.assertEqual(self.cambiadas(etags), {
+            self.url_producto(self.broca), self.url_producto(self.taladro),  # la muestra como refacción
+            self.url_categoria(self.electricas), self.url_categoria(self.raiz),
+        })
+
+    def test_cambiar_de_categoria_marca_la_anterior(self):
+        """Prueba que mover un producto de categoría cambia la página de la anterior y la de la nueva."""
+        etags = self.etags(self.url_categoria(self.manuales), self.url_categoria(self.plomeria))
+        self.martillo.categoria = self.plomeria
+        self.martillo.save()
+        self.assertEqual(len(self.cambiadas(etags)), 2)
+
+    def test_refacciones_marcan_las_dos_puntas(self):
+        """Prueba que quitar una refacción cambia "Refacciones" de uno y "Compatible con" del otro."""
+        urls = [self.url_producto(p) for p in (self.taladro, self.broca, self.tubo)]
+        etags = self.etags(*urls)
+        self.taladro.accesorios.remove(self.broca)
+        self.assertEqual(self.cambiadas(etags), set(urls[:2]))
+
+        etags = self.etags(*urls)
+        self.tubo.producto_principal.add(self.taladro)
+        self.assertEqual(self.cambiadas(etags), {urls[0], urls[2]})
+
+        etags = self.etags(*urls)
+        self.taladro.accesorios.clear()
+        self.assertEqual(self.cambiadas(etags), {urls[0], urls[2]})
+
+    def test_borrar_producto(self):
+        """Prueba que borrar un producto cambia la página de su categoría y la del producto que lo mostraba como refacción."""
+        etags = self.etags(self.url_producto(self.taladro), self.url_categoria(self.electricas))
+        self.broca.delete()
+        self.assertEqual(len(self.cambiadas(etags)), 2)
+
+    def test_renombrar_categoria_marca_migas_y_productos(self):
+        """Prueba que el nuevo nombre llega a las migas de las subcategorías y a sus productos."""
+        urls = [self.url_categoria(self.electricas), self.url_producto(self.martillo), self.url_categoria(self.plomeria)]
+        etags = self.etags(*urls)
+        self.raiz.nombre = 'Herramienta'
+        self.raiz.save()
+        self.assertEqual(self.cambiadas(etags), {urls[0]})
+
+        etags = self.etags(*urls)
+        self.manuales.nombre = 'De mano'
+        self.manuales.save()
+        self.assertEqual(self.cambiadas(etags), {urls[1]})
+
+    def test_borrar_categoria_marca_sus_productos_y_el_padre(self):
+        """Prueba que borrar una categoría cambia las páginas de sus productos y la de la categoría padre."""
+        etags = self.etags(self.url_producto(self.martillo), self.url_categoria(self.raiz))
+        self.manuales.delete()
+        self.assertEqual(len(self.cambiadas(etags)), 2)
+
+    def test_caminos_sin_save(self):
+        """Prueba que el worker de imágenes y la importación también marcan las páginas."""
+        url = self.url_categoria(self.plomeria)
+        etags = self.etags(url, self.url_producto(self.tubo))
+        marcar_modificados(productos=[self.tubo.pk])
+        self.assertEqual(len(self.cambiadas(etags)), 2)
+
+        etags = self.etags(self.url_categoria(self.manuales))
+        from .admin import ProductoResource
+        from tablib import Dataset
+        datos = Dataset(headers=['nombre', 'precio', 'categoria'])
+        datos.append(['Martillo', '25', 'Manuales'])
+        resultado = ProductoResource().import_data(datos, dry_run=False)
+        self.assertFalse(resultado.has_errors())
+        self.assertEqual(len(self.cambiadas(etags)), 1)
+
+    def test_sugerencias_304_sin_consultas(self):
+        """Prueba que las sugerencias sin cambios responden 304 sin consultas y 200 tras una edición."""
+        url = reverse('catalogo:search_suggestions') + '?term=tal'
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as contexto:
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(len(contexto.captured_queries), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tubo.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(PRODUCTOS_POR_PAGINA=3)
+class PaginacionCursorTests(CatalogoTestCase):
+    """Pruebas de la paginación por cursor de los listados por nombre."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre='Tornillería')
+        # Nombres repetidos para comprobar el desempate por id.
+        nombres = ['Tuerca', 'Arandela', 'Tornillo', 'Arandela', 'Pija', 'Tornillo', 'Taquete', 'Arandela']
+        Producto.objects.bulk_create([Producto(nombre=nombre, precio=1, categoria=cls.categoria) for nombre in nombres])
+        Producto.objects.create(nombre='Tornillo de otra categoría', precio=1, categoria=Categoria.objects.create(nombre='Otra'))
+        cls.orden = list(cls.categoria.productos.order_by('nombre', 'id').values_list('pk', flat=True))
+
+    def test_cursor_opaco(self):
+        """Prueba que el cursor es base64 apto para URL y que los inválidos o manipulados se descartan."""
+        cursor = codificar_cursor(ADELANTE, 'Llave ½"', 7)
+        self.assertRegex(cursor, r'^[A-Za-z0-9_-]+$')
+        self.assertEqual(decodificar_cursor(cursor), (ADELANTE, 'Llave ½"', 7))
+        for invalido in ('', 'xyz', '!!!', codificar_cursor('z', 'a', 1), codificar_cursor(ADELANTE, 'a', True),
+                         codificar_cursor(ADELANTE, 'a', '1')):
+            with self.subTest(cursor=invalido):
+                self.assertIsNone(decodificar_cursor(invalido))
+
+    def test_recorrer_adelante_y_atras(self):
+        """Prueba que recorrer las páginas en ambos sentidos da cada producto una vez, en orden."""
+        paginador = PaginadorCursor(self.categoria.productos.order_by('-precio'), 3)
+        pagina = paginador.get_page(None)
+        paginas = []
+        while True:
+            paginas.append([producto.pk for producto in pagina])
+            if not pagina.has_next():
+                break
+            pagina = paginador.get_page(pagina.cursor_siguiente)
+        self.assertEqual(sum(paginas, []), self.orden)
+        self.assertEqual(len(paginas), 3)
+
+        atras = [[producto.pk for producto in pagina]]
+        while pagina.has_previous():
+            pagina = paginador.get_page(pagina.cursor_anterior)
+            atras.append([producto.pk for producto in pagina])
+        self.assertEqual(atras[::-1], paginas)
+        self.assertFalse(pagina.has_previous())
+
+    def test_una_consulta_por_pagina_sin_offset(self):
+        """Prueba que pedir una página por cursor es una sola consulta y sin OFFSET."""
+        paginador = PaginadorCursor(self.categoria.productos.all(), 3, contar_hasta=0)
+        cursor = paginador.get_page(None).cursor_siguiente
+        with CaptureQueriesContext(connection) as contexto:
+            pagina = paginador.get_page(cursor)
+            self.assertIsNone(paginador.total)
+        self.assertEqual(len(contexto.captured_queries), 1)
+        self.assertNotIn('OFFSET', contexto.captured_queries[0]['sql'].upper())
+        self.assertEqual([producto.pk for producto in pagina], self.orden[3:6])
+
+    def test_total_aproximado(self):
+        """Prueba que el total se cuenta solo hasta `contar_hasta` y avisa de que es aproximado."""
+        paginador = PaginadorCursor(self.categoria.productos.all(), 3, contar_hasta=5)
+        self.assertEqual((paginador.total, paginador.total_aproximado), (5, True))
+        paginador = PaginadorCursor(self.categoria.productos.all(), 3, contar_hasta=100)
+        self.assertEqual((paginador.total, paginador.total_aproximado), (8, False))
+
+    def test_enlaces_de_la_categoria(self):
+        """Prueba que la página de la categoría enlaza con cursores y que un cursor inválido da la primera página."""
+        url = reverse('catalogo:categoria_detalle', args=[self.categoria.pk])
+        response = self.client.get(url)
+        self.assertEqual([producto.pk for producto in response.context['productos']], self.orden[:3])
+        self.assertContains(response, '8 productos')
+        cursor = response.context['productos'].cursor_siguiente
+        self.assertContains(response, f'href="?cursor={cursor}"')
+
+        response = self.client.get(url, {'cursor': cursor})
+        self.assertEqual([producto.pk for producto in response.context['productos']], self.orden[3:6])
+        self.assertContains(response, 'rel="prev"')
+
+        for cursor in ('basura', codificar_cursor(ADELANTE, 'x', 'y')):
+            response = self.client.get(url, {'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([producto.pk for producto in response.context['productos']], self.orden[:3])
+
+    def test_busqueda_por_nombre(self):
+        """Prueba que `orden=nombre` pagina la búsqueda por cursor conservando los parámetros."""
+        url = reverse('catalogo:catalogo')
+        response = self.client.get(url, {'q': 'tornillo', 'orden': 'nombre'})
+        productos = response.context['productos']
+        self.assertEqual([producto.nombre for producto in productos], ['Tornillo', 'Tornillo', 'Tornillo de otra categoría'])
+        self.assertFalse(productos.has_other_pages())
+
+        response = self.client.get(url, {'q': 'arandela tornillo taquete tuerca pija'})
+        self.assertFalse(response.context['paginacion_cursor'])
+        response = self.client.get(reverse('catalogo:categoria_detalle', args=[self.categoria.pk]),
+                                   {'q': 'arandela', 'orden': 'nombre'})
+        self.assertTrue(response.context['paginacion_cursor'])
+        self.assertEqual(response.context['parametros_paginacion'], 'q=arandela&orden=nombre')
@@ -0,0 +1,16 @@
+# catalogo/text.py
+"""
+Normalización de texto compartida por los índices de búsqueda en memoria.
+"""
+import unicodedata
+
+
+def normalizar(texto):
+    """Pasa a minúsculas y quita acentos: 'Eléctrico' -> 'electrico'."""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in texto if not unicodedata.combining(c)).casefold()
+
+
+def palabras(texto):
+    """Divide el texto normalizado en palabras alfanuméricas."""
+    return ''.join(c if c.isalnum() else ' ' for c in normalizar(texto)).split()
@@ -0,0 +1,79 @@
+# catalogo/tracking.py
+"""
+Seguimiento de cambios en instancias de modelos.
+
+`SeguimientoCambiosMixin` recuerda los valores con que se cargó cada instancia
+desde la base de datos (en `from_db`, sin consultas extra) para que `save()` y
+el admin sepan qué campos cambiaron:
+
+    producto = Producto.objects.get(pk=1)
+    producto.precio = 25
+    producto.campos_cambiados()             # ['precio']
+    producto.ha_cambiado('imagen')          # False
+    producto.save(update_fields=producto.campos_cambiados())
+
+Los campos diferidos (`only()` / `defer()`) no se conocen: `ha_cambiado` los
+considera cambiados y `tiene_valor_cargado` devuelve False.
+"""
+import copy
+
+from django.db.models.fields.files import FieldFile
+
+_SIN_CARGAR = object()
+
+
+class SeguimientoCambiosMixin:
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._valores_cargados = {}
+        instancia._recordar_valores(cls._campos_seguidos())
+        return instancia
+
+    @classmethod
+    def _campos_seguidos(cls):
+        return [campo.attname for campo in cls._meta.concrete_fields if not campo.primary_key]
+
+    def _valor_actual(self, campo):
+        valor = self.__dict__.get(campo, _SIN_CARGAR)
+        if isinstance(valor, FieldFile):
+            # Comparamos el nombre guardado, no el objeto (que puede envolver un archivo subido).
+            return valor.name
+        if isinstance(valor, (list, dict)):
+            return copy.deepcopy(valor)
+        return valor
+
+    def _recordar_valores(self, campos):
+        for campo in campos:
+            valor = self._valor_actual(campo)
+            if valor is not _SIN_CARGAR:
+                self._valores_cargados[campo] = valor
+
+    def tiene_valor_cargado(self, campo):
+        return campo in getattr(self, '_valores_cargados', {})
+
+    def valor_cargado(self, campo, defecto=None):
+        """Valor de `campo` (su attname) con que se cargó o guardó la instancia."""
+        return getattr(self, '_valores_cargados', {}).get(campo, defecto)
+
+    def ha_cambiado(self, campo):
+        """True si `campo` (su attname, p. ej. 'categoria_id') difiere del valor cargado."""
+        if not self.tiene_valor_cargado(campo):
+            return True
+        return self._valor_actual(campo) != self._valores_cargados[campo]
+
+    def campos_cambiados(self):
+        """Lista de attnames modificados desde que se cargó o guardó la instancia."""
+        return [campo for campo in self._campos_seguidos() if self.ha_cambiado(campo)]
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Lo guardado pasa a ser el nuevo estado "cargado".
+        if not hasattr(self, '_valores_cargados'):
+            self._valores_cargados = {}
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            campos = self._campos_seguidos()
+        else:
+            campos = [self._meta.get_field(campo).attname for campo in update_fields]
+        self._recordar_valores(campos)
@@ -0,0 +1,133 @@
+# catalogo/tree.py
+"""
+Árbol de categorías en memoria.
+
+Solo hay unas decenas de categorías, así que cada proceso guarda el árbol
+completo (cargado con una sola consulta) y responde en O(1) preguntas como
+"¿quién es el padre?", "¿cuáles son sus descendientes?" o "¿cuál es su ruta
+de migas de pan?" sin tocar la base de datos.
+
+El árbol se marca con la versión 'categorias' (ver `versioning.py`), que las
+señales de `Categoria` incrementan al guardar o borrar.
+"""
+import threading
+
+from .versioning import obtener_version
+
+VERSION = 'categorias'
+
+_arbol = None
+_lock = threading.Lock()
+
+
+class NodoCategoria:
+    """Datos mínimos de una categoría. Expone `id` y `nombre` como el modelo."""
+    __slots__ = ('id', 'nombre', 'parent_id')
+
+    def __init__(self, id, nombre, parent_id):
+        self.id = id
+        self.nombre = nombre
+        self.parent_id = parent_id
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __repr__(self):
+        return f'<NodoCategoria {self.id}: {self.nombre}>'
+
+
+class ArbolCategorias:
+    def __init__(self, filas, version):
+        """`filas` es un iterable de (id, nombre, parent_id) ordenado por nombre."""
+        self.version = version
+        self.nodos = {}
+        self._hijos = {}
+        for pk, nombre, parent_id in filas:
+            self.nodos[pk] = NodoCategoria(pk, nombre, parent_id)
+            self._hijos.setdefault(pk, [])
+        self.raices = []
+        for nodo in self.nodos.values():
+            if nodo.parent_id in self.nodos:
+                self._hijos[nodo.parent_id].append(nodo)
+            else:
+                self.raices.append(nodo)
+
+        # Precalculamos ancestros y descendientes: con decenas de filas es instantáneo
+        # y así cada consulta posterior es una simple búsqueda en un diccionario.
+        self._ancestros = {pk: self._calcular_ancestros(pk) for pk in self.nodos}
+        self._descendientes = {pk: [] for pk in self.nodos}
+        for pk, ancestros in self._ancestros.items():
+            for ancestro in ancestros:
+                self._descendientes[ancestro.id].append(self.nodos[pk])
+
+    def _calcular_ancestros(self, pk):
+        ancestros = []
+        vistos = {pk}
+        padre = self.nodos[pk].parent_id
+        # `vistos` nos protege de un ciclo accidental en los datos (A > B > A).
+        while padre in self.nodos and padre not in vistos:
+            ancestros.append(self.nodos[padre])
+            vistos.add(padre)
+            padre = self.nodos[padre].parent_id
+        ancestros.reverse()
+        return tuple(ancestros)
+
+    def __contains__(self, pk):
+        return pk in self.nodos
+
+    def get(self, pk):
+        return self.nodos.get(pk)
+
+    def padre(self, pk):
+        nodo = self.nodos.get(pk)
+        return self.nodos.get(nodo.parent_id) if nodo else None
+
+    def hijos(self, pk):
+        """Subcategorías directas, ordenadas por nombre."""
+        return self._hijos.get(pk, [])
+
+    def ancestros(self, pk):
+        """Ancestros desde la raíz hasta el padre (sin incluir la propia categoría)."""
+        return self._ancestros.get(pk, ())
+
+    def descendientes(self, pk, incluir_propia=False):
+        """Todas las subcategorías a cualquier profundidad."""
+        descendientes = self._descendientes.get(pk, [])
+        if incluir_propia and pk in self.nodos:
+            return [self.nodos[pk], *descendientes]
+        return descendientes
+
+    def ids_descendientes(self, pk, incluir_propia=True):
+        return [nodo.id for nodo in self.descendientes(pk, incluir_propia)]
+
+    def profundidad(self, pk):
+        return len(self._ancestros.get(pk, ()))
+
+    def ruta(self, pk):
+        """Migas de pan: lista de nodos desde la raíz hasta la propia categoría."""
+        nodo = self.nodos.get(pk)
+        return [*self.ancestros(pk), nodo] if nodo else []
+
+    def nombre_completo(self, pk, separador=' > '):
+        return separador.join(nodo.nombre for nodo in self.ruta(pk))
+
+
+def construir_arbol(version):
+    from .models import Categoria
+
+    filas = Categoria.objects.order_by('nombre', 'id').values_list('id', 'nombre', 'parent_id')
+    return ArbolCategorias(filas, version)
+
+
+def obtener_arbol():
+    """Devuelve el árbol del proceso, reconstruyéndolo si su versión está desfasada."""
+    global _arbol
+    version = obtener_version(VERSION)
+    arbol = _arbol
+    if arbol is None or arbol.version != version:
+        with _lock:
+            if _arbol is None or _arbol.version != version:
+                _arbol = construir_arbol(version)
+            arbol = _arbol
+    return arbol
@@ -0,0 +1,177 @@
+# catalogo/trigrams.py
+"""
+Búsqueda tolerante a errores de escritura mediante trigramas del nombre.
+
+Un trigrama es cada grupo de tres letras consecutivas de una palabra, con el
+mismo relleno que usa `pg_trgm` ("  des", "desa", ..., "or "). Dos textos que
+comparten la mayoría de sus trigramas son parecidos aunque tengan una letra
+de más o de menos: "desarmadr" comparte 8 de sus 10 trigramas con "desarmador".
+
+- En PostgreSQL con la extensión `pg_trgm` usamos `word_similarity` y el índice
+  GIN `gin_trgm_ops` sobre `catalogo_producto.nombre`.
+- En el resto de bases de datos mantenemos la tabla `TrigramaProducto` con las
+  señales de `Producto` y contamos coincidencias con un GROUP BY indexado.
+
+La similitud es la fracción de trigramas del término que aparecen en el nombre
+(equivalente a `word_similarity`), así un nombre largo no se penaliza.
+"""
+import math
+
+from django.conf import settings
+from django.db import connection as default_connection, connections, transaction
+from django.db.models import Count, F, FloatField, Func, Value
+
+from .text import palabras
+
+TAMANO_LOTE = 1000
+
+
+def trigramas(texto):
+    """Devuelve el conjunto de trigramas de `texto`, normalizado y sin acentos."""
+    resultado = set()
+    for palabra in palabras(texto):
+        relleno = f'  {palabra} '
+        resultado.update(relleno[i:i + 3] for i in range(len(relleno) - 2))
+    return resultado
+
+
+class LocalTrigramBackend:
+    """Índice de trigramas en la tabla `TrigramaProducto`."""
+    usa_tabla = True
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def buscar(self, query, limite, queryset=None):
+        from .models import TrigramaProducto
+
+        buscados = trigramas(query)
+        if not buscados:
+            return []
+        minimo = max(1, math.ceil(len(buscados) * settings.BUSQUEDA_SIMILITUD_MINIMA))
+        filas = TrigramaProducto.objects.filter(trigrama__in=buscados)
+        if queryset is not None:
+            filas = filas.filter(producto__in=queryset.order_by().values('id'))
+        filas = (
+            filas.values('producto_id')
+            .annotate(comunes=Count('id'))
+            .filter(comunes__gte=minimo)
+            .order_by('-comunes', 'producto_id')[:limite]
+        )
+        return [(fila['producto_id'], fila['comunes'] / len(buscados)) for fila in filas]
+
+
+class PgTrgmBackend:
+    """Similitud con la extensión `pg_trgm` de PostgreSQL."""
+    usa_tabla = False
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def buscar(self, query, limite, queryset=None):
+        from .models import Producto
+
+        texto = ' '.join(palabras(query))
+        if not texto:
+            return []
+        if queryset is None:
+            queryset = Producto.objects.all()
+        filas = (
+            queryset.order_by()
+            # `<%` es el operador de word_similarity; así PostgreSQL usa el índice GIN.
+            .extra(where=['%s <%% catalogo_producto.nombre'], params=[texto])
+            .annotate(similitud=Func(
+                Value(texto), F('nombre'), function='word_similarity', output_field=FloatField()))
+            .filter(similitud__gte=settings.BUSQUEDA_SIMILITUD_MINIMA)
+            .order_by('-similitud', 'id')
+            .values_list('id', 'similitud')[:limite]
+        )
+        # `<%` no filtra con BUSQUEDA_SIMILITUD_MINIMA sino con
+        # `pg_trgm.word_similarity_threshold` (0.6 por defecto): lo igualamos al ajuste
+        # para esta transacción, o un mínimo más bajo no tendría efecto.
+        with transaction.atomic(using=self.connection.alias):
+            with self.connection.cursor() as cursor:
+                cursor.execute("SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)",
+                               [str(settings.BUSQUEDA_SIMILITUD_MINIMA)])
+            return list(filas)
+
+
+# Cache por alias de conexión del backend elegido.
+_backends = {}
+
+
+def _pg_trgm_instalado(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def get_backend(connection=None):
+    connection = connection or default_connection
+    if connection.alias not in _backends:
+        if connection.vendor == 'postgresql' and _pg_trgm_instalado(connection):
+            _backends[connection.alias] = PgTrgmBackend(connection)
+        else:
+            _backends[connection.alias] = LocalTrigramBackend(connection)
+    return _backends[connection.alias]
+
+
+def buscar_similares(query, limite, queryset=None):
+    """
+    Devuelve hasta `limite` pares (id, similitud) de productos cuyo nombre se parece
+    a `query`, del más al menos parecido. `queryset` restringe los candidatos.
+    """
+    return get_backend().buscar(query, limite, queryset)
+
+
+def actualizar_trigramas(producto, created=False):
+    """Sincroniza los trigramas de un producto con su nombre actual."""
+    from .models import TrigramaProducto
+
+    if not get_backend().usa_tabla:
+        return
+    nuevos = trigramas(producto.nombre)
+    if created:
+        actuales = set()
+    else:
+        actuales = set(TrigramaProducto.objects.filter(producto=producto).values_list('trigrama', flat=True))
+    if nuevos == actuales:
+        return
+    if actuales - nuevos:
+        TrigramaProducto.objects.filter(producto=producto, trigrama__in=actuales - nuevos).delete()
+    TrigramaProducto.objects.bulk_create(
+        [TrigramaProducto(producto=producto, trigrama=trigrama) for trigrama in nuevos - actuales],
+        batch_size=TAMANO_LOTE,
+    )
+
+
+def reconstruir_indice(productos=None, trigrama_model=None):
+    """
+    Reconstruye la tabla de trigramas desde cero. Útil tras `bulk_create` o
+    `queryset.update(nombre=...)`, que no disparan señales. `productos` es un
+    queryset opcional para limitar la reconstrucción.
+    """
+    from .models import Producto, TrigramaProducto
+
+    trigrama_model = trigrama_model or TrigramaProducto
+    if productos is None:
+        productos = Producto.objects.all()
+    using = productos.db
+    connection = connections[using]
+    # Son decenas de miles de filas de dos columnas: las insertamos con executemany en vez
+    # de crear una instancia del modelo por fila para bulk_create.
+    tabla = connection.ops.quote_name(trigrama_model._meta.db_table)
+    columnas = ', '.join(
+        connection.ops.quote_name(trigrama_model._meta.get_field(campo).column) for campo in ('producto', 'trigrama'))
+    sql = f'INSERT INTO {tabla} ({columnas}) VALUES (%s, %s)'
+    with transaction.atomic(using=using):
+        trigrama_model.objects.using(using).filter(producto__in=productos.order_by().values('id')).delete()
+        with connection.cursor() as cursor:
+            lote = []
+            for pk, nombre in productos.order_by().values_list('id', 'nombre').iterator(chunk_size=TAMANO_LOTE):
+                lote.extend((pk, trigrama) for trigrama in trigramas(nombre))
+                if len(lote) >= TAMANO_LOTE:
+                    cursor.executemany(sql, lote)
+                    lote = []
+            if lote:
+                cursor.executemany(sql, lote)
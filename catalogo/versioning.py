@@ -0,0 +1,86 @@
+# catalogo/versioning.py
+"""
+Números de versión compartidos entre procesos, guardados en el alias de caché
+`versiones` (ver `CACHES` en settings).
+
+Cada versión tiene un nombre ('productos', 'categorias', ...). Las señales la
+incrementan cuando cambian los datos y los cachés locales de cada proceso
+(índices en memoria, árbol de categorías, etc.) se comparan con ella para saber
+si deben reconstruirse. El alias es un backend compartido (archivos, Redis), así
+que todos los workers de gunicorn ven la edición hecha en cualquiera de ellos.
+Va aparte de la caché de páginas para que las versiones no se desalojen.
+
+El incremento tiene que ser atómico: si dos ediciones simultáneas guardaran las
+dos v+1, lo reconstruido entre ambas quedaría cacheado con la versión final hasta
+la siguiente edición. Lo es en Redis y Memcached y en `CacheArchivos` (bloqueo de
+archivo, un solo servidor); no en el `FileBasedCache` ni el `LocMemCache` de
+Django entre procesos.
+"""
+import time
+from functools import partial
+
+from django.core.cache import caches
+from django.db import transaction
+
+
+def _cache():
+    return caches['versiones']
+
+
+def _clave(nombre):
+    return f'catalogo:version:{nombre}'
+
+
+def _version_inicial():
+    # Usamos la hora actual en lugar de 1 para que, si la caché se vacía o se
+    # reinicia, la nueva versión nunca coincida con una que un proceso ya tenga.
+    return int(time.time() * 1000)
+
+
+def obtener_version(nombre):
+    """Devuelve la versión actual de `nombre`, creándola si no existe."""
+    clave = _clave(nombre)
+    version = _cache().get(clave)
+    if version is None:
+        _cache().add(clave, _version_inicial(), timeout=None)
+        version = _cache().get(clave)
+    return version
+
+
+def incrementar_version(nombre):
+    """Marca como obsoleto todo lo que dependa de `nombre`."""
+    clave = _clave(nombre)
+    try:
+        return _cache().incr(clave)
+    except ValueError:
+        # La clave no existía (caché vacía): la creamos y volvemos a intentar.
+        _cache().add(clave, _version_inicial(), timeout=None)
+        return _cache().incr(clave)
+
+
+def incrementar_version_al_confirmar(nombre, using=None):
+    """
+    Como `incrementar_version`, pero al confirmarse la transacción en curso (en el
+    momento si no hay ninguna). Antes del commit, una petición concurrente podría
+    reconstruir el índice, el árbol o una página con las filas anteriores y
+    guardarlos con la versión nueva, donde seguirían hasta la siguiente edición.
+    """
+    transaction.on_commit(partial(incrementar_version, nombre), using=using)
+
+
+def obtener_versiones(*nombres):
+    """Devuelve las versiones de varios nombres con una sola ida a la caché."""
+    claves = {nombre: _clave(nombre) for nombre in nombres}
+    encontradas = _cache().get_many(claves.values())
+    return tuple(
+        encontradas[clave] if clave in encontradas else obtener_version(nombre)
+        for nombre, clave in claves.items()
+    )
+
+
+def version_catalogo():
+    """
+    Versión de todo el contenido público del catálogo: cambia cuando se edita
+    cualquier producto o categoría.
+    """
+    return '.'.join(str(version) for version in obtener_versiones('productos', 'categorias'))
@@ -1,12 +1,56 @@
 from django.shortcuts import render, get_object_or_404
-from .models import Producto, Categoria
+from .models import Producto, Categoria, RelacionCategoria
 from django.core.paginator import Paginator
 from django.http import JsonResponse
-from django.urls import reverse
 from collections import defaultdict
+from django.db.models import Case, F, Max, OuterRef, Subquery, Value, When, Window
+from django.db.models.functions import RowNumber
 from django.templatetags.static import static as static_url
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.conf import settings # <-- IMPORTAMOS SETTINGS
+from ferreteria.instrumentacion import medir
+from .decorators import cache_pagina_catalogo, pagina_condicional
+from .paginacion import PaginadorCursor
+from .search import buscar_productos_tolerante
+from .suggestions import VERSION as VERSION_SUGERENCIAS, obtener_sugerencias
+from .tree import obtener_arbol
+from .versioning import obtener_version, version_catalogo
 
+def productos_portada(ids_categorias):
+    """
+    Devuelve un diccionario {id_categoria: producto} con el producto de portada de
+    cada categoría, con DOS consultas sea cual sea el número de categorías: una con
+    función de ventana que elige el id de cada portada y un `in_bulk` que los carga.
+
+    Gracias a la tabla de cierre (RelacionCategoria) se buscan productos en la
+    categoría y en todas sus subcategorías, a cualquier profundidad. Prioridad
+    (determinista): primero la propia categoría y luego las subcategorías más
+    cercanas; dentro de eso, los productos que tienen imagen, y por último el id más bajo.
+    """
+    if not ids_categorias:
+        return {}
+    # Una fila por cada par (categoría pedida, producto de su subárbol).
+    candidatos = (
+        RelacionCategoria.objects
+        .filter(ancestro_id__in=ids_categorias, descendiente__productos__imagen__isnull=False)
+        .annotate(
+            producto_id=F('descendiente__productos__id'),
+            sin_imagen=Case(When(descendiente__productos__imagen='', then=Value(1)), default=Value(0)),
+        )
+        .annotate(posicion=Window(
+            RowNumber(),
+            partition_by=F('ancestro_id'),
+            order_by=[F('profundidad').asc(), F('sin_imagen').asc(), F('producto_id').asc()],
+        ))
+        .filter(posicion=1)
+        .values_list('ancestro_id', 'producto_id')
+    )
+    ids_portada = dict(candidatos)
+    productos = Producto.objects.in_bulk(set(ids_portada.values()))
+    return {pk: productos[producto_id] for pk, producto_id in ids_portada.items()}
+
+@cache_pagina_catalogo
 def inicio(request):
     # --- VISTA OPTIMIZADA ---
     # 1. Obtenemos todos los productos "más vendidos" en una sola consulta.
@@ -36,22 +80,44 @@ def inicio(request):
     context = {'datos_por_categoria': datos_por_categoria, 'productos_novedades': productos_novedades, 'productos_en_stock_inicio': productos_en_stock_inicio}
     return render(request, 'inicio.html', context)
 
+def paginar_productos(request, productos, por_nombre):
+    """
+    Página de `productos` que pide la petición. Los listados por nombre usan la
+    paginación por cursor (`?cursor=`, ver `paginacion.py`); los ordenados por
+    relevancia, `Paginator` con número de página (`?page=`).
+    """
+    if por_nombre:
+        return PaginadorCursor(productos, settings.PRODUCTOS_POR_PAGINA).get_page(request.GET.get('cursor'))
+    return Paginator(productos, settings.PRODUCTOS_POR_PAGINA).get_page(request.GET.get('page'))
+
+
+def parametros_paginacion(request):
+    """Query string de la petición sin `page` ni `cursor`, para los enlaces de la paginación."""
+    parametros = request.GET.copy()
+    parametros.pop('page', None)
+    parametros.pop('cursor', None)
+    return parametros.urlencode()
+
+
+@cache_pagina_catalogo
 def catalogo(request):
     # Obtenemos el término de búsqueda de la URL, si existe
     query = request.GET.get('q')
     
     if query:
         # --- LÓGICA DE BÚSQUEDA ---
-        # Si hay un 'query', buscamos en todos los productos
-        productos_list = Producto.objects.filter(nombre__icontains=query).order_by('nombre')
-        
-        paginator = Paginator(productos_list, settings.PRODUCTOS_POR_PAGINA) 
-        page_number = request.GET.get('page')
-        productos_pagina = paginator.get_page(page_number)
+        # Si hay un 'query', buscamos en todos los productos usando el índice de texto
+        # completo (FTS5 / tsvector), ordenado por relevancia. Si hay pocos resultados
+        # se completan con nombres parecidos (errores de escritura).
+        # Con `?orden=nombre` se ordena alfabéticamente y se pagina por cursor.
+        productos_list = buscar_productos_tolerante(query)
+        por_nombre = request.GET.get('orden') == 'nombre'
 
         context = {
             'is_search_results': True,
-            'productos': productos_pagina,
+            'productos': paginar_productos(request, productos_list, por_nombre),
+            'paginacion_cursor': por_nombre,
+            'parametros_paginacion': parametros_paginacion(request),
             'query': query,
         }
         return render(request, 'catalogo.html', context)
@@ -61,37 +127,20 @@ def catalogo(request):
         # --- LÓGICA CORREGIDA Y SIMPLIFICADA PARA BUSCAR IMÁGENES DE PORTADA ---
         
         # 1. Obtenemos solo las categorías principales (las que no tienen padre).
-        categorias_principales = Categoria.objects.filter(parent__isnull=True).order_by('nombre')
-        #    Usamos prefetch_related para cargar todas las subcategorías de una vez y evitar
-        #    múltiples consultas a la base de datos dentro del bucle.
-        categorias_principales = categorias_principales.prefetch_related('subcategorias')
+        categorias_principales = list(Categoria.objects.filter(parent__isnull=True).order_by('nombre'))
+
+        # 2. Buscamos la portada de TODAS las categorías con una sola consulta (ver `productos_portada`),
+        #    en lugar de una o dos consultas por categoría.
+        portadas = productos_portada([categoria.id for categoria in categorias_principales])
 
-        # 2. Construimos la lista de datos para la plantilla.
+        # 3. Construimos la lista de datos para la plantilla.
         datos_categorias = []
         for categoria in categorias_principales:
-            # --- LÓGICA DE BÚSQUEDA DE IMAGEN CON PRIORIDAD ---
-            
-            # Prioridad 1: Buscar un producto con imagen directamente en la categoría principal.
-            primer_producto_con_imagen = Producto.objects.filter(
-                categoria=categoria,
-                imagen__isnull=False
-            ).first()
-            
-            # Prioridad 2: Si no se encontró, buscar en todas las subcategorías.
-            if not primer_producto_con_imagen:
-                # Obtenemos los IDs de todas las subcategorías de esta categoría principal.
-                ids_subcategorias = [sub.id for sub in categoria.subcategorias.all()]
-                if ids_subcategorias:
-                    primer_producto_con_imagen = Producto.objects.filter(
-                        categoria_id__in=ids_subcategorias,
-                        imagen__isnull=False
-                    ).first()
-
             datos_categorias.append({
                 'categoria': categoria,
                 # Pasamos el producto entero. La plantilla se encargará de acceder a la imagen.
                 # --- CORRECCIÓN: Usamos el nombre 'producto_portada' que la plantilla espera ---
-                'producto_portada': primer_producto_con_imagen
+                'producto_portada': portadas.get(categoria.id)
             })
 
         # Obtenemos algunos productos con stock para mostrar (los 8 más recientes)
@@ -99,16 +148,30 @@ def catalogo(request):
 
         context = {
             'is_search_results': False, 
+            # La usan las cachés de fragmentos de la plantilla para invalidarse al editar.
+            'version_catalogo': version_catalogo(),
             'datos_categorias': datos_categorias,
             'productos_en_stock': productos_en_stock
         }
         return render(request, 'catalogo.html', context)
 
+def ultima_modificacion_categoria(request, categoria_id, **kwargs):
+    """
+    Fecha de la última modificación de la página de la categoría. Las señales la
+    mantienen al día con los cambios del subárbol y de las migas de pan (ver
+    `models.marcar_modificados`), así que basta leerla por clave primaria.
+    """
+    return Categoria.objects.filter(pk=categoria_id).values_list('actualizado', flat=True).first()
+
+
+@pagina_condicional(ultima_modificacion_categoria)
 def categoria_detalle(request, categoria_id):
     categoria = get_object_or_404(Categoria, id=categoria_id)
 
-    # 1. Obtenemos todas las subcategorías directas de la categoría actual.
-    subcategorias = categoria.subcategorias.all().order_by('nombre')
+    # 1. Obtenemos todas las subcategorías directas de la categoría actual del árbol
+    #    en memoria (ver tree.py), sin consultar la base de datos.
+    arbol = obtener_arbol()
+    subcategorias = arbol.hijos(categoria.id)
 
     # Obtenemos el término de búsqueda de la URL, si existe
     query = request.GET.get('q')
@@ -116,44 +179,40 @@ def categoria_detalle(request, categoria_id):
     # --- LÓGICA MEJORADA: PREPARAMOS DATOS PARA AMBOS CASOS ---
     productos_pagina = []
     datos_subcategorias = []
+    por_nombre = False
 
-    if subcategorias.exists():
+    if subcategorias:
         # --- CASO 1: LA CATEGORÍA TIENE SUBCATEGORÍAS ---
         # Buscamos una imagen representativa para cada subcategoría.
         
-        # 1. Obtenemos todos los productos con imagen que pertenecen a nuestras subcategorías.
-        productos_con_imagen = Producto.objects.filter(
-            categoria__in=subcategorias, 
-            imagen__isnull=False
-        ).order_by('categoria_id', 'id')
-
-        # 2. Creamos un mapa para guardar solo la imagen del primer producto de cada subcategoría.
-        mapa_imagenes_subcat = {}
-        for producto in productos_con_imagen:
-            if producto.categoria_id not in mapa_imagenes_subcat:
-                mapa_imagenes_subcat[producto.categoria_id] = producto.imagen
-
-        # 3. Construimos la lista final para la plantilla.
+        # Una sola consulta para las portadas de todas las subcategorías.
+        portadas = productos_portada([subcat.id for subcat in subcategorias])
         for subcat in subcategorias:
+            portada = portadas.get(subcat.id)
             datos_subcategorias.append({
                 'categoria': subcat,
-                'imagen_representativa': mapa_imagenes_subcat.get(subcat.id)
+                'imagen_representativa': portada.imagen if portada else None
             })
     else:
         # --- CASO 2: LA CATEGORÍA NO TIENE SUBCATEGORÍAS (MOSTRAMOS PRODUCTOS) ---
-        productos_list = Producto.objects.filter(categoria=categoria).order_by('nombre')
+        # Sin búsqueda, el listado va por nombre y se pagina por cursor: la página
+        # 200 de una categoría grande cuesta lo mismo que la primera.
+        productos_list = Producto.objects.filter(categoria=categoria)
+        por_nombre = not query or request.GET.get('orden') == 'nombre'
         
         if query:
-            productos_list = productos_list.filter(nombre__icontains=query)
+            productos_list = buscar_productos_tolerante(query, productos_list)
 
-        paginator = Paginator(productos_list, settings.PRODUCTOS_POR_PAGINA) 
-        page_number = request.GET.get('page')
-        productos_pagina = paginator.get_page(page_number)
+        productos_pagina = paginar_productos(request, productos_list, por_nombre)
     
     context = {
         'categoria': categoria,
+        # Migas de pan desde la categoría raíz hasta la actual, a cualquier profundidad.
+        'migas': arbol.ruta(categoria.id),
         'datos_subcategorias': datos_subcategorias, # <-- Nueva estructura con imágenes
         'productos': productos_pagina,
+        'paginacion_cursor': por_nombre,
+        'parametros_paginacion': parametros_paginacion(request),
         'query': query,
     }
     return render(request, 'categoria_detalle/categoria_detalle.html', context)
@@ -162,6 +221,27 @@ import json
 from django.utils.safestring import mark_safe
 from datetime import datetime
 
+def ultima_modificacion_producto(request, producto_id, **kwargs):
+    """
+    Fecha de la última modificación de la página del producto: la suya (que incluye
+    su categoría) o la de cualquiera de sus refacciones o de los productos de los
+    que es refacción, que también se muestran. Una sola consulta por clave
+    primaria; las subconsultas usan los índices de la tabla de refacciones.
+    """
+    Enlace = Producto.accesorios.through
+    refacciones = (Enlace.objects.filter(from_producto=OuterRef('pk')).values('from_producto')
+                   .annotate(ultima=Max('to_producto__actualizado')).values('ultima'))
+    principales = (Enlace.objects.filter(to_producto=OuterRef('pk')).values('to_producto')
+                   .annotate(ultima=Max('from_producto__actualizado')).values('ultima'))
+    fila = (Producto.objects.filter(pk=producto_id)
+            .annotate(refacciones=Subquery(refacciones), principales=Subquery(principales))
+            .values_list('actualizado', 'refacciones', 'principales').first())
+    if fila is None:
+        return None
+    return max(fecha for fecha in fila if fecha is not None)
+
+
+@pagina_condicional(ultima_modificacion_producto)
 def producto_detalle(request, producto_id):
     # Usamos prefetch_related para cargar eficientemente los accesorios y los productos principales
     # en una sola consulta adicional, evitando el problema N+1.
@@ -191,10 +271,12 @@ def producto_detalle(request, producto_id):
     if producto.imagen and hasattr(producto.imagen, 'url'):
         json_ld_data['image'] = request.build_absolute_uri(producto.imagen.url)
 
+    # Convertimos el diccionario a JSON y lo marcamos como seguro para la plantilla.
+    with medir('json'):
+        json_ld = mark_safe(json.dumps(json_ld_data, ensure_ascii=False))
     context = {
         'producto': producto,
-        # Convertimos el diccionario a JSON y lo marcamos como seguro para la plantilla.
-        'json_ld_data': mark_safe(json.dumps(json_ld_data, ensure_ascii=False))
+        'json_ld_data': json_ld,
     }
     return render(request, 'categoria_detalle/producto_detalle.html', context)
     
@@ -204,26 +286,39 @@ def quienes_somos(request):
 def contacto(request):
     return render(request, 'contacto.html')
 
+def etag_sugerencias(request):
+    # Las sugerencias salen del índice en memoria, que cambia con la versión de los
+    # productos: el ETag se resuelve con la caché, sin consultar la base de datos.
+    return str(obtener_version(VERSION_SUGERENCIAS))
+
+
 # --- NUEVA VISTA PARA AUTOCOMPLETADO ---
+@cache_control(no_cache=True)
+@condition(etag_func=etag_sugerencias)
 def search_suggestions(request):
     """
     Vista que devuelve sugerencias de productos en formato JSON
     para la funcionalidad de autocompletado.
+    Las sugerencias salen del índice en memoria de `suggestions.py`; solo se consulta
+    la BD (índice de trigramas) cuando el término parece tener errores de escritura.
     """
     term = request.GET.get('term', '').strip()
     suggestions = []
     if len(term) >= settings.SUGERENCIAS_BUSQUEDA_MIN_CHARS: # Usamos el valor de settings
-        # Obtenemos la URL de la imagen de marcador de posición una sola vez
-        placeholder_url = request.build_absolute_uri(static_url('img/placeholder.png'))
-        productos = Producto.objects.filter(nombre__icontains=term)[:settings.SUGERENCIAS_BUSQUEDA_MAX] # Usamos el valor de settings
-        for producto in productos:
-            # Obtenemos la URL de la imagen del producto o el marcador de posición
-            image_url = request.build_absolute_uri(producto.imagen.url) if producto.imagen and hasattr(producto.imagen, 'url') else placeholder_url
-            
+        # Calculamos una sola vez la base absoluta (esquema + host) en lugar de llamar
+        # a build_absolute_uri por cada fila.
+        base_url = request.build_absolute_uri('/')[:-1]
+
+        def absoluta(url):
+            return base_url + url if url.startswith('/') else url
+
+        placeholder_url = absoluta(static_url('img/placeholder.png'))
+        entradas = obtener_sugerencias(term, settings.SUGERENCIAS_BUSQUEDA_MAX) # Usamos el valor de settings
+        for _pk, nombre, url, imagen_url in entradas:
             suggestions.append({
-                'label': producto.nombre,
-                'url': reverse('catalogo:producto_detalle', args=[producto.id]),
-                'image_url': image_url # <-- AÑADIMOS LA URL DE LA IMAGEN
+                'label': nombre,
+                'url': url,
+                'image_url': absoluta(imagen_url) if imagen_url else placeholder_url # <-- AÑADIMOS LA URL DE LA IMAGEN
             })
     
     return JsonResponse(suggestions, safe=False)
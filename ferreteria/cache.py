@@ -0,0 +1,62 @@
+# ferreteria/cache.py
+"""
+Caché en archivos compartida por los workers (ver `CACHES` en settings).
+
+`FileBasedCache` de Django lista todo el directorio en cada escritura para ver si
+se pasó de `MAX_ENTRIES`. Con las decenas de miles de tarjetas y páginas del
+catálogo eso son unos 20 ms por `set` (un `set_many` de 12 tarjetas, 12 listados).
+`CacheArchivos` hace esa comprobación solo en una de cada `PODA_CADA` escrituras
+(opción de `OPTIONS`, 100 por defecto): el directorio puede pasarse del máximo en
+unas pocas entradas hasta la siguiente poda.
+
+`incr` y `add` de `FileBasedCache` leen y después escriben: dos workers que
+incrementan a la vez la misma versión guardarían los dos v+1 y se perdería un
+incremento. `CacheArchivos` los hace bajo un bloqueo de archivo (`flock`), que
+vale entre los procesos de un mismo servidor. Sin `fcntl` (Windows) no hay
+bloqueo; con varios servidores hace falta Redis o Memcached, cuyo `incr` es atómico.
+"""
+import os
+import random
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+ARCHIVO_BLOQUEO = '.bloqueo'
+
+
+class CacheArchivos(FileBasedCache):
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._poda_cada = params.get('OPTIONS', {}).get('PODA_CADA', 100)
+
+    def _cull(self):
+        if self._poda_cada <= 1 or random.randrange(self._poda_cada) == 0:
+            super()._cull()
+
+    @contextmanager
+    def _bloqueo(self):
+        if fcntl is None:
+            yield
+            return
+        # No termina en `cache_suffix`: `clear` y la poda no lo ven.
+        self._createdir()
+        with open(os.path.join(self._dir, ARCHIVO_BLOQUEO), 'a') as archivo:
+            fcntl.flock(archivo, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(archivo, fcntl.LOCK_UN)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._bloqueo():
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        with self._bloqueo():
+            return super().incr(key, delta, version)
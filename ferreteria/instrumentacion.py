@@ -0,0 +1,314 @@
+# ferreteria/instrumentacion.py
+"""
+Instrumentación de cada petición, pensada para dejarla activa en producción.
+
+`MiddlewareInstrumentacion` mide por petición:
+
+- total: tiempo de la vista y de los middleware que van después de este.
+- sql / consultas: tiempo y número de consultas SQL (todas las bases de datos).
+- plantillas: tiempo de render de las plantillas (con el backend `PlantillasMedidas`).
+- segmentos propios marcados en el código con `medir('nombre')`, p. ej. el
+  `json.dumps` del JSON-LD de `producto_detalle`.
+
+Los segmentos se solapan: las consultas que lanza una plantilla al recorrer un
+queryset cuentan en "sql" y en "plantillas".
+
+Los tiempos se envían en la cabecera `Server-Timing` (las herramientas de
+desarrollo del navegador los muestran en la pestaña "Network"; por defecto solo a
+los usuarios staff, ver `INSTRUMENTACION_SERVER_TIMING`) y se acumulan en
+histogramas por nombre de URL (`catalogo:producto_detalle`, ...). Cada proceso
+vuelca sus histogramas a `INSTRUMENTACION_DIRECTORIO` como mucho cada
+`INSTRUMENTACION_INTERVALO` segundos; `/admin/metricas/` (solo staff) y
+`manage.py metricas_peticiones` juntan los de todos los procesos.
+
+El coste es de unos microsegundos por petición: unos `perf_counter`, una
+envoltura de `execute` por consulta y la suma en memoria bajo un lock. No se
+guarda nada por petición.
+"""
+import json
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.http import JsonResponse
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+# Límites superiores de los cubos de los histogramas (ms para tiempos, unidades
+# para el número de consultas). El último cubo no tiene límite.
+LIMITES = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+ARCHIVO_REINICIO = 'reinicio'
+
+_medicion_actual = ContextVar('medicion_actual', default=None)
+
+
+class Medicion:
+    """Tiempos acumulados (en segundos) de la petición en curso."""
+    __slots__ = ('segmentos', 'consultas', 'abiertos')
+
+    def __init__(self):
+        self.segmentos = {}
+        self.consultas = 0
+        self.abiertos = set()
+
+    def sumar(self, nombre, segundos):
+        self.segmentos[nombre] = self.segmentos.get(nombre, 0.0) + segundos
+
+
+@contextmanager
+def medir(nombre):
+    """
+    Suma a la petición en curso el tiempo del bloque como el segmento `nombre`.
+    Fuera de una petición instrumentada no hace nada. Si el bloque se anida
+    dentro de otro con el mismo nombre, solo cuenta el de fuera.
+    """
+    medicion = _medicion_actual.get()
+    if medicion is None or nombre in medicion.abiertos:
+        yield
+        return
+    medicion.abiertos.add(nombre)
+    inicio = perf_counter()
+    try:
+        yield
+    finally:
+        medicion.abiertos.discard(nombre)
+        medicion.sumar(nombre, perf_counter() - inicio)
+
+
+def _medir_consulta(execute, sql, params, many, context):
+    medicion = _medicion_actual.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    inicio = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicion.consultas += 1
+        medicion.sumar('sql', perf_counter() - inicio)
+
+
+class PlantillaMedida(Template):
+    def render(self, context=None, request=None):
+        with medir('plantillas'):
+            return super().render(context, request)
+
+
+class PlantillasMedidas(DjangoTemplates):
+    """Backend de plantillas de Django que mide el tiempo de render (segmento "plantillas")."""
+
+    def from_string(self, template_code):
+        return PlantillaMedida(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return PlantillaMedida(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class Histograma:
+    __slots__ = ('cubos', 'n', 'suma', 'maximo')
+
+    def __init__(self, cubos=None, n=0, suma=0.0, maximo=0.0):
+        self.cubos = cubos or [0] * (len(LIMITES) + 1)
+        self.n = n
+        self.suma = suma
+        self.maximo = maximo
+
+    def agregar(self, valor):
+        self.cubos[bisect_left(LIMITES, valor)] += 1
+        self.n += 1
+        self.suma += valor
+        if valor > self.maximo:
+            self.maximo = valor
+
+    def combinar(self, otro):
+        self.cubos = [a + b for a, b in zip(self.cubos, otro.cubos)]
+        self.n += otro.n
+        self.suma += otro.suma
+        self.maximo = max(self.maximo, otro.maximo)
+
+    def percentil(self, p):
+        """Límite superior del cubo donde cae el percentil `p` (el máximo si es el último cubo)."""
+        if not self.n:
+            return 0
+        objetivo = p / 100 * self.n
+        acumulado = 0
+        for i, cantidad in enumerate(self.cubos):
+            acumulado += cantidad
+            if acumulado >= objetivo:
+                return min(LIMITES[i], self.maximo) if i < len(LIMITES) else self.maximo
+        return self.maximo
+
+    def resumen(self):
+        return {
+            'n': self.n,
+            'media': round(self.suma / self.n, 2) if self.n else 0,
+            'p50': round(self.percentil(50), 2),
+            'p95': round(self.percentil(95), 2),
+            'p99': round(self.percentil(99), 2),
+            'max': round(self.maximo, 2),
+        }
+
+    def a_dict(self):
+        return {'cubos': self.cubos, 'n': self.n, 'suma': self.suma, 'maximo': self.maximo}
+
+
+class RegistroMetricas:
+    """Histogramas del proceso: {nombre de URL: {métrica: Histograma}}."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.datos = {}
+        self.desde = time.time()
+        self.ultimo_volcado = time.monotonic()
+
+    def registrar(self, vista, valores):
+        with self.lock:
+            metricas = self.datos.setdefault(vista, {})
+            for nombre, valor in valores.items():
+                histograma = metricas.get(nombre)
+                if histograma is None:
+                    histograma = metricas[nombre] = Histograma()
+                histograma.agregar(valor)
+        if time.monotonic() - self.ultimo_volcado >= settings.INSTRUMENTACION_INTERVALO:
+            self.volcar()
+
+    def volcar(self):
+        """Escribe los histogramas del proceso en su archivo de `INSTRUMENTACION_DIRECTORIO`."""
+        directorio = settings.INSTRUMENTACION_DIRECTORIO
+        os.makedirs(directorio, exist_ok=True)
+        with self.lock:
+            self.ultimo_volcado = time.monotonic()
+            try:
+                reinicio = os.path.getmtime(os.path.join(directorio, ARCHIVO_REINICIO))
+            except OSError:
+                reinicio = 0
+            if reinicio > self.desde:
+                # `metricas_peticiones --reiniciar`: se descarta lo acumulado antes.
+                self.datos = {}
+                self.desde = time.time()
+            contenido = {
+                'desde': self.desde,
+                'vistas': {
+                    vista: {nombre: histograma.a_dict() for nombre, histograma in metricas.items()}
+                    for vista, metricas in self.datos.items()
+                },
+            }
+        archivo = os.path.join(directorio, f'{socket.gethostname()}-{os.getpid()}.json')
+        temporal = f'{archivo}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as salida:
+            json.dump(contenido, salida)
+        os.replace(temporal, archivo)
+
+
+registro = RegistroMetricas()
+
+
+def leer_metricas(directorio=None):
+    """Junta los volcados de todos los procesos: {vista: {métrica: Histograma}}."""
+    directorio = directorio or settings.INSTRUMENTACION_DIRECTORIO
+    try:
+        nombres = sorted(os.listdir(directorio))
+    except FileNotFoundError:
+        return {}
+    total = {}
+    for nombre in nombres:
+        if not nombre.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directorio, nombre), encoding='utf-8') as archivo:
+                contenido = json.load(archivo)
+        except (OSError, ValueError):
+            continue
+        for vista, metricas in contenido['vistas'].items():
+            destino = total.setdefault(vista, {})
+            for metrica, datos in metricas.items():
+                destino.setdefault(metrica, Histograma()).combinar(Histograma(**datos))
+    return total
+
+
+def resumen_metricas(metricas):
+    """{vista: {métrica: {n, media, p50, p95, p99, max}}}, con las vistas más pedidas primero."""
+    def peticiones(elemento):
+        return -elemento[1]['total'].n if 'total' in elemento[1] else 0
+
+    return {
+        vista: {metrica: histograma.resumen() for metrica, histograma in sorted(datos.items())}
+        for vista, datos in sorted(metricas.items(), key=lambda elemento: (peticiones(elemento), elemento[0]))
+    }
+
+
+def reiniciar_metricas(directorio=None):
+    """Borra los volcados y avisa a los procesos vivos para que empiecen de cero."""
+    directorio = directorio or settings.INSTRUMENTACION_DIRECTORIO
+    os.makedirs(directorio, exist_ok=True)
+    for nombre in os.listdir(directorio):
+        if nombre.endswith('.json'):
+            os.remove(os.path.join(directorio, nombre))
+    with open(os.path.join(directorio, ARCHIVO_REINICIO), 'w'):
+        pass
+
+
+def enviar_server_timing(request):
+    """`INSTRUMENTACION_SERVER_TIMING`: True (a todos), 'staff' o False (a nadie)."""
+    modo = settings.INSTRUMENTACION_SERVER_TIMING
+    if modo == 'staff':
+        usuario = getattr(request, 'user', None)
+        return usuario is not None and usuario.is_staff
+    return bool(modo)
+
+
+def server_timing(medicion, total):
+    partes = [f'total;dur={total * 1000:.1f}']
+    for nombre, segundos in medicion.segmentos.items():
+        descripcion = f';desc="{medicion.consultas} consultas"' if nombre == 'sql' else ''
+        partes.append(f'{nombre};dur={segundos * 1000:.1f}{descripcion}')
+    return ', '.join(partes)
+
+
+@staff_member_required
+def vista_metricas(request):
+    """Resumen en JSON de los histogramas de todos los procesos (solo staff)."""
+    registro.volcar()
+    return JsonResponse(resumen_metricas(leer_metricas()), json_dumps_params={'indent': 2, 'ensure_ascii': False})
+
+
+class MiddlewareInstrumentacion:
+    """
+    Mide cada petición; conviene ponerlo el primero de `MIDDLEWARE`. En las
+    respuestas en streaming el total no incluye el envío del contenido.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        medicion = Medicion()
+        token = _medicion_actual.set(medicion)
+        inicio = perf_counter()
+        try:
+            with ExitStack() as pila:
+                for alias in connections:
+                    pila.enter_context(connections[alias].execute_wrapper(_medir_consulta))
+                respuesta = self.get_response(request)
+        finally:
+            _medicion_actual.reset(token)
+        total = perf_counter() - inicio
+
+        if enviar_server_timing(request):
+            respuesta['Server-Timing'] = server_timing(medicion, total)
+        coincidencia = getattr(request, 'resolver_match', None)
+        valores = {nombre: segundos * 1000 for nombre, segundos in medicion.segmentos.items()}
+        valores['total'] = total * 1000
+        valores['consultas'] = medicion.consultas
+        registro.registrar(coincidencia.view_name if coincidencia else '-', valores)
+        return respuesta
@@ -0,0 +1,190 @@
+# ferreteria/perfilador.py
+"""
+Perfilador por muestreo para las peticiones lentas (opcional: `PERFILADOR_ACTIVO`).
+
+Los tiempos de la instrumentación (ver `instrumentacion.py`) dicen qué parte de
+una petición es lenta; para saber qué función, hace falta la pila. Mientras se
+atiende una vista de `PERFILADOR_NAMESPACES`, un hilo del proceso mira cada
+`PERFILADOR_INTERVALO_MS` en qué pila está el hilo de la petición
+(`sys._current_frames()`) y cuenta las pilas. No se instrumenta ninguna función,
+así que el código corre a su velocidad normal. Al terminar, el perfil se guarda si:
+
+- la petición tardó más de `PERFILADOR_UMBRAL_MS`, o
+- es una de cada `PERFILADOR_CADA` (para ver también las peticiones normales).
+
+Cada perfil es un JSON en `PERFILADOR_DIRECTORIO` con la vista, la ruta, la query
+string, la duración y las pilas en formato "plegado" (`a;b;c` -> muestras, el de
+flamegraph.pl y speedscope). Se conservan los `PERFILADOR_MAX_ARCHIVOS` más
+recientes. `manage.py resumen_perfiles` junta los perfiles y muestra las
+funciones donde más tiempo se pasa.
+
+La medición empieza al resolver la URL (`process_view`): no incluye los
+middleware anteriores a la vista.
+"""
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+
+PROFUNDIDAD_MAXIMA = 128
+
+
+@lru_cache(maxsize=4096)
+def nombre_funcion(codigo):
+    """'funcion (ruta/archivo.py:linea)', con la ruta relativa al proyecto o a site-packages."""
+    ruta = codigo.co_filename
+    base = str(settings.BASE_DIR) + os.sep
+    if ruta.startswith(base):
+        ruta = ruta[len(base):]
+    elif 'site-packages' + os.sep in ruta:
+        ruta = ruta.split('site-packages' + os.sep, 1)[1]
+    return f'{codigo.co_name} ({ruta}:{codigo.co_firstlineno})'
+
+
+def pila_plegada(marco):
+    """La pila de `marco` como 'raíz;...;hoja'."""
+    nombres = []
+    while marco is not None and len(nombres) < PROFUNDIDAD_MAXIMA:
+        nombres.append(nombre_funcion(marco.f_code))
+        marco = marco.f_back
+    return ';'.join(reversed(nombres))
+
+
+class Muestreador:
+    """
+    Un hilo por proceso que cuenta las pilas de los hilos registrados. Duerme
+    mientras no hay ninguno; se arranca en la primera petición (después del fork
+    de los workers).
+    """
+
+    def __init__(self):
+        self.condicion = threading.Condition()
+        self.activos = {}
+        self.hilo = None
+
+    def iniciar(self, ident):
+        muestras = Counter()
+        with self.condicion:
+            self.activos[ident] = muestras
+            if self.hilo is None or not self.hilo.is_alive():
+                self.hilo = threading.Thread(target=self._bucle, name='perfilador', daemon=True)
+                self.hilo.start()
+            self.condicion.notify()
+        return muestras
+
+    def detener(self, ident):
+        with self.condicion:
+            return self.activos.pop(ident, Counter())
+
+    def _bucle(self):
+        while True:
+            # Se cuenta con el lock tomado para que `detener` no devuelva unas
+            # muestras que todavía se están modificando.
+            with self.condicion:
+                while not self.activos:
+                    self.condicion.wait()
+                marcos = sys._current_frames()
+                for ident, muestras in self.activos.items():
+                    marco = marcos.get(ident)
+                    if marco is not None:
+                        muestras[pila_plegada(marco)] += 1
+                marcos = marco = None  # no retener los marcos mientras se duerme
+            time.sleep(settings.PERFILADOR_INTERVALO_MS / 1000)
+
+
+muestreador = Muestreador()
+
+
+def guardar_perfil(perfil, directorio=None, maximo=None):
+    """Escribe el perfil y borra los más antiguos si se pasa de `maximo` archivos."""
+    directorio = directorio or settings.PERFILADOR_DIRECTORIO
+    maximo = maximo or settings.PERFILADOR_MAX_ARCHIVOS
+    os.makedirs(directorio, exist_ok=True)
+    # El nombre empieza por la fecha para que el orden alfabético sea el cronológico.
+    nombre = '{}-{}-{}-{}.json'.format(
+        timezone.now().strftime('%Y%m%d-%H%M%S-%f'), os.getpid(), perfil['motivo'],
+        perfil['vista'].replace(':', '_'))
+    temporal = os.path.join(directorio, f'.{nombre}.tmp')
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(perfil, archivo, ensure_ascii=False)
+    os.replace(temporal, os.path.join(directorio, nombre))
+
+    perfiles = sorted(n for n in os.listdir(directorio) if n.endswith('.json'))
+    for antiguo in perfiles[:max(0, len(perfiles) - maximo)]:
+        try:
+            os.remove(os.path.join(directorio, antiguo))
+        except FileNotFoundError:
+            pass  # Lo borró otro proceso.
+
+
+def leer_perfiles(directorio=None):
+    directorio = directorio or settings.PERFILADOR_DIRECTORIO
+    try:
+        nombres = sorted(os.listdir(directorio))
+    except FileNotFoundError:
+        return []
+    perfiles = []
+    for nombre in nombres:
+        if not nombre.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directorio, nombre), encoding='utf-8') as archivo:
+                perfiles.append(json.load(archivo))
+        except (OSError, ValueError):
+            continue
+    return perfiles
+
+
+class MiddlewarePerfilador:
+    def __init__(self, get_response):
+        if not settings.PERFILADOR_ACTIVO or not (settings.PERFILADOR_CADA or settings.PERFILADOR_UMBRAL_MS is not None):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.peticiones = itertools.count(1)
+
+    def process_view(self, request, vista, args, kwargs):
+        if request.resolver_match.namespace in settings.PERFILADOR_NAMESPACES:
+            ident = threading.get_ident()
+            request._perfilador = (ident, time.perf_counter(), muestreador.iniciar(ident))
+
+    def __call__(self, request):
+        try:
+            respuesta = self.get_response(request)
+        finally:
+            perfilando = getattr(request, '_perfilador', None)
+            if perfilando is not None:
+                ident, inicio, muestras = perfilando
+                muestreador.detener(ident)
+        if perfilando is None:
+            return respuesta
+
+        duracion = (time.perf_counter() - inicio) * 1000
+        umbral = settings.PERFILADOR_UMBRAL_MS
+        if umbral is not None and duracion >= umbral:
+            motivo = 'lento'
+        elif settings.PERFILADOR_CADA and next(self.peticiones) % settings.PERFILADOR_CADA == 0:
+            motivo = 'muestra'
+        else:
+            return respuesta
+        guardar_perfil({
+            'vista': request.resolver_match.view_name,
+            'metodo': request.method,
+            'ruta': request.path,
+            'query_string': request.META.get('QUERY_STRING', ''),
+            'estado': respuesta.status_code,
+            'motivo': motivo,
+            'duracion_ms': round(duracion, 2),
+            'fecha': timezone.now().isoformat(),
+            'intervalo_ms': settings.PERFILADOR_INTERVALO_MS,
+            'muestras': sum(muestras.values()),
+            'pilas': dict(muestras),
+        })
+        return respuesta
@@ -44,6 +44,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # El primero, para que su tiempo "total" incluya los demás middleware.
+    'ferreteria.instrumentacion.MiddlewareInstrumentacion',
+    # Solo actúa con PERFILADOR_ACTIVO = True (ver ferreteria/perfilador.py).
+    'ferreteria.perfilador.MiddlewarePerfilador',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,7 +61,8 @@ ROOT_URLCONF = 'ferreteria.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates que además mide el tiempo de render (ver ferreteria/instrumentacion.py).
+        'BACKEND': 'ferreteria.instrumentacion.PlantillasMedidas',
         'DIRS': [os.path.join(BASE_DIR,'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -132,6 +137,37 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
 ]
 
+# Caché
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Debe ser compartida por todos los workers de gunicorn: las páginas cacheadas, los
+# fragmentos de tarjetas y las versiones del catálogo (ver catalogo/versioning.py)
+# tienen que ser las mismas en todos los procesos, o tras una edición en el admin
+# cada worker seguiría sirviendo lo que tenía. Los archivos en disco (CacheArchivos,
+# que incrementa las versiones bajo un bloqueo de archivo) sirven para un servidor;
+# con varios servidores, usa Redis o Memcached en los dos alias, p. ej.:
+#   'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379'
+#
+# Las versiones van en su propio alias: son unas pocas claves que nunca deben
+# desalojarse para hacer sitio a páginas o tarjetas (perder una versión invalida
+# todas las páginas y el árbol de categorías).
+#
+# MAX_ENTRIES: cada producto tiene hasta cinco tarjetas cacheadas (una por variante,
+# ver templates/tarjetas/), unas 7.500 con los ~1.500 productos del catálogo, más
+# las páginas de búsquedas. Con el máximo por defecto (300) la caché se vaciaría
+# al azar con cada rastreo de los listados.
+CACHES = {
+    'default': {
+        'BACKEND': 'ferreteria.cache.CacheArchivos',
+        'LOCATION': BASE_DIR / 'cache' / 'paginas',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    'versiones': {
+        'BACKEND': 'ferreteria.cache.CacheArchivos',
+        'LOCATION': BASE_DIR / 'cache' / 'versiones',
+        'TIMEOUT': None,
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -139,6 +175,18 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Al final de ferreteria/settings.py
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Los archivos subidos se nombran por el hash de su contenido (ver catalogo/storage.py):
+# las imágenes repetidas se guardan una sola vez y su URL nunca cambia de contenido, así
+# que en producción se pueden servir como inmutables. Ejemplo para nginx:
+#     location ~ ^/media/.+/[0-9a-f]{2}/[0-9a-f]{32}\.\w+$ {
+#         add_header Cache-Control "public, max-age=31536000, immutable";
+#     }
+STORAGES = {
+    'default': {'BACKEND': 'catalogo.storage.ContentHashStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
 STATIC_ROOT = os.path.join(BASE_DIR, 'assets')
 
 # --- CONFIGURACIONES PERSONALIZADAS DEL PROYECTO ---
@@ -154,3 +202,62 @@ PRODUCTOS_NOVEDADES_INICIO = 8
 PRODUCTOS_EN_STOCK_INICIO = 8
 SUGERENCIAS_BUSQUEDA_MAX = 10
 SUGERENCIAS_BUSQUEDA_MIN_CHARS = 2
+# Los listados por nombre se paginan por cursor (ver catalogo/paginacion.py) y el
+# total se cuenta hasta este número ("Más de 1000 productos"). 0 = no mostrar el total.
+PAGINACION_CONTAR_HASTA = 1000
+
+# Búsqueda de texto completo
+# Configuración de idioma de PostgreSQL para los tsvector (ignorada en SQLite).
+BUSQUEDA_CONFIG_POSTGRES = 'spanish'
+
+# Búsqueda tolerante a errores (trigramas)
+# Si la búsqueda exacta encuentra menos resultados que esto, se añaden nombres parecidos.
+BUSQUEDA_MIN_RESULTADOS_EXACTOS = 3
+# Fracción mínima de trigramas del término que debe aparecer en el nombre (0 a 1).
+BUSQUEDA_SIMILITUD_MINIMA = 0.5
+BUSQUEDA_MAX_RESULTADOS_APROXIMADOS = 48
+
+# Caché de páginas públicas (inicio y catálogo). Se invalida sola al editar productos
+# o categorías; este tiempo solo limita cuánto vive una entrada que ya nadie pide.
+CACHE_PAGINAS_TIMEOUT = 60 * 60 * 24
+
+# Caché de fragmentos de las tarjetas de producto. La clave incluye la versión de cada
+# tarjeta, así que una edición nunca sirve HTML viejo; esto solo expulsa las que no se usan.
+CACHE_TARJETAS_TIMEOUT = 60 * 60 * 24 * 7
+
+# Variantes de tamaño de las imágenes de producto para `srcset` (ver catalogo/imagenes.py).
+IMAGENES_ANCHOS_VARIANTES = (160, 320, 640, 1200)
+# AVIF pesa ~30% menos que WebP pero tarda bastante más en codificarse. Solo se usa
+# si Pillow se compiló con soporte AVIF.
+IMAGENES_AVIF = False
+
+# Cola de conversión de imágenes en segundo plano (worker: `manage.py procesar_imagenes`).
+IMAGENES_MAX_INTENTOS = 5
+# Un trabajo "procesando" durante más de estos segundos se considera abandonado.
+IMAGENES_TRABAJO_TIMEOUT = 10 * 60
+# Límite de tamaño de las imágenes subidas, en píxeles (ancho x alto). 50 MP deja pasar
+# las fotos de teléfono de 40 MP y rechaza las "bombas de descompresión".
+IMAGENES_MAX_PIXELES = 50_000_000
+# Tamaño a partir del cual el WebP que se está codificando pasa de la RAM a un archivo temporal.
+IMAGENES_SPOOL_MAX = 2 * 1024 * 1024
+
+# Instrumentación de peticiones (ver ferreteria/instrumentacion.py).
+# Envía los tiempos de cada petición en la cabecera `Server-Timing`: 'staff' solo a los
+# usuarios del admin, True a todos (dan pistas de qué es lento a cualquiera), False a nadie.
+INSTRUMENTACION_SERVER_TIMING = 'staff'
+# Dónde vuelca cada proceso sus histogramas por vista, y cada cuántos segundos como mucho.
+INSTRUMENTACION_DIRECTORIO = os.path.join(BASE_DIR, 'metricas')
+INSTRUMENTACION_INTERVALO = 30
+
+# Perfilador por muestreo de las peticiones lentas (ver ferreteria/perfilador.py).
+# Desactivado por defecto; mientras está activo, un hilo mira la pila de cada
+# petición de las vistas de PERFILADOR_NAMESPACES cada PERFILADOR_INTERVALO_MS.
+PERFILADOR_ACTIVO = False
+PERFILADOR_NAMESPACES = ['catalogo']
+PERFILADOR_INTERVALO_MS = 5
+# Se guarda el perfil de las peticiones que tardan más que esto (None: ninguna)...
+PERFILADOR_UMBRAL_MS = 500
+# ...y el de una de cada tantas peticiones (0: ninguna).
+PERFILADOR_CADA = 1000
+PERFILADOR_DIRECTORIO = os.path.join(BASE_DIR, 'perfiles')
+PERFILADOR_MAX_ARCHIVOS = 200
@@ -3,7 +3,11 @@ from django.urls import path, include  # <-- Asegúrate de que 'include' esté i
 from django.conf import settings
 from django.conf.urls.static import static
 
+from ferreteria.instrumentacion import vista_metricas
+
 urlpatterns = [
+    # Histogramas de tiempos por vista (solo staff). Va antes de 'admin/' para que no la capture el admin.
+    path('admin/metricas/', vista_metricas, name='metricas_peticiones'),
     path('admin/', admin.site.urls),
     
     # --- ESTA ES LA LÍNEA QUE SOLUCIONA EL ERROR ---
@@ -15,5 +19,7 @@ urlpatterns = [
 
 # Esto es necesario para que las imágenes de los productos se muestren
 # correctamente mientras desarrollas tu sitio.
+# `servir_media` añade cabeceras de caché inmutable a los archivos nombrados por su hash.
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    from catalogo.storage import servir_media
+    urlpatterns += static(settings.MEDIA_URL, view=servir_media, document_root=settings.MEDIA_ROOT)
\ No newline at end of file